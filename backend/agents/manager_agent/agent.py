@@ -13,17 +13,7 @@ import os
 import json
 import requests
 
-import math
-from datetime import datetime
-from geopy.geocoders import Nominatim
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
+from services import emission_factors, geocoding, movement_engine, trip_segmenter
 
 def process_movements(movements: list[dict]) -> dict:
     """
@@ -38,54 +28,25 @@ def process_movements(movements: list[dict]) -> dict:
       ...
     ]
     """
-    if not movements:
+    if not len(movements):
         return {}
 
-    # 1️⃣ Get country from first point
-    geolocator = Nominatim(user_agent="carbon_app")
-    location = geolocator.reverse(
-        (movements[0]["latitude"], movements[0]["longitude"]), 
-        language="en"
-    )
-    country = location.raw["address"].get("country", "Unknown")
-
-    # 2️⃣ Compute distance and max speed
-    total_distance = 0.0
-    max_speed = 0.0
-
-    # Helper to parse timestamp
-    def parse_time(ts: str):
-        return datetime.strptime(ts, "%B %d, %Y at %I:%M:%S %p UTC-4")
-
-    for i in range(1, len(movements)):
-        p1, p2 = movements[i-1], movements[i]
-
-        # Distance (Haversine)
-        dist = haversine(p1["latitude"], p1["longitude"], p2["latitude"], p2["longitude"])
-        total_distance += dist
-
-        # Speed (prefer provided speed, fallback to calc)
-        if p2["speed_kmh"] and p2["speed_kmh"] > 0:
-            speed = p2["speed_kmh"]
-        else:
-            t1, t2 = parse_time(p1["timestamp"]), parse_time(p2["timestamp"])
-            dt = (t2 - t1).total_seconds() / 3600.0  # hours
-            speed = dist / dt if dt > 0 else 0
-        max_speed = max(max_speed, speed)
-
-    # 3️⃣ Determine transportation mode
-    if max_speed < 6:
-        transport = "walking"
-    elif max_speed < 25:
-        transport = "bicycle"
-    elif max_speed < 200:
-        transport = "car"
-    else:
-        transport = "airplane"
+    # Also accepts movement_engine.MovementColumns, e.g. from user_crud.get_user_movement_columns.
+    # Timestamps are parsed once, for both the summary and the trip segmentation.
+    cols = movement_engine.with_seconds(movement_engine.to_columns(movements))
+
+    # 1️⃣ Get country from first point (offline index, remote geocoder only on a miss)
+    country = geocoding.reverse_country(float(cols.latitude[0]), float(cols.longitude[0])) or "Unknown"
+
+    # 2️⃣ Compute distance in one vectorized pass
+    summary = movement_engine.summarize(cols)
+
+    # 3️⃣ Mode of the trips covering the most distance, so a GPS glitch cannot relabel the trace
+    transportation = trip_segmenter.dominant_mode(trip_segmenter.segment_columns(cols)) or summary["transportation"]
 
     return {
-        "transportation": transport,
-        "distance_km": round(total_distance, 2),
+        "transportation": transportation,
+        "distance_km": summary["distance_km"],
         "country": country
     }
 
@@ -93,6 +54,15 @@ def process_movements(movements: list[dict]) -> dict:
 
 
 
+def estimate_emissions(records: list[dict]) -> list[dict]:
+    """
+    Adds carbon_emission_kg to each Movement/Transaction record from the
+    fixed factor table. Records it cannot classify come back with
+    carbon_emission_kg set to null.
+    """
+    return emission_factors.calculate_emissions(records)
+
+
 # Example usage:
 #result = call_climatiq_from_file("input.json")
 #print(result)
@@ -105,6 +75,7 @@ co2_agent = Agent(
 Your job is to take structured JSON data about an activity (travel, energy use, or purchases) and return an estimated carbon emission in kilograms of CO₂ (carbon_emission_kg).
 
 Rules:
+0. First call the estimate_emissions tool with the records. Keep every carbon_emission_kg it returns; only estimate the records where it is null.
 1. Always return valid JSON with the original input plus the new key "carbon_emission_kg".
 2. Base your estimates on widely known emission factors:
    - Flights: ~0.25 kg CO₂ per passenger-km (short-haul), ~0.15 kg CO₂ per passenger-km (long-haul).
@@ -139,6 +110,7 @@ Example output:
 }
 
     """,
+    tools = [estimate_emissions],
 )
 
 class Transaction(BaseModel):
@@ -0,0 +1,60 @@
+"""
+Benchmark the local emission factor table on a batch of records.
+
+Usage (from backend/):
+  python -m benchmarks.bench_emission_factors [--records 1000000] [--unknown-share 0.01]
+
+Half the records are movements and half transactions; --unknown-share of
+them use a mode or category the table does not know, i.e. the records
+that would still go to the co2_agent.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from services.emission_factors import calculate_emissions
+
+MODES = ["walking", "bicycle", "car", "bus", "train", "airplane"]
+CATEGORIES = ["Groceries", "Dining", "Transportation", "Entertainment", "Shopping", "Healthcare", "Bills & Utilities"]
+
+
+def make_records(n: int, unknown_share: float, seed: int = 42) -> list[dict]:
+    rng = random.Random(seed)
+    records = []
+    for i in range(n):
+        unknown = rng.random() < unknown_share
+        if i % 2:
+            records.append({
+                "transportation": "hovercraft" if unknown else rng.choice(MODES),
+                "distance_km": round(rng.uniform(0.1, 5000), 2),
+                "country": "United States",
+            })
+        else:
+            records.append({
+                "date": "2025-09-27",
+                "amount": round(rng.uniform(1, 200), 2),
+                "merchant_name": f"merchant{i % 1000}",
+                "category": ["Crypto"] if unknown else [rng.choice(CATEGORIES)],
+            })
+    return records
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the emission factor table")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--unknown-share", type=float, default=0.01)
+    args = parser.parse_args()
+
+    records = make_records(args.records, args.unknown_share)
+    start = time.perf_counter()
+    results = calculate_emissions(records)
+    elapsed = time.perf_counter() - start
+    unclassified = sum(1 for r in results if r["carbon_emission_kg"] is None)
+    print(f"{len(results):,} records in {elapsed:.2f} s ({elapsed / len(results) * 1e6:.2f} us/record)")
+    print(f"{unclassified:,} unclassified records would go to the co2_agent")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Benchmark the offline country index (single and bulk lookups).
+
+Usage (from backend/):
+  python -m benchmarks.bench_geocoding [--points 100000]
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+import numpy as np
+
+from services import geocoding
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark offline reverse geocoding")
+    parser.add_argument("--points", type=int, default=100_000)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = geocoding.get_country_index()
+    print(f"index build: {(time.perf_counter() - start) * 1000:.1f} ms, {len(index.names)} countries")
+
+    rng = np.random.default_rng(42)
+    lats = rng.uniform(-60, 70, args.points)
+    lons = rng.uniform(-180, 180, args.points)
+
+    start = time.perf_counter()
+    single = [index.lookup(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    single_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk = index.lookup_many(lats, lons)
+    bulk_s = time.perf_counter() - start
+
+    hits = sum(name is not None for name in single)
+    print(f"single: {single_s / args.points * 1e6:.2f} us/point")
+    print(f"bulk:   {bulk_s / args.points * 1e6:.2f} us/point")
+    print(f"hits: {hits}/{args.points} (misses go to the remote geocoder), bulk matches single: {single == bulk}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the sorted leaderboard index against sorting every user per request.
+
+Usage (from backend/):
+  python -m benchmarks.bench_leaderboard [--users 1000000] [--queries 1000]
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import time
+
+from services.leaderboard import Leaderboard
+
+COUNTRIES = ["Brazil", "Canada", "France", "Germany", "India", "Japan", "Mexico", "Nigeria", "Spain", "United States"]
+
+
+def make_users(n: int, seed: int = 42) -> dict:
+    rng = random.Random(seed)
+    return {
+        f"user{i:07d}": {
+            "name": f"User {i}",
+            "country": rng.choice(COUNTRIES),
+            "transportation": rng.choice(["walking", "bicycle", "car"]),
+            "pfp": rng.randrange(6),
+            "carbonEmission": round(rng.uniform(0, 500), 2),
+        }
+        for i in range(n)
+    }
+
+
+def naive_top(users: dict, k: int, country: str | None = None) -> list[str]:
+    rows = [(u["carbonEmission"], uid) for uid, u in users.items() if country is None or u["country"] == country]
+    rows.sort()
+    return [uid for _, uid in rows[:k]]
+
+
+def timed(label: str, fn, repeat: int) -> None:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {elapsed / repeat * 1e6:>12.1f} us/op")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the leaderboard index")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    users = make_users(args.users)
+    ids = list(users)
+    rng = random.Random(7)
+
+    board = Leaderboard()
+    start = time.perf_counter()
+    board.load(users.items())
+    print(f"load: {time.perf_counter() - start:.2f} s for {len(board)} users")
+
+    timed("top 10", lambda: board.top(10), args.queries)
+    timed("top 10 (country)", lambda: board.top(10, "Japan"), args.queries)
+    timed("rank", lambda: board.rank(rng.choice(ids)), args.queries)
+    timed("rank (country)", lambda: board.rank(rng.choice(ids), users[rng.choice(ids)]["country"]), args.queries)
+
+    def increment():
+        user_id, amount = rng.choice(ids), rng.uniform(0, 5)
+        board.apply_write(user_id, "increment", {"carbonEmission": amount})
+        users[user_id]["carbonEmission"] += amount
+
+    timed("increment carbonEmission", increment, args.queries)
+
+    # The naive path re-sorts the whole collection on every request.
+    naive_repeat = max(1, min(5, args.queries))
+    timed("naive top 10 (full sort)", lambda: naive_top(users, 10), naive_repeat)
+    timed("naive top 10 (country)", lambda: naive_top(users, 10, "Japan"), naive_repeat)
+
+    same = [e["user_id"] for e in board.top(10)] == naive_top(users, 10)
+    same_country = [e["user_id"] for e in board.top(10, "Japan")] == naive_top(users, 10, "Japan")
+    print(f"matches full sort: {same}, country: {same_country}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Load test for the Pub/Sub -> agent -> FCM listener pipeline.
+
+Publishes synthetic notification events to the Pub/Sub emulator and runs
+the listener pipeline against them, with a stubbed agent (fixed latency)
+and a local stub of the FCM v1 send endpoint (fixed latency, optional
+injected 503s and unregistered tokens). Reports throughput, end-to-end
+latency (publish -> FCM), ack latency (publish -> ack), nacks and
+redeliveries.
+
+Usage (from backend/, with the emulator running):
+  gcloud beta emulators pubsub start --project=bench-project
+  export PUBSUB_EMULATOR_HOST=localhost:8085
+  python -m benchmarks.bench_listener --messages 20000 --mix saved=0.6,summary=0.2,unique=0.15,dead=0.05
+
+Messages enter through pubsub_listener.handle_message, routed to a
+pipeline sized by the flags. --direct skips Pub/Sub and feeds messages
+straight into handle_message (nacked messages are redelivered after
+--redelivery-delay), to tell pipeline cost apart from emulator cost.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from uuid import uuid4
+
+import numpy as np
+
+import pubsub_listener
+from services.agent_invoker import AgentInvoker, AsyncLoopThread
+from services.event_publisher import EventPublisher, encode_event
+
+SAVED_KG = [0.5, 1.0, 1.5, 2.0, 2.5]
+SUMMARIES = [f"You walked {n} km instead of driving this week" for n in range(1, 11)]
+
+
+class Tracker:
+    """Per-message timestamps and delivery counts, keyed by sequence number."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.published = np.zeros(total)
+        self.delivered = np.full(total, np.nan)
+        self.acked = np.full(total, np.nan)
+        self.deliveries = Counter()
+        self.nacks = 0
+        self._lock = threading.Lock()
+        self._acked_count = 0
+        self.all_acked = threading.Event()
+
+    def on_delivery(self, seq: int) -> None:
+        with self._lock:
+            self.deliveries[seq] += 1
+
+    def on_fcm(self, seq: int) -> None:
+        self.delivered[seq] = time.perf_counter()
+
+    def on_ack(self, seq: int) -> None:
+        with self._lock:
+            if np.isnan(self.acked[seq]):
+                self.acked[seq] = time.perf_counter()
+                self._acked_count += 1
+                if self._acked_count == self.total:
+                    self.all_acked.set()
+
+    def on_nack(self, seq: int) -> None:
+        with self._lock:
+            self.nacks += 1
+
+
+class TrackedMessage:
+    """Wraps a Pub/Sub message so acks and nacks are recorded."""
+
+    def __init__(self, message, seq: int, tracker: Tracker, on_nack=None):
+        self._message = message
+        self._seq = seq
+        self._tracker = tracker
+        self._on_nack = on_nack
+        self.data = message.data
+        self.attributes = message.attributes
+        self.message_id = message.message_id
+
+    def ack(self) -> None:
+        self._tracker.on_ack(self._seq)
+        self._message.ack()
+
+    def nack(self) -> None:
+        self._tracker.on_nack(self._seq)
+        self._message.nack()
+        if self._on_nack is not None:
+            self._on_nack(self._message)
+
+
+class DirectMessage:
+    """Stand-in for a received message in --direct mode."""
+
+    def __init__(self, event: dict, seq: int):
+        self.data, attributes = encode_event(event)
+        self.message_id = str(seq)
+        self.attributes = {"seq": str(seq), **attributes}
+
+    def ack(self) -> None:
+        pass
+
+    def nack(self) -> None:
+        pass
+
+
+def start_stub_fcm(tracker: Tracker, latency: float, error_rate: float, seed: int = 1):
+    """Serve POST /v1/projects/*/messages:send like FCM; returns (server, counters)."""
+    rng = random.Random(seed)
+    counters = Counter()
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            token = body["message"]["token"]
+            time.sleep(latency)
+            with lock:
+                counters["requests"] += 1
+                fail = rng.random() < error_rate
+            if token.endswith("-dead"):
+                counters["unregistered"] += 1
+                self._reply(404, {"error": {"code": 404, "message": "Requested entity was not found.",
+                                            "status": "NOT_FOUND", "details": [{
+                                                "@type": "type.googleapis.com/google.firebase.fcm.v1.FcmError",
+                                                "errorCode": "UNREGISTERED"}]}})
+            elif fail:
+                counters["unavailable"] += 1
+                self._reply(503, {"error": {"code": 503, "message": "injected", "status": "UNAVAILABLE"}})
+            else:
+                tracker.on_fcm(int(token.split("-")[1]))
+                self._reply(200, {"name": f"projects/bench/messages/{uuid4().hex}"})
+
+        def _reply(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-fcm", daemon=True).start()
+    return server, counters
+
+
+def init_stub_firebase(port: int, project: str) -> None:
+    """Point firebase_admin.messaging at the stub endpoint with anonymous credentials."""
+    import firebase_admin
+    import google.auth.credentials
+    from firebase_admin import credentials, messaging
+
+    class AnonymousCredential(credentials.Base):
+        def get_credential(self):
+            return google.auth.credentials.AnonymousCredentials()
+
+    messaging._MessagingService.FCM_URL = f"http://127.0.0.1:{port}/v1/projects/{{0}}/messages:send"
+    firebase_admin.initialize_app(AnonymousCredential(), {"projectId": project})
+
+
+def stub_agent(latency: float) -> AgentInvoker:
+    async def run(payload: dict) -> dict:
+        await asyncio.sleep(latency)
+        event = payload.get("event") or {}
+        if "saved_kg" in event:
+            return {"text": f"{payload['user_name']}, you saved {event['saved_kg']} kg CO2 today!"}
+        return {"text": f"{payload['user_name']}: {event.get('summary')}"}
+
+    return AgentInvoker("bench", "run", run, AsyncLoopThread())
+
+
+def parse_mix(spec: str) -> tuple[list[str], list[float]]:
+    kinds, weights = [], []
+    for part in spec.split(","):
+        kind, weight = part.split("=")
+        if kind not in ("saved", "summary", "unique", "dead"):
+            raise SystemExit(f"Unknown payload kind {kind!r}; use saved, summary, unique or dead")
+        kinds.append(kind)
+        weights.append(float(weight))
+    return kinds, weights
+
+
+def make_payloads(n: int, mix: str, seed: int = 42) -> list[dict]:
+    kinds, weights = parse_mix(mix)
+    rng = random.Random(seed)
+    payloads = []
+    for seq, kind in enumerate(rng.choices(kinds, weights, k=n)):
+        if kind == "summary":
+            event = {"summary": rng.choice(SUMMARIES)}
+        elif kind == "unique":
+            event = {"saved_kg": round(rng.uniform(0, 100), 3), "trip": seq}
+        else:
+            event = {"saved_kg": rng.choice(SAVED_KG)}
+        payloads.append({
+            "fcm_token": f"bench-{seq}" + ("-dead" if kind == "dead" else ""),
+            "title": "Daily Carbon Summary",
+            "user_name": f"user{seq % 1000}",
+            "event": event,
+        })
+    return payloads
+
+
+def pct_ms(values: np.ndarray) -> str:
+    values = values[~np.isnan(values)] * 1000
+    if not len(values):
+        return "n/a"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return f"p50 {p50:.1f} ms, p95 {p95:.1f} ms, p99 {p99:.1f} ms, max {values.max():.1f} ms"
+
+
+def publish_emulator(args, payloads, tracker, callback):
+    from google.cloud import pubsub_v1
+
+    if not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        raise SystemExit("Set PUBSUB_EMULATOR_HOST (or pass --direct) to run the benchmark")
+
+    subscriber = pubsub_v1.SubscriberClient()
+    run_id = uuid4().hex[:8]
+    topic = pubsub_v1.PublisherClient.topic_path(args.project, f"bench-{run_id}")
+    subscription = subscriber.subscription_path(args.project, f"bench-{run_id}")
+    publisher = EventPublisher(topic)
+    publisher.client.create_topic(name=topic)
+    subscriber.create_subscription(name=subscription, topic=topic, ack_deadline_seconds=60)
+
+    def tracked(message):
+        seq = int(message.attributes["seq"])
+        tracker.on_delivery(seq)
+        callback(TrackedMessage(message, seq, tracker))
+
+    future = pubsub_listener.subscribe(
+        subscriber, subscription, tracked, args.max_messages,
+        pubsub_listener.MAX_BYTES, args.callback_workers,
+    )
+    start = time.perf_counter()
+    for seq, event in enumerate(payloads):
+        _pace(args.rate, seq, start)
+        tracker.published[seq] = time.perf_counter()
+        publisher.publish(event, seq=str(seq))
+    publisher.flush()
+    published_s = time.perf_counter() - start
+
+    def cleanup():
+        future.cancel()
+        subscriber.delete_subscription(subscription=subscription)
+        publisher.client.delete_topic(topic=topic)
+        publisher.close()
+        subscriber.close()
+
+    return published_s, cleanup
+
+
+def publish_direct(args, payloads, tracker, callback):
+    def deliver(message: DirectMessage) -> None:
+        seq = int(message.attributes["seq"])
+        tracker.on_delivery(seq)
+        callback(TrackedMessage(message, seq, tracker, on_nack=redeliver))
+
+    def redeliver(message: DirectMessage) -> None:
+        threading.Timer(args.redelivery_delay, deliver, args=(message,)).start()
+
+    start = time.perf_counter()
+    for seq, event in enumerate(payloads):
+        _pace(args.rate, seq, start)
+        tracker.published[seq] = time.perf_counter()
+        deliver(DirectMessage(event, seq))
+    return time.perf_counter() - start, lambda: None
+
+
+def _pace(rate: float, seq: int, start: float) -> None:
+    if rate > 0:
+        delay = start + seq / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Pub/Sub -> agent -> FCM listener")
+    parser.add_argument("--messages", type=int, default=10_000)
+    parser.add_argument("--mix", default="saved=0.6,summary=0.2,unique=0.15,dead=0.05",
+                        help="Payload kinds and weights: saved, summary, unique, dead")
+    parser.add_argument("--rate", type=float, default=0, help="Publish rate in msg/s (0 = as fast as possible)")
+    parser.add_argument("--agent-latency-ms", type=float, default=300)
+    parser.add_argument("--fcm-latency-ms", type=float, default=20)
+    parser.add_argument("--fcm-error-rate", type=float, default=0.01, help="Fraction of sends answered with 503")
+    parser.add_argument("--max-messages", type=int, default=pubsub_listener.MAX_MESSAGES)
+    parser.add_argument("--callback-workers", type=int, default=pubsub_listener.CALLBACK_WORKERS)
+    parser.add_argument("--agent-workers", type=int, default=pubsub_listener.AGENT_WORKERS)
+    parser.add_argument("--fcm-workers", type=int, default=pubsub_listener.FCM_WORKERS)
+    parser.add_argument("--fcm-batch-size", type=int, default=pubsub_listener.FCM_BATCH_SIZE)
+    parser.add_argument("--fcm-batch-wait-ms", type=float, default=pubsub_listener.FCM_BATCH_WAIT_MS)
+    parser.add_argument("--direct", action="store_true", help="Bypass Pub/Sub and call handle_message directly")
+    parser.add_argument("--redelivery-delay", type=float, default=0.1, help="--direct only: delay before a nacked message comes back")
+    parser.add_argument("--project", default="bench-project")
+    parser.add_argument("--timeout", type=float, default=600)
+    args = parser.parse_args()
+
+    logging.getLogger("pubsub_listener").setLevel(logging.ERROR)
+    logging.getLogger("services").setLevel(logging.ERROR)
+    logging.getLogger("urllib3").setLevel(logging.ERROR)
+
+    payloads = make_payloads(args.messages, args.mix)
+    tracker = Tracker(args.messages)
+    server, fcm_counters = start_stub_fcm(tracker, args.fcm_latency_ms / 1000, args.fcm_error_rate)
+    init_stub_firebase(server.server_address[1], args.project)
+    pubsub_listener.set_agent_invoker(stub_agent(args.agent_latency_ms / 1000))
+    dead_letters: list = []
+    pipeline = pubsub_listener.NotificationPipeline(
+        False, args.agent_workers, args.fcm_workers, queue_size=args.max_messages,
+        fcm_batch_size=args.fcm_batch_size, fcm_batch_wait_ms=args.fcm_batch_wait_ms,
+        dead_letter=dead_letters.append,
+    ).start()
+    pubsub_listener.set_pipeline(pipeline)
+
+    publish = publish_direct if args.direct else publish_emulator
+    start = time.perf_counter()
+    published_s, cleanup = publish(args, payloads, tracker, pubsub_listener.handle_message)
+    finished = tracker.all_acked.wait(args.timeout)
+    elapsed = time.perf_counter() - start
+    pipeline.stop()
+    pubsub_listener.set_pipeline(None)
+    cleanup()
+    server.shutdown()
+
+    acked = int((~np.isnan(tracker.acked)).sum())
+    redelivered = sum(1 for count in tracker.deliveries.values() if count > 1)
+    extra = sum(count - 1 for count in tracker.deliveries.values())
+    print(f"mode: {'direct' if args.direct else 'pubsub emulator'}, mix: {args.mix}")
+    print(f"published {args.messages} in {published_s:.2f} s ({args.messages / published_s:,.0f} msg/s)")
+    print(f"acked {acked}/{args.messages} in {elapsed:.2f} s -> {acked / elapsed:,.0f} msg/s"
+          + ("" if finished else f" (timed out after {args.timeout:.0f} s)"))
+    print(f"end-to-end (publish -> FCM): {pct_ms(tracker.delivered - tracker.published)}")
+    print(f"ack latency (publish -> ack): {pct_ms(tracker.acked - tracker.published)}")
+    print(f"nacks: {tracker.nacks}, redelivered messages: {redelivered} ({extra} extra deliveries)")
+    print(f"dead-lettered: {len(dead_letters)}")
+    print(f"stub FCM: {dict(fcm_counters)}")
+    print(f"pipeline: {json.dumps(pipeline.stats(), indent=2, default=str)}")
+
+
+if __name__ == "__main__":
+    main()
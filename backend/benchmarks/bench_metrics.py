@@ -0,0 +1,50 @@
+"""
+Measure the per-event cost of the Prometheus instrumentation.
+
+Usage (from backend/):
+  python -m benchmarks.bench_metrics [--events 1000000]
+
+Times the operations the listener and user_crud do per event: a counter
+increment through labels(), a histogram observe on a resolved child, and
+a call through the timed_call decorator, each against a bare loop.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from services import metrics
+
+
+def per_call_us(fn, n: int) -> float:
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark Prometheus instrumentation overhead")
+    parser.add_argument("--events", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.events
+
+    def noop():
+        return None
+
+    timed_noop = metrics.timed_call(metrics.USER_CRUD_SECONDS, "bench_noop")(noop)
+    child = metrics.AGENT_INVOCATION_SECONDS.labels("ok")
+
+    baseline = per_call_us(noop, n)
+    cases = {
+        "counter labels().inc()": lambda: metrics.LISTENER_MESSAGES.labels("ack", "sent").inc(),
+        "histogram child.observe()": lambda: child.observe(0.2),
+        "timed_call(noop)": timed_noop,
+    }
+    print(f"bare call: {baseline:.2f} us")
+    for name, fn in cases.items():
+        print(f"{name}: {per_call_us(fn, n) - baseline:.2f} us overhead per event")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark the chunked movement format against one document per GPS fix.
+
+Usage (from backend/):
+  python -m benchmarks.bench_movement_chunks [--hours 24] [--hz 1]
+
+Simulates a day of 1 Hz fixes with GPS noise and reports documents and
+stored bytes per user-day for both layouts, plus encode/decode speed.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import random
+import time
+
+import numpy as np
+
+from database import movement_codec
+from services import movement_engine
+
+
+def make_trace(hours: float, hz: float, seed: int = 42) -> list[dict]:
+    rng = random.Random(seed)
+    n = int(hours * 3600 * hz)
+    lat, lon, heading, speed = 25.7555917, -80.37272, 0.0, 0.0
+    start_ms = 1_759_000_000_000
+    points = []
+    for i in range(n):
+        speed = max(0.0, min(35.0, speed + rng.gauss(0, 0.5)))
+        heading += rng.gauss(0, 0.05)
+        step_km = speed / hz / 1000
+        lat += step_km / 111.32 * math.cos(heading) + rng.gauss(0, 2e-6)
+        lon += step_km / (111.32 * math.cos(math.radians(lat))) * math.sin(heading) + rng.gauss(0, 2e-6)
+        points.append({
+            "speed_mps": speed,
+            "speed_kmh": speed * 3.6,
+            "latitude": lat,
+            "longitude": lon,
+            "timestamp": movement_codec.format_timestamp(start_ms + int(i * 1000 / hz) + rng.randint(0, 50), False),
+        })
+    return points
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark chunked movement storage")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--hz", type=float, default=1)
+    args = parser.parse_args()
+
+    points = make_trace(args.hours, args.hz)
+    # Firestore bills a document's field names and values; JSON length is a close proxy.
+    per_point_bytes = sum(len(json.dumps(p)) for p in points)
+
+    start = time.perf_counter()
+    windows = movement_codec.split_windows(movement_codec.quantize(points))
+    docs = {start_ms: movement_codec.encode_chunk(chunk, start_ms) for start_ms, chunk in windows.items()}
+    encode_s = time.perf_counter() - start
+    chunk_bytes = sum(len(d["data"]) + 120 for d in docs.values())
+
+    start = time.perf_counter()
+    chunks = [movement_codec.decode_chunk(d) for d in docs.values()]
+    decode_s = time.perf_counter() - start
+
+    print(f"{len(points):,} points over {args.hours:g} h at {args.hz:g} Hz")
+    print(f"per-point documents: {len(points):,} docs, {per_point_bytes / 1e6:.2f} MB")
+    print(f"chunks:              {len(docs):,} docs, {chunk_bytes / 1e6:.3f} MB "
+          f"({chunk_bytes / len(points):.1f} bytes/point, {per_point_bytes / chunk_bytes:.0f}x smaller)")
+    print(f"encode {encode_s * 1e3:.1f} ms, decode to arrays {decode_s * 1e3:.1f} ms")
+
+    start = time.perf_counter()
+    movement_engine.summarize(points)
+    dict_s = time.perf_counter() - start
+    start = time.perf_counter()
+    cols = movement_engine.MovementColumns(
+        np.concatenate([c.latitude for c in chunks]),
+        np.concatenate([c.longitude for c in chunks]),
+        np.concatenate([c.speed_mps * 3.6 for c in chunks]),
+        [],
+        np.concatenate([c.seconds for c in chunks]),
+    )
+    movement_engine.summarize(cols)
+    cols_s = time.perf_counter() - start
+    print(f"summarize: {dict_s * 1e3:.1f} ms from dicts, {(decode_s + cols_s) * 1e3:.1f} ms from chunks (incl. decode)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Benchmark process_movements against the old per-pair loop.
+
+Usage (from backend/):
+  python -m benchmarks.bench_process_movements [--sizes 1000 100000 1000000]
+
+Times the agent tool end to end (column conversion, timestamp parsing,
+summary and trip segmentation) next to movement_engine.summarize() alone,
+and exits with an error if process_movements is not faster than the loop.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from agents.manager_agent import agent
+from services import movement_engine
+
+# The console format the old loop parsed, zone included literally.
+LEGACY_FORMAT = "%B %d, %Y at %I:%M:%S %p UTC-4"
+
+
+def legacy_summary(movements: list[dict]) -> dict:
+    """The pure-Python loop process_movements used before the NumPy engine."""
+    def haversine(lat1, lon1, lat2, lon2):
+        dlat = math.radians(lat2 - lat1)
+        dlon = math.radians(lon2 - lon1)
+        a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
+        return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+
+    def parse_time(ts: str):
+        return datetime.strptime(ts, LEGACY_FORMAT)
+
+    total_distance = 0.0
+    max_speed = 0.0
+    for i in range(1, len(movements)):
+        p1, p2 = movements[i-1], movements[i]
+        dist = haversine(p1["latitude"], p1["longitude"], p2["latitude"], p2["longitude"])
+        total_distance += dist
+        if p2["speed_kmh"] and p2["speed_kmh"] > 0:
+            speed = p2["speed_kmh"]
+        else:
+            dt = (parse_time(p2["timestamp"]) - parse_time(p1["timestamp"])).total_seconds() / 3600.0
+            speed = dist / dt if dt > 0 else 0
+        max_speed = max(max_speed, speed)
+
+    return {
+        "transportation": movement_engine.classify_speed(max_speed),
+        "distance_km": round(total_distance, 2),
+    }
+
+
+def make_trace(n: int, missing_speed_ratio: float = 0.2, seed: int = 42) -> list[dict]:
+    """Random walk around Miami, one fix every 5 seconds."""
+    rng = random.Random(seed)
+    lat, lon = 25.7555917, -80.37272
+    start = datetime(2025, 9, 27, 22, 41, 42)
+    points = []
+    for i in range(n):
+        lat += rng.uniform(-1e-4, 1e-4)
+        lon += rng.uniform(-1e-4, 1e-4)
+        speed = 0 if rng.random() < missing_speed_ratio else rng.uniform(0, 60)
+        points.append({
+            "latitude": lat,
+            "longitude": lon,
+            "speed_kmh": speed,
+            "speed_mps": speed / 3.6,
+            "timestamp": (start + timedelta(seconds=5 * i)).strftime(LEGACY_FORMAT),
+        })
+    return points
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark process_movements engines")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1_000, 100_000, 1_000_000])
+    parser.add_argument("--missing-speed-ratio", type=float, default=0.2,
+                        help="Fraction of points without a reported speed (forces timestamp parsing)")
+    args = parser.parse_args()
+
+    agent.process_movements(make_trace(10))  # warm up NumPy and the country index before timing
+
+    print(f"{'points':>10} {'loop (s)':>10} {'summarize':>10} {'process':>10} {'speedup':>8}  match")
+    slower = []
+    for n in args.sizes:
+        trace = make_trace(n, args.missing_speed_ratio)
+        expected, loop_s = timed(legacy_summary, trace)
+        summary, summarize_s = timed(movement_engine.summarize, trace)
+        actual, process_s = timed(agent.process_movements, trace)
+        # The mode may differ on purpose (trip segmentation); the distance may not.
+        match = expected["distance_km"] == summary["distance_km"] == actual["distance_km"]
+        print(f"{n:>10} {loop_s:>10.4f} {summarize_s:>10.4f} {process_s:>10.4f} "
+              f"{loop_s / process_s:>7.1f}x  {match}")
+        if process_s >= loop_s:
+            slower.append(n)
+    if slower:
+        raise SystemExit(f"process_movements is slower than the legacy loop at {slower} points")
+
+
+if __name__ == "__main__":
+    main()
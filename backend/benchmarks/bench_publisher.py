@@ -0,0 +1,83 @@
+"""
+Benchmark the batched EventPublisher against one blocking publish per event.
+
+Usage (from backend/, with the Pub/Sub emulator running):
+  export PUBSUB_EMULATOR_HOST=localhost:8085
+  python -m benchmarks.bench_publisher --events 1000000 [--ordering] [--detail-bytes 4000]
+
+--baseline N also times the old publish_test.py pattern
+(publisher.publish(...).result() per event) for N events.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import time
+from uuid import uuid4
+
+from google.cloud import pubsub_v1
+
+from services.event_publisher import EventPublisher
+
+
+def make_event(i: int, detail_bytes: int, rng: random.Random) -> dict:
+    event = {
+        "fcm_token": f"token-{i}",
+        "title": "Daily Carbon Summary",
+        "user_name": f"user{i % 50_000}",
+        "event": {"saved_kg": round(rng.uniform(0, 5), 2), "summary": "Nightly summary"},
+    }
+    if detail_bytes:
+        # Large, compressible breakdowns like per-trip summaries.
+        event["event"]["trips"] = [{"mode": "car", "km": 3.2, "kg": 0.38}] * (detail_bytes // 36)
+    return event
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark batched Pub/Sub publishing")
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=50_000, help="Distinct ordering keys with --ordering")
+    parser.add_argument("--ordering", action="store_true", help="Use the user id as ordering key")
+    parser.add_argument("--detail-bytes", type=int, default=0, help="Extra payload per event (compressed if large)")
+    parser.add_argument("--baseline", type=int, default=0, help="Also time N blocking publishes")
+    parser.add_argument("--project", default="bench-project")
+    args = parser.parse_args()
+
+    if not os.environ.get("PUBSUB_EMULATOR_HOST"):
+        raise SystemExit("Set PUBSUB_EMULATOR_HOST to run the benchmark against the emulator")
+
+    topic = pubsub_v1.PublisherClient.topic_path(args.project, f"bench-publish-{uuid4().hex[:8]}")
+    publisher = EventPublisher(topic, ordering=args.ordering)
+    publisher.client.create_topic(name=topic)
+    rng = random.Random(42)
+    events = [make_event(i, args.detail_bytes, rng) for i in range(args.events)]
+    raw_bytes = sum(len(json.dumps(e, separators=(",", ":"))) for e in events)
+
+    try:
+        if args.baseline:
+            client = pubsub_v1.PublisherClient()
+            start = time.perf_counter()
+            for event in events[: args.baseline]:
+                client.publish(topic, json.dumps(event).encode("utf-8")).result()
+            baseline_s = time.perf_counter() - start
+            print(f"blocking publish: {args.baseline / baseline_s:,.0f} events/s")
+
+        start = time.perf_counter()
+        key = (lambda e: e["user_name"]) if args.ordering else None
+        stats = publisher.publish_many(events, ordering_key=key)
+        elapsed = time.perf_counter() - start
+        print(f"EventPublisher: {stats['published']:,} events in {elapsed:.1f} s "
+              f"({stats['published'] / elapsed:,.0f} events/s), failed {stats['failed']}")
+        print(f"payload: {raw_bytes / 1e6:.1f} MB raw, {stats['sent_bytes'] / 1e6:.1f} MB sent, "
+              f"{stats['compressed']:,} events compressed")
+        if args.baseline:
+            print(f"speedup vs blocking publish: {(stats['published'] / elapsed) / (args.baseline / baseline_s):.0f}x")
+    finally:
+        publisher.client.delete_topic(topic=topic)
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark timestamp parsing, per point.
+
+Usage (from backend/):
+  python -m benchmarks.bench_timestamps [--points 100000]
+
+Compares the datetime.strptime call process_movements used to make per
+point with services.timestamps, one value at a time (to_seconds) and a
+whole column at once (to_epoch_seconds), for each timestamp shape.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from datetime import datetime, timedelta, timezone
+
+from services import timestamps
+
+LEGACY_STRPTIME = "%B %d, %Y at %I:%M:%S %p UTC-4"
+
+
+def per_point_ns(fn, values) -> float:
+    start = time.perf_counter()
+    fn(values)
+    return (time.perf_counter() - start) / len(values) * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark timestamp parsing")
+    parser.add_argument("--points", type=int, default=100_000)
+    args = parser.parse_args()
+
+    start = datetime(2025, 9, 27, 22, 41, 42, 123456)
+    times = [start + timedelta(seconds=i, microseconds=i * 37 % 1000) for i in range(args.points)]
+    columns = {
+        "iso naive (app)": [t.isoformat() for t in times],
+        "iso Z (app, UTC)": [t.isoformat() + "Z" for t in times],
+        "iso +00:00 (chunks)": [t.isoformat() + "+00:00" for t in times],
+        "legacy console": [t.strftime("%B %d, %Y at %I:%M:%S %p UTC-4") for t in times],
+        "firestore datetime": [t.replace(tzinfo=timezone.utc) for t in times],
+    }
+
+    print(f"{'shape':>22} {'strptime':>10} {'to_seconds':>11} {'column':>8}   ns/point")
+    for name, values in columns.items():
+        strptime = (
+            f"{per_point_ns(lambda vs: [datetime.strptime(v, LEGACY_STRPTIME) for v in vs], values):10.0f}"
+            if name == "legacy console" else f"{'-':>10}"
+        )
+        scalar = per_point_ns(lambda vs: [timestamps.to_seconds(v) for v in vs], values)
+        column = per_point_ns(timestamps.to_epoch_seconds, values)
+        print(f"{name:>22} {strptime} {scalar:11.0f} {column:8.0f}")
+
+
+if __name__ == "__main__":
+    main()
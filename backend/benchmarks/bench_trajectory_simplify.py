@@ -0,0 +1,49 @@
+"""
+Benchmark on-ingest trajectory simplification.
+
+Usage (from backend/):
+  python -m benchmarks.bench_trajectory_simplify [--hours 24] [--hz 1] [--tolerance-m 5]
+
+Simplifies the simulated trace from bench_movement_chunks (quantized the
+way add_user_movements stores it) and reports the point reduction, the
+distance error against its guaranteed bound, whether the summary
+(transportation, max speed) is unchanged, and points per second.
+"""
+from __future__ import annotations
+
+import argparse
+import time
+
+from benchmarks.bench_movement_chunks import make_trace
+from database import movement_codec
+from services import movement_engine, trajectory
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark trajectory simplification")
+    parser.add_argument("--hours", type=float, default=24)
+    parser.add_argument("--hz", type=float, default=1)
+    parser.add_argument("--tolerance-m", type=float, default=trajectory.MOVEMENT_SIMPLIFY_TOLERANCE_M)
+    args = parser.parse_args()
+
+    points = movement_codec.quantize(make_trace(args.hours, args.hz))
+    cols = points.columns()
+
+    start = time.perf_counter()
+    result = trajectory.simplify(cols, args.tolerance_m)
+    elapsed = time.perf_counter() - start
+
+    before = movement_engine.summarize(cols)
+    after = movement_engine.summarize(points.select(result.keep).columns())
+    error_m = (result.distance_km - result.simplified_km) * 1000
+
+    print(f"points: {len(points):,} -> {result.kept:,} ({len(points) / result.kept:.1f}x fewer)")
+    print(f"distance: {result.distance_km:.3f} km -> {result.simplified_km:.3f} km "
+          f"(error {error_m:.1f} m, bound {result.max_error_km * 1000:.1f} m)")
+    print(f"summary before: {before}")
+    print(f"summary after:  {after}")
+    print(f"simplify: {elapsed * 1000:.1f} ms ({len(points) / elapsed / 1e6:.2f} M points/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Benchmark the streaming trip segmenter on a simulated day.
+
+Usage (from backend/):
+  python -m benchmarks.bench_trip_segmenter [--hz 1]
+
+Generates a day of fixes (stops with GPS jitter, a walk, a drive with one
+1500 km/h glitch, a phone-off gap), prints the segments TripSegmenter
+emits next to the single label summarize() gives the whole trace, and
+reports throughput and peak memory when the points are streamed from a
+generator instead of held in a list.
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+from services import movement_engine, trip_segmenter
+
+# (activity, minutes, speed km/h); "gap" means no fixes at all.
+DAY = (
+    ("stop", 120, 0), ("move", 15, 5), ("stop", 10, 0), ("move", 30, 50),
+    ("stop", 480, 0), ("gap", 30, 0), ("move", 20, 5), ("move", 25, 18), ("stop", 180, 0),
+)
+
+
+def iter_day(hz: float, seed: int = 7):
+    rng = random.Random(seed)
+    lat, lon = 25.7555917, -80.37272
+    t = datetime(2025, 9, 27, 6, 0, tzinfo=timezone.utc)
+    step = timedelta(seconds=1 / hz)
+    heading = 0.0
+    glitched = False
+    for activity, minutes, speed in DAY:
+        n = int(minutes * 60 * hz)
+        if activity == "gap":
+            t += step * n
+            continue
+        for _ in range(n):
+            heading += rng.gauss(0, 0.02)
+            km = speed / 3600 / hz
+            lat += km / 111.32 * math.cos(heading)
+            lon += km / (111.32 * math.cos(math.radians(lat))) * math.sin(heading)
+            reported = speed
+            if speed == 50 and not glitched:
+                reported, glitched = 1500, True
+            t += step
+            yield {
+                "latitude": lat + rng.gauss(0, 1e-5),   # ~1 m of jitter
+                "longitude": lon + rng.gauss(0, 1e-5),
+                "speed_kmh": reported if speed else 0,
+                "timestamp": t.isoformat(),
+            }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark streaming trip segmentation")
+    parser.add_argument("--hz", type=float, default=1)
+    args = parser.parse_args()
+
+    points = list(iter_day(args.hz))
+    print(f"{len(points):,} points; summarize() labels the whole day "
+          f"{movement_engine.summarize(points)['transportation']!r}")
+
+    start = time.perf_counter()
+    segments = list(trip_segmenter.segment_trips(points))
+    elapsed = time.perf_counter() - start
+    for s in segments:
+        line = f"  {s['kind']:4} {s['start'][11:19]}-{s['end'][11:19]}"
+        if s["kind"] == "trip":
+            line += (f" {s['transportation']:8} {s['distance_km']:7.3f} km"
+                     f"  p{trip_segmenter.TRIP_SPEED_QUANTILE * 100:.0f} {s['quantile_speed_kmh']:6.2f} km/h"
+                     f"  max {s['max_speed_kmh']:7.2f} km/h")
+        print(line)
+    print(f"segmenter: {elapsed * 1000:.0f} ms ({len(points) / elapsed / 1e3:.0f} k points/s)")
+
+    del points
+    tracemalloc.start()
+    for _ in trip_segmenter.segment_trips(iter_day(args.hz)):
+        pass
+    streamed_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.reset_peak()
+    list(trip_segmenter.segment_trips(list(iter_day(args.hz))))
+    listed_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"peak memory: streamed {streamed_peak / 1024:.0f} KiB, from a list {listed_peak / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Concurrency check for POST /users/{user_id}/emissions/add.
+
+Creates a fresh user, fires many parallel adds at it and verifies the final
+carbonEmission equals the sum of all adds (no lost updates).
+
+Usage (from backend/, with the API running, ideally against the Firestore emulator):
+  python -m benchmarks.concurrent_emissions_check --adds 5000 --concurrency 200
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+
+import httpx
+
+
+async def main_async(args) -> int:
+    user_id = f"concurrency-{uuid4().hex}"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=60) as client:
+        response = await client.post("/users/", json={
+            "user_id": user_id,
+            "name": "Concurrency Check",
+            "email": "concurrency@example.com",
+            "password": "unused",
+            "country": "Test",
+            "transportation": "walking",
+        })
+        response.raise_for_status()
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        failures = 0
+
+        async def add_one() -> None:
+            nonlocal failures
+            async with semaphore:
+                r = await client.post(f"/users/{user_id}/emissions/add", params={"emission": args.amount})
+                if r.status_code != 200:
+                    failures += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(add_one() for _ in range(args.adds)))
+        elapsed = time.perf_counter() - start
+
+        total = (await client.get(f"/users/{user_id}")).json().get("carbonEmission")
+        await client.delete(f"/users/{user_id}")
+
+    expected = (args.adds - failures) * args.amount
+    ok = total is not None and abs(total - expected) < 1e-6
+    print(f"{args.adds} adds in {elapsed:.2f}s ({args.adds / elapsed:.0f}/s), {failures} failed requests")
+    print(f"final carbonEmission={total} expected={expected} -> {'OK' if ok else 'LOST UPDATES'}")
+    return 0 if ok else 1
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fire parallel emission adds at one user and check the total")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--adds", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--amount", type=float, default=0.5, help="kg per add (0.5 keeps float sums exact)")
+    raise SystemExit(asyncio.run(main_async(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Load test for the FastAPI endpoints: request throughput at increasing concurrency.
+
+With the async data layer a single uvicorn worker should scale roughly with
+concurrency until the Firestore executor (FIRESTORE_MAX_WORKERS) saturates,
+instead of flat-lining at 1 / round-trip-latency.
+
+Usage (from backend/, with the API running, e.g. against the Firestore emulator):
+  uvicorn main:app --workers 1
+  python -m benchmarks.load_test_api --user-id SOME_USER --concurrency 1 4 16 64
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+
+async def _worker(client: httpx.AsyncClient, path: str, remaining: list, latencies: list, errors: list) -> None:
+    while remaining:
+        remaining.pop()
+        start = time.perf_counter()
+        try:
+            response = await client.get(path)
+            if response.status_code >= 500:
+                errors.append(response.status_code)
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run_level(base_url: str, path: str, concurrency: int, requests: int) -> dict:
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=30) as client:
+        remaining = list(range(requests))
+        latencies: list = []
+        errors: list = []
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker(client, path, remaining, latencies, errors) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": len(errors),
+    }
+
+
+async def main_async(args) -> None:
+    path = args.path or f"/users/{args.user_id}"
+    print(f"GET {args.base_url}{path}, {args.requests} requests per level")
+    print(f"{'concurrency':>11} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>6}")
+    for level in args.concurrency:
+        r = await run_level(args.base_url, path, level, args.requests)
+        print(f"{r['concurrency']:>11} {r['rps']:>9.1f} {r['p50_ms']:>8.1f} {r['p99_ms']:>8.1f} {r['errors']:>6}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="API throughput vs concurrency")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--user-id", default="load-test-user")
+    parser.add_argument("--path", help="Override the request path (default /users/{user_id})")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--requests", type=int, default=500)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
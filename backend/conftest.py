@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The backend runs from backend/: top-level imports (services, database) and
+# paths in .env (FIREBASE_CREDENTIALS_PATH) are relative to it.
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+os.chdir(BACKEND_DIR)
+
+# Publishes to the real topic on import; not a test despite its name.
+collect_ignore = ["publish_test.py"]
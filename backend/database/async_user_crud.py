@@ -0,0 +1,91 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from . import user_crud
+
+# The Firestore client is thread-safe; a bounded pool keeps blocking
+# round trips off the event loop without spawning unbounded threads.
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "32"))
+
+_executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore")
+
+async def run_sync(fn, *args, **kwargs):
+    """
+    Runs a blocking function on the Firestore executor and awaits its result.
+    Use it for service calls built on user_crud (e.g. trip aggregation).
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+async def get_user(user_id: str) -> dict or None:
+    """Async version of user_crud.get_user."""
+    return await run_sync(user_crud.get_user, user_id)
+
+async def create_user(user_id: str, data: dict) -> bool:
+    """Async version of user_crud.create_user."""
+    return await run_sync(user_crud.create_user, user_id, data)
+
+async def update_user(user_id: str, data: dict) -> bool:
+    """Async version of user_crud.update_user."""
+    return await run_sync(user_crud.update_user, user_id, data)
+
+async def delete_user(user_id: str) -> bool:
+    """Async version of user_crud.delete_user."""
+    return await run_sync(user_crud.delete_user, user_id)
+
+async def increment_user_field(user_id: str, field: str, amount: float) -> bool:
+    """Async version of user_crud.increment_user_field."""
+    return await run_sync(user_crud.increment_user_field, user_id, field, amount)
+
+async def bulk_create_users(users: dict, **options) -> dict:
+    """Async version of user_crud.bulk_create_users."""
+    return await run_sync(user_crud.bulk_create_users, users, **options)
+
+async def bulk_update_users(updates: dict, **options) -> dict:
+    """Async version of user_crud.bulk_update_users."""
+    return await run_sync(user_crud.bulk_update_users, updates, **options)
+
+async def bulk_delete_users(user_ids: list, **options) -> dict:
+    """Async version of user_crud.bulk_delete_users."""
+    return await run_sync(user_crud.bulk_delete_users, user_ids, **options)
+
+def get_user_cache_stats() -> dict:
+    """In-memory only, no need to hop to the executor."""
+    return user_crud.get_user_cache_stats()
+
+async def get_user_movements(user_id: str, **filters) -> list:
+    """Async version of user_crud.get_user_movements."""
+    return await run_sync(user_crud.get_user_movements, user_id, **filters)
+
+async def add_user_movements(user_id: str, points: list, **options) -> dict:
+    """Async version of user_crud.add_user_movements."""
+    return await run_sync(user_crud.add_user_movements, user_id, points, **options)
+
+async def iter_user_movements(user_id: str, **filters):
+    """
+    Async generator over user_crud.iter_user_movements.
+    Pulls a whole page per executor hop instead of one point at a time.
+    """
+    page_size = filters.get("page_size", user_crud.MOVEMENTS_PAGE_SIZE)
+    movements = user_crud.iter_user_movements(user_id, **filters)
+
+    def next_page():
+        page = []
+        for movement in movements:
+            page.append(movement)
+            if len(page) >= page_size:
+                break
+        return page
+
+    while True:
+        page = await run_sync(next_page)
+        for movement in page:
+            yield movement
+        if len(page) < page_size:
+            return
+
+async def does_user_drive_gas(user_id: str) -> bool:
+    """Async version of user_crud.does_user_drive_gas."""
+    return await run_sync(user_crud.does_user_drive_gas, user_id)
@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime, timezone
+
+from google.cloud.firestore_v1.field_path import FieldPath
+from . import db
+
+logger = logging.getLogger(__name__)
+
+JOBS_COLLECTION = "jobs"
+RESULTS_SUBCOLLECTION = "results"
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def create_job(job_id: str, data: dict) -> bool:
+    """
+    Creates a background job document.
+    Args:
+        job_id: The ID for the new job document.
+        data: Initial job fields (kind, status, options...).
+    Returns:
+        True if the operation was successful, False otherwise.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return False
+    try:
+        db.collection(JOBS_COLLECTION).document(job_id).set({**data, "created_at": _now(), "updated_at": _now()})
+        return True
+    except Exception as e:
+        logger.error("Error creating job %s: %s", job_id, e)
+        return False
+
+def get_job(job_id: str) -> dict or None:
+    """
+    Retrieves a job document (status, progress counters, checkpoint cursor).
+    Returns the job dict if it exists, otherwise None.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return None
+    try:
+        doc = db.collection(JOBS_COLLECTION).document(job_id).get()
+        return {**doc.to_dict(), "job_id": job_id} if doc.exists else None
+    except Exception as e:
+        logger.error("Error reading job %s: %s", job_id, e)
+        return None
+
+def update_job(job_id: str, data: dict, results: dict | None = None) -> bool:
+    """
+    Merges fields into a job document and, in the same batched write,
+    stores per-item results under jobs/{job_id}/results/{item_id}.
+    Writing results and the checkpoint together keeps them consistent
+    when the job is resumed.
+    Args:
+        job_id: The ID of the job document.
+        data: Fields to merge. Values may be firestore.Increment.
+        results: Optional {item_id: result dict}; at most ~490 per call.
+    Returns:
+        True if the operation was successful, False otherwise.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return False
+    try:
+        job_ref = db.collection(JOBS_COLLECTION).document(job_id)
+        batch = db.batch()
+        for item_id, result in (results or {}).items():
+            batch.set(job_ref.collection(RESULTS_SUBCOLLECTION).document(item_id), result)
+        batch.set(job_ref, {**data, "updated_at": _now()}, merge=True)
+        batch.commit()
+        return True
+    except Exception as e:
+        logger.error("Error updating job %s: %s", job_id, e)
+        return False
+
+def iter_job_results(job_id: str, page_size: int = 500):
+    """
+    Lazily yields (item_id, result) pairs stored for a job.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return
+    try:
+        results_ref = db.collection(JOBS_COLLECTION).document(job_id).collection(RESULTS_SUBCOLLECTION)
+        doc_id = FieldPath.document_id()
+        query = results_ref.order_by(doc_id)
+        cursor = None
+        while True:
+            page = query.start_after({doc_id: cursor}) if cursor is not None else query
+            docs = list(page.limit(page_size).stream())
+            for doc in docs:
+                yield doc.id, doc.to_dict()
+            if len(docs) < page_size:
+                return
+            cursor = docs[-1].id
+    except Exception as e:
+        logger.error("Error reading results for job %s: %s", job_id, e)
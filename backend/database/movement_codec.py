@@ -0,0 +1,240 @@
+"""
+Compact chunk encoding for movement points.
+
+All points of one time window (MOVEMENT_CHUNK_SECONDS) are packed into one
+Firestore document under users/{user_id}/movement_chunks instead of one
+document per GPS fix. Inside a chunk:
+
+- timestamps are integer milliseconds, stored as deltas from t0_ms;
+- latitude/longitude are fixed-point (1e-7 degree, about 1 cm), stored as
+  deltas from lat0/lon0;
+- speed_mps is fixed-point centimetres per second.
+
+The delta columns are packed back to back into one bytes field, which is
+zlib-compressed unless MOVEMENT_CHUNK_COMPRESSION=none. decode_chunk()
+turns a chunk straight back into NumPy arrays.
+"""
+from __future__ import annotations
+
+import os
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from services import movement_engine, timestamps
+
+CHUNK_FORMAT = 1
+MOVEMENT_CHUNK_SECONDS = int(os.getenv("MOVEMENT_CHUNK_SECONDS", "3600"))
+MOVEMENT_CHUNK_COMPRESSION = os.getenv("MOVEMENT_CHUNK_COMPRESSION", "zlib")
+# Keeps a chunk well under Firestore's 1 MiB document limit (about 14 Hz for an hour).
+MOVEMENT_CHUNK_MAX_POINTS = 50_000
+
+COORD_SCALE = 10_000_000
+SPEED_SCALE = 100
+_SPEED_MAX = np.iinfo(np.uint16).max
+_EPOCH = datetime(1970, 1, 1)
+
+
+@dataclass
+class ChunkPoints:
+    """Quantized points of one chunk, sorted by time with unique milliseconds."""
+    t_ms: np.ndarray       # int64 ms since the epoch
+    lat_e7: np.ndarray     # int64 degrees * COORD_SCALE
+    lon_e7: np.ndarray     # int64 degrees * COORD_SCALE
+    speed_cms: np.ndarray  # int64 cm/s
+    utc: bool = False      # timestamps were timezone-aware (rendered with +00:00)
+
+    def __len__(self) -> int:
+        return len(self.t_ms)
+
+    @property
+    def seconds(self) -> np.ndarray:
+        return self.t_ms / 1000.0
+
+    @property
+    def latitude(self) -> np.ndarray:
+        return self.lat_e7 / COORD_SCALE
+
+    @property
+    def longitude(self) -> np.ndarray:
+        return self.lon_e7 / COORD_SCALE
+
+    @property
+    def speed_mps(self) -> np.ndarray:
+        return self.speed_cms / SPEED_SCALE
+
+    def columns(self) -> movement_engine.MovementColumns:
+        """As MovementColumns (speed in km/h, seconds set), for movement_engine and trajectory."""
+        return movement_engine.MovementColumns(self.latitude, self.longitude, self.speed_mps * 3.6, [], self.seconds)
+
+    def select(self, mask: np.ndarray) -> "ChunkPoints":
+        return ChunkPoints(self.t_ms[mask], self.lat_e7[mask], self.lon_e7[mask], self.speed_cms[mask], self.utc)
+
+
+def timestamp_ms(timestamp: str, utc_offset_minutes: int | None = None) -> tuple[int, bool]:
+    """
+    (ms since the epoch, UTC known) for an ISO-8601 timestamp.
+    A naive timestamp is local time utc_offset_minutes east of UTC; without
+    an offset it is taken as UTC, the convention of chunks stored before
+    uploads had to carry one.
+    """
+    dt = datetime.fromisoformat(timestamp)
+    aware = dt.tzinfo is not None
+    if aware:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    elif utc_offset_minutes is not None:
+        dt -= timedelta(minutes=utc_offset_minutes)
+        aware = True
+    delta = dt - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1000 + delta.microseconds // 1000, aware
+
+
+def point_ms(timestamp) -> int | None:
+    """
+    ms since the epoch for a stored point's timestamp (ISO-8601, the legacy
+    console format or a Firestore timestamp), or None if it cannot be parsed.
+    """
+    try:
+        # Rounded to whole microseconds first so float error cannot cost a millisecond.
+        return round(timestamps.to_seconds(timestamp) * 1_000_000) // 1000
+    except (TypeError, ValueError):
+        return None
+
+
+def format_timestamp(t_ms: int, utc: bool) -> str:
+    """Inverse of timestamp_ms, at millisecond precision."""
+    text = (_EPOCH + timedelta(milliseconds=t_ms)).isoformat(timespec="milliseconds")
+    return text + "+00:00" if utc else text
+
+
+def chunk_id(start_ms: int) -> str:
+    """Zero-padded so document ids sort by time."""
+    return f"{start_ms:015d}"
+
+
+def quantize(points: list, utc_offset_minutes: int | None = None) -> ChunkPoints:
+    """
+    Validated movement dicts (ISO timestamps) -> sorted, de-duplicated
+    ChunkPoints; naive timestamps are shifted by utc_offset_minutes (see timestamp_ms).
+    """
+    n = len(points)
+    parsed = [timestamp_ms(p["timestamp"], utc_offset_minutes) for p in points]
+    t_ms = np.fromiter((t for t, _ in parsed), dtype=np.int64, count=n)
+    lat = np.fromiter((p["latitude"] for p in points), dtype=np.float64, count=n)
+    lon = np.fromiter((p["longitude"] for p in points), dtype=np.float64, count=n)
+    speed = np.fromiter((p.get("speed_mps") or 0.0 for p in points), dtype=np.float64, count=n)
+    chunk = ChunkPoints(
+        t_ms,
+        np.rint(lat * COORD_SCALE).astype(np.int64),
+        np.rint(lon * COORD_SCALE).astype(np.int64),
+        np.clip(np.rint(speed * SPEED_SCALE), 0, _SPEED_MAX).astype(np.int64),
+        any(aware for _, aware in parsed),
+    )
+    return merge(chunk)
+
+
+def merge(*chunks: ChunkPoints) -> ChunkPoints:
+    """Concatenate, sort by time and keep the last point for each millisecond."""
+    t_ms = np.concatenate([c.t_ms for c in chunks])
+    order = np.argsort(t_ms, kind="stable")
+    t_sorted = t_ms[order]
+    # Last occurrence of each timestamp wins, so a re-sent point overwrites the old one.
+    keep = np.ones(len(order), dtype=bool)
+    keep[:-1] = t_sorted[1:] != t_sorted[:-1]
+    order = order[keep]
+    return ChunkPoints(
+        t_ms[order],
+        np.concatenate([c.lat_e7 for c in chunks])[order],
+        np.concatenate([c.lon_e7 for c in chunks])[order],
+        np.concatenate([c.speed_cms for c in chunks])[order],
+        any(c.utc for c in chunks),
+    )
+
+
+def split_windows(chunk: ChunkPoints, chunk_seconds: int = MOVEMENT_CHUNK_SECONDS) -> dict:
+    """{window start ms: ChunkPoints} for the windows the points fall into."""
+    starts = chunk.t_ms - chunk.t_ms % (chunk_seconds * 1000)
+    bounds = np.flatnonzero(np.diff(starts)) + 1
+    edges = [0, *bounds.tolist(), len(chunk)]
+    return {
+        int(starts[lo]): chunk.select(slice(lo, hi))
+        for lo, hi in zip(edges[:-1], edges[1:])
+    }
+
+
+def encode_chunk(chunk: ChunkPoints, start_ms: int, compression: str = MOVEMENT_CHUNK_COMPRESSION) -> dict:
+    """The Firestore document for one window's points."""
+    if len(chunk) > MOVEMENT_CHUNK_MAX_POINTS:
+        raise ValueError(f"{len(chunk)} points exceed the {MOVEMENT_CHUNK_MAX_POINTS} per chunk limit")
+    dt = np.diff(chunk.t_ms).astype("<u4")
+    dlat = np.diff(chunk.lat_e7)
+    dlon = np.diff(chunk.lon_e7)
+    # Deltas fit int32 unless a trace jumps half the globe (e.g. the antimeridian).
+    wide = bool(len(dlat)) and max(np.abs(dlat).max(), np.abs(dlon).max()) > np.iinfo(np.int32).max
+    delta_dtype = "<i8" if wide else "<i4"
+    data = b"".join((
+        dt.tobytes(),
+        dlat.astype(delta_dtype).tobytes(),
+        dlon.astype(delta_dtype).tobytes(),
+        chunk.speed_cms.astype("<u2").tobytes(),
+    ))
+    compressed = compression == "zlib"
+    return {
+        "format": CHUNK_FORMAT,
+        "start_ms": start_ms,
+        "t0_ms": int(chunk.t_ms[0]),
+        "end_ms": int(chunk.t_ms[-1]),
+        "count": len(chunk),
+        "lat0": int(chunk.lat_e7[0]),
+        "lon0": int(chunk.lon_e7[0]),
+        "delta_dtype": delta_dtype,
+        "utc": chunk.utc,
+        "compression": "zlib" if compressed else None,
+        "data": zlib.compress(data, 6) if compressed else data,
+    }
+
+
+def decode_chunk(doc: dict) -> ChunkPoints:
+    """A chunk document back into ChunkPoints."""
+    if doc.get("format") != CHUNK_FORMAT:
+        raise ValueError(f"Unsupported movement chunk format: {doc.get('format')}")
+    n = doc["count"]
+    data = doc["data"]
+    if doc.get("compression") == "zlib":
+        data = zlib.decompress(data)
+    delta_dtype = np.dtype(doc["delta_dtype"])
+    m = n - 1
+    offsets = np.cumsum([0, 4 * m, delta_dtype.itemsize * m, delta_dtype.itemsize * m])
+
+    def column(first: int, offset: int, dtype) -> np.ndarray:
+        values = np.empty(n, dtype=np.int64)
+        values[0] = first
+        np.cumsum(np.frombuffer(data, dtype=dtype, count=m, offset=int(offset)), out=values[1:])
+        values[1:] += first
+        return values
+
+    return ChunkPoints(
+        column(doc["t0_ms"], offsets[0], "<u4"),
+        column(doc["lat0"], offsets[1], delta_dtype),
+        column(doc["lon0"], offsets[2], delta_dtype),
+        np.frombuffer(data, dtype="<u2", count=n, offset=int(offsets[3])).astype(np.int64),
+        bool(doc.get("utc")),
+    )
+
+
+def to_points(chunk: ChunkPoints) -> list:
+    """Movement dicts in the same shape as the per-point documents, plus "t_ms"."""
+    lat, lon, mps = chunk.latitude.tolist(), chunk.longitude.tolist(), chunk.speed_mps.tolist()
+    return [
+        {
+            "latitude": lat[i],
+            "longitude": lon[i],
+            "speed_mps": mps[i],
+            "speed_kmh": mps[i] * 3.6,
+            "timestamp": format_timestamp(t, chunk.utc),
+            "t_ms": t,
+        }
+        for i, t in enumerate(chunk.t_ms.tolist())
+    ]
@@ -0,0 +1,87 @@
+import os
+import threading
+
+from cachetools import TTLCache
+
+USER_CACHE_MAXSIZE = int(os.getenv("USER_CACHE_MAXSIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+
+class _CountingTTLCache(TTLCache):
+    """TTLCache (LRU order + per-entry TTL) that counts evictions and expirations."""
+
+    def __init__(self, maxsize, ttl):
+        super().__init__(maxsize, ttl)
+        self.evictions = 0
+        self.expirations = 0
+
+    def popitem(self):
+        # Only called when the cache is full and the LRU entry has to go.
+        item = super().popitem()
+        self.evictions += 1
+        return item
+
+    def expire(self, time=None):
+        expired = super().expire(time)
+        self.expirations += len(expired)
+        return expired
+
+class UserCache:
+    """
+    In-process read-through cache for user documents.
+    Writes through user_crud invalidate the entry. Other processes (or
+    writes made directly against Firestore) are only picked up once the
+    entry's TTL runs out, so keep the TTL short.
+    """
+
+    def __init__(self, maxsize: int = USER_CACHE_MAXSIZE, ttl: float = USER_CACHE_TTL):
+        self.enabled = maxsize > 0 and ttl > 0
+        self._cache = _CountingTTLCache(max(maxsize, 1), max(ttl, 0.001))
+        self._lock = threading.Lock()
+        # Bumped on every invalidation; a fill that started before an
+        # invalidation is dropped so a stale read cannot be cached.
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id: str):
+        """
+        Returns (cached user dict copy or None, epoch token for put()).
+        """
+        with self._lock:
+            value = self._cache.get(user_id) if self.enabled else None
+            if value is None:
+                self.misses += 1
+                return None, self._epoch
+            self.hits += 1
+            return dict(value), self._epoch
+
+    def put(self, user_id: str, value: dict, epoch: int) -> None:
+        if not self.enabled or value is None:
+            return
+        with self._lock:
+            if epoch == self._epoch:
+                self._cache[user_id] = dict(value)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._cache.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl_seconds": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self._cache.evictions,
+                "expirations": self._cache.expirations,
+            }
@@ -1,34 +1,93 @@
-database/user_crud.py
+import heapq
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
 import firebase_admin
+import numpy as np
 from firebase_admin import firestore
-from . import db
+from google.api_core.exceptions import (
+    Aborted,
+    DeadlineExceeded,
+    InternalServerError,
+    NotFound,
+    ResourceExhausted,
+    ServiceUnavailable,
+)
+from google.cloud.firestore_v1.field_path import FieldPath
+from services import movement_engine, trajectory
+from services.metrics import USER_CACHE_HIT_RATIO, user_crud_call
+
+from . import db, movement_codec
+from .user_cache import UserCache
+
+logger = logging.getLogger(__name__)
 
 USERS_COLLECTION = "users"
 
+# Read-through cache in front of get_user; every write below invalidates it.
+user_cache = UserCache()
+USER_CACHE_HIT_RATIO.set_function(lambda: user_cache.stats()["hit_ratio"])
+
+# Callbacks run after every successful user write, as callback(user_id, op, data)
+# with op one of "create", "update", "delete" or "increment" ({field: amount}).
+_write_listeners = []
+
+def add_write_listener(callback) -> None:
+    """
+    Registers a callback notified of user writes made through this module,
+    e.g. to keep derived in-memory indexes (the leaderboard) up to date.
+    """
+    _write_listeners.append(callback)
+
+def _notify_write(user_id: str, op: str, data: dict or None) -> None:
+    if op == "update" and any(isinstance(v, firestore.Increment) for v in data.values()):
+        # Listeners see server-side increments as "increment" ops with plain amounts.
+        plain = {k: v for k, v in data.items() if not isinstance(v, firestore.Increment)}
+        if plain:
+            _notify_write(user_id, "update", plain)
+        _notify_write(user_id, "increment", {k: v.value for k, v in data.items() if k not in plain})
+        return
+    for callback in _write_listeners:
+        try:
+            callback(user_id, op, data)
+        except Exception as e:
+            logger.error("Error in user write listener for %s: %s", user_id, e)
+
+@user_crud_call
 def get_user(user_id: str) -> dict or None:
     """
     Retrieves a user document from Firestore by user_id.
+    Served from the in-process user_cache when a fresh copy is cached.
     Args:
         user_id: The ID of the user document to retrieve.
     Returns:
         The user data dictionary if the document exists, otherwise None.
     """
     if not db:
-        print("Error: Database connection not established.")
+        logger.error("Database connection not established.")
         return None
     
+    cached, epoch = user_cache.get(user_id)
+    if cached is not None:
+        return cached
+
     try:
         doc_ref = db.collection(USERS_COLLECTION).document(user_id)
         doc = doc_ref.get()
 
         if doc.exists:
-            return {**doc.to_dict()}
+            user = {**doc.to_dict()}
+            user_cache.put(user_id, user, epoch)
+            return user
         else:
             return None
     except Exception as e:
-        print(f"Error reading user {user_id}: {e}")
+        logger.error("Error reading user %s: %s", user_id, e)
         return None
 
+@user_crud_call
 def create_user(user_id: str, data: dict) -> bool:
     """
     Creates or overwrites a user document in Firestore.
@@ -39,18 +98,21 @@ def create_user(user_id: str, data: dict) -> bool:
         True if the operation was successful, False otherwise.
     """
     if not db:
-        print("Error: Database connection not established.")
+        logger.error("Database connection not established.")
         return False
     
     try:
         doc_ref = db.collection(USERS_COLLECTION).document(user_id)
         doc_ref.set(data)
-        print(f"Successfully created/updated user: {user_id}")
+        user_cache.invalidate(user_id)
+        _notify_write(user_id, "create", data)
+        logger.info("Successfully created/updated user: %s", user_id, extra={"user_id": user_id, "op": "create"})
         return True
     except Exception as e:
-        print(f"Error creating user {user_id}: {e}")
+        logger.error("Error creating user %s: %s", user_id, e)
         return False
 
+@user_crud_call
 def update_user(user_id: str, data: dict) -> bool:
     """
     Updates specific fields in an existing user document.
@@ -62,17 +124,20 @@ def update_user(user_id: str, data: dict) -> bool:
         True if the operation was successful, False otherwise.
     """
     if not db:
-        print("Error: Database connection not established.")
+        logger.error("Database connection not established.")
         return False
     try:
         doc_ref = db.collection(USERS_COLLECTION).document(user_id)
         doc_ref.set(data, merge=True)
-        print(f"Successfully updated user: {user_id}")
+        user_cache.invalidate(user_id)
+        _notify_write(user_id, "update", data)
+        logger.info("Successfully updated user: %s", user_id, extra={"user_id": user_id, "op": "update"})
         return True
     except Exception as e:
-        print(f"Error updating user {user_id}: {e}")
+        logger.error("Error updating user %s: %s", user_id, e)
         return False
 
+@user_crud_call
 def delete_user(user_id: str) -> bool:
     """
     Deletes a user document from Firestore.
@@ -82,31 +147,764 @@ def delete_user(user_id: str) -> bool:
         True if the operation was successful, False otherwise.
     """
     if not db:
-        print("Error: Database connection not established.")
+        logger.error("Database connection not established.")
         return False
     try:
         doc_ref = db.collection(USERS_COLLECTION).document(user_id)
         doc_ref.delete()
-        print(f"Successfully deleted user: {user_id}")
+        user_cache.invalidate(user_id)
+        _notify_write(user_id, "delete", None)
+        logger.info("Successfully deleted user: %s", user_id, extra={"user_id": user_id, "op": "delete"})
         return True
     except Exception as e:
-        print(f"Error deleting user {user_id}: {e}")
+        logger.error("Error deleting user %s: %s", user_id, e)
         return False
     
-def get_user_movements(user_id: str):
+@user_crud_call
+def increment_user_field(user_id: str, field: str, amount: float) -> bool:
+    """
+    Atomically adds amount to a numeric field of an existing user document.
+    Uses a server-side Increment, so it is a single round trip and concurrent
+    increments never overwrite each other.
+    Args:
+        user_id: The ID of the user document to update.
+        field: The numeric field to increment (e.g. carbonEmission).
+        amount: The value to add (may be negative).
+    Returns:
+        True if the operation was successful, False if the user does not exist or the write failed.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return False
+    try:
+        doc_ref = db.collection(USERS_COLLECTION).document(user_id)
+        doc_ref.update({field: firestore.Increment(amount)})
+        user_cache.invalidate(user_id)
+        _notify_write(user_id, "increment", {field: amount})
+        return True
+    except NotFound:
+        logger.warning("Cannot increment %s: user %s not found", field, user_id)
+        return False
+    except Exception as e:
+        logger.error("Error incrementing %s for user %s: %s", field, user_id, e)
+        return False
+
+# Firestore caps a batched write at 500 operations.
+BATCH_MAX_WRITES = 500
+BATCH_MAX_RETRIES = 3
+BATCH_MAX_WORKERS = 8
+RETRYABLE_ERRORS = (Aborted, DeadlineExceeded, InternalServerError, ResourceExhausted, ServiceUnavailable)
+
+def _commit_batch(ops: list, max_retries: int) -> tuple:
+    """
+    Commits (user_id, op, data) operations as a single batched write.
+    Retries transient failures with exponential backoff.
+    Returns (error message or None, whether the last error was transient).
+    """
+    for attempt in range(1, max_retries + 1):
+        batch = db.batch()
+        for user_id, op, data in ops:
+            doc_ref = db.collection(USERS_COLLECTION).document(user_id)
+            if op == "create":
+                batch.set(doc_ref, data)
+            elif op == "update":
+                batch.set(doc_ref, data, merge=True)
+            else:
+                batch.delete(doc_ref)
+        try:
+            batch.commit()
+            for user_id, op, data in ops:
+                _notify_write(user_id, op, data)
+            return None, False
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                return str(e), True
+            time.sleep(0.2 * 2 ** (attempt - 1))
+        except Exception as e:
+            return str(e), False
+        finally:
+            for user_id, _, _ in ops:
+                user_cache.invalidate(user_id)
+
+def _commit_chunk(ops: list, max_retries: int) -> dict:
+    """
+    Commits one chunk of (user_id, op, data) and returns {user_id: error or None}.
+    A batch is all-or-nothing, so when it is rejected for a non-transient
+    reason (e.g. one invalid document) its documents are retried one by one
+    to find out which of them actually fail.
+    """
+    error, transient = _commit_batch(ops, max_retries)
+    if error is None or transient or len(ops) == 1:
+        return {user_id: error for user_id, _, _ in ops}
+    return {user_id: _commit_batch([(user_id, op, data)], max_retries)[0] for user_id, op, data in ops}
+
+def _bulk_write(ops: list, chunk_size: int, max_retries: int, max_workers: int) -> dict:
+    """
+    Splits ops into batched writes of up to chunk_size operations and
+    commits the chunks concurrently.
+    Returns {user_id: True/False} per document.
+    """
+    if max_retries < 1:
+        raise ValueError("max_retries must be at least 1 (the first attempt counts)")
+    if not db:
+        logger.error("Database connection not established.")
+        return {user_id: False for user_id, _, _ in ops}
+
+    chunk_size = min(chunk_size, BATCH_MAX_WRITES)
+    chunks = [ops[i:i + chunk_size] for i in range(0, len(ops), chunk_size)]
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as pool:
+        for errors in pool.map(lambda c: _commit_chunk(c, max_retries), chunks):
+            for user_id, error in errors.items():
+                if error:
+                    logger.error("Error writing user %s in bulk: %s", user_id, error)
+                results[user_id] = error is None
+    succeeded = sum(results.values())
+    logger.info(
+        "Bulk write finished: %s succeeded, %s failed", succeeded, len(results) - succeeded,
+        extra={"succeeded": succeeded, "failed": len(results) - succeeded},
+    )
+    return results
+
+@user_crud_call
+def bulk_create_users(
+    users: dict,
+    chunk_size: int = BATCH_MAX_WRITES,
+    max_retries: int = BATCH_MAX_RETRIES,
+    max_workers: int = BATCH_MAX_WORKERS,
+) -> dict:
+    """
+    Creates or overwrites many user documents using batched writes.
+    Args:
+        users: A dictionary of {user_id: user data}.
+    Returns:
+        A dictionary of {user_id: True if written, False otherwise}.
+    Raises:
+        ValueError: If max_retries is less than 1.
+    """
+    return _bulk_write([(uid, "create", data) for uid, data in users.items()], chunk_size, max_retries, max_workers)
+
+@user_crud_call
+def bulk_update_users(
+    updates: dict,
+    chunk_size: int = BATCH_MAX_WRITES,
+    max_retries: int = BATCH_MAX_RETRIES,
+    max_workers: int = BATCH_MAX_WORKERS,
+) -> dict:
+    """
+    Merges fields into many user documents using batched writes
+    (same semantics as update_user).
+    Args:
+        updates: A dictionary of {user_id: fields to update}.
+    Returns:
+        A dictionary of {user_id: True if written, False otherwise}.
+    Raises:
+        ValueError: If max_retries is less than 1.
+    """
+    return _bulk_write([(uid, "update", data) for uid, data in updates.items()], chunk_size, max_retries, max_workers)
+
+@user_crud_call
+def bulk_delete_users(
+    user_ids: list,
+    chunk_size: int = BATCH_MAX_WRITES,
+    max_retries: int = BATCH_MAX_RETRIES,
+    max_workers: int = BATCH_MAX_WORKERS,
+) -> dict:
+    """
+    Deletes many user documents using batched writes.
+    Args:
+        user_ids: The IDs of the user documents to delete.
+    Returns:
+        A dictionary of {user_id: True if deleted, False otherwise}.
+    Raises:
+        ValueError: If max_retries is less than 1.
+    """
+    return _bulk_write([(uid, "delete", None) for uid in user_ids], chunk_size, max_retries, max_workers)
+
+def iter_user_ids(start_after: str | None = None, page_size: int = BATCH_MAX_WRITES):
+    """
+    Lazily yields every user id in document-id order, one page per round trip.
+    Only document names are fetched, not user data.
+    Args:
+        start_after: Resume after this user id (exclusive).
+        page_size: Documents fetched per Firestore round trip.
+    Raises:
+        The underlying Firestore error if a page cannot be read.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return
+
+    try:
+        doc_id = FieldPath.document_id()
+        query = db.collection(USERS_COLLECTION).order_by(doc_id).select([doc_id])
+        cursor = start_after
+        while True:
+            page = query.start_after({doc_id: cursor}) if cursor is not None else query
+            docs = list(page.limit(page_size).stream())
+            for doc in docs:
+                yield doc.id
+            if len(docs) < page_size:
+                return
+            cursor = docs[-1].id
+    except Exception as e:
+        # Callers such as the recalculation job must not mistake a failed
+        # read for the end of the collection, so this one re-raises.
+        logger.error("Error listing users: %s", e)
+        raise
+
+def iter_user_pages(fields: list | None = None, start_after: str | None = None, page_size: int = BATCH_MAX_WRITES):
+    """
+    Lazily yields every user in document-id order as one list of
+    (user_id, data) per Firestore round trip, handed over as soon as it is read.
+    Args:
+        fields: Only fetch these fields (projection); None fetches whole documents.
+        start_after: Resume after this user id (exclusive).
+        page_size: Documents fetched per Firestore round trip.
+    Raises:
+        The underlying Firestore error if a page cannot be read.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return
+
+    try:
+        doc_id = FieldPath.document_id()
+        query = db.collection(USERS_COLLECTION).order_by(doc_id)
+        if fields is not None:
+            query = query.select(fields)
+        cursor = start_after
+        while True:
+            page = query.start_after({doc_id: cursor}) if cursor is not None else query
+            docs = list(page.limit(page_size).stream())
+            if docs:
+                yield [(doc.id, doc.to_dict()) for doc in docs]
+            if len(docs) < page_size:
+                return
+            cursor = docs[-1].id
+    except Exception as e:
+        logger.error("Error listing users: %s", e)
+        raise
+
+def iter_users(fields: list | None = None, start_after: str | None = None, page_size: int = BATCH_MAX_WRITES):
+    """
+    Lazily yields (user_id, data) for every user in document-id order,
+    one page per round trip (see iter_user_pages).
+    Args:
+        fields: Only fetch these fields (projection); None fetches whole documents.
+        start_after: Resume after this user id (exclusive).
+        page_size: Documents fetched per Firestore round trip.
+    Raises:
+        The underlying Firestore error if a page cannot be read.
+    """
+    for page in iter_user_pages(fields=fields, start_after=start_after, page_size=page_size):
+        yield from page
+
+def get_user_cache_stats() -> dict:
+    """
+    Returns hit/miss/eviction counters of the get_user cache, for sizing it.
+    """
+    return user_cache.stats()
+
+MOVEMENTS_PAGE_SIZE = 500
+# ms since the epoch, stored next to "timestamp" on per-point documents so
+# they can be ordered and filtered numerically; the ISO strings the app
+# writes do not sort by time across zones and formats.
+MOVEMENT_TIME_FIELD = "t_ms"
+MOVEMENT_CHUNKS_COLLECTION = "movement_chunks"
+MOVEMENT_CHUNKS_PAGE_SIZE = 20
+
+def _split_movement_cursor(start_after: str | None) -> tuple:
+    """
+    A movement id/cursor is "<last point document id>:<last chunk point ms>".
+    Plain document ids (from before chunked storage) have no chunk part.
+    """
+    if not start_after:
+        return None, None
+    if ":" not in start_after:
+        return start_after, None
+    doc_id, _, chunk_ms = start_after.rpartition(":")
+    return doc_id or None, int(chunk_ms)
+
+def _movement_cursor(doc_id: str | None, chunk_ms: int | None) -> str:
+    return doc_id if chunk_ms is None else f"{doc_id or ''}:{chunk_ms}"
+
+def _iter_point_docs(movements_ref, start_after, since_ms, until_ms, limit, page_size):
+    """
+    Per-point movement documents (one document per GPS fix) ordered by
+    MOVEMENT_TIME_FIELD. Documents without it are not returned until
+    backfill_movement_times has run for the user.
+    """
+    query = movements_ref.order_by(MOVEMENT_TIME_FIELD)
+    if since_ms is not None:
+        query = query.where(filter=firestore.FieldFilter(MOVEMENT_TIME_FIELD, ">=", since_ms))
+    if until_ms is not None:
+        query = query.where(filter=firestore.FieldFilter(MOVEMENT_TIME_FIELD, "<", until_ms))
+
+    cursor = None
+    if start_after:
+        cursor = movements_ref.document(start_after).get()
+        if not cursor.exists:
+            raise LookupError(start_after)
+        if MOVEMENT_TIME_FIELD not in cursor.to_dict():
+            # A cursor handed out before the field was backfilled.
+            ms = movement_codec.point_ms(cursor.to_dict().get("timestamp"))
+            if ms is None:
+                raise LookupError(start_after)
+            cursor = {MOVEMENT_TIME_FIELD: ms}
+
+    remaining = limit
+    while remaining is None or remaining > 0:
+        page_limit = page_size if remaining is None else min(page_size, remaining)
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_limit).stream())
+        for doc in docs:
+            yield {**doc.to_dict(), "id": doc.id}
+        if len(docs) < page_limit:
+            return
+        cursor = docs[-1]
+        if remaining is not None:
+            remaining -= len(docs)
+
+def _iter_chunks(chunks_ref, after_ms, since_ms, until_ms, page_size):
+    """
+    Decoded movement chunks ordered by time, trimmed to points after after_ms
+    and within [since_ms, until_ms). Chunks are aligned to their window, so
+    only windows starting after (lower bound - window) can hold matching points.
+    """
+    window_ms = movement_codec.MOVEMENT_CHUNK_SECONDS * 1000
+    query = chunks_ref.order_by("start_ms")
+    lower = max((ms for ms in (after_ms, since_ms) if ms is not None), default=None)
+    if lower is not None:
+        query = query.where(filter=firestore.FieldFilter("start_ms", ">", lower - window_ms))
+    if until_ms is not None:
+        query = query.where(filter=firestore.FieldFilter("start_ms", "<", until_ms))
+
+    cursor = None
+    while True:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream())
+        for doc in docs:
+            chunk = movement_codec.decode_chunk(doc.to_dict())
+            mask = np.ones(len(chunk), dtype=bool)
+            if after_ms is not None:
+                mask &= chunk.t_ms > after_ms
+            if since_ms is not None:
+                mask &= chunk.t_ms >= since_ms
+            if until_ms is not None:
+                mask &= chunk.t_ms < until_ms
+            if mask.any():
+                yield chunk if mask.all() else chunk.select(mask)
+        if len(docs) < page_size:
+            return
+        cursor = docs[-1]
+
+def _iter_chunk_points(chunks_ref, after_ms, since_ms, until_ms, limit, page_size):
+    remaining = limit
+    for chunk in _iter_chunks(chunks_ref, after_ms, since_ms, until_ms, page_size):
+        points = movement_codec.to_points(chunk)
+        if remaining is not None:
+            points = points[:remaining]
+            remaining -= len(points)
+        yield from points
+        if remaining == 0:
+            return
+
+def iter_user_movements(
+    user_id: str,
+    limit: int | None = None,
+    start_after: str | None = None,
+    since: str | None = None,
+    until: str | None = None,
+    page_size: int = MOVEMENTS_PAGE_SIZE,
+):
+    """
+    Lazily yields a user's movement points ordered by timestamp.
+    Points are read from both storage formats: per-point documents under
+    users/{user_id}/movements (what the app writes) and the compact chunks
+    under users/{user_id}/movement_chunks (add_user_movements), merged by time.
+    Points are read in pages, so memory stays flat no matter how long the
+    history is.
+    Args:
+        user_id: The ID of the user whose movements to read.
+        limit: Maximum number of points to yield (None for all).
+        start_after: The "id" of the last point already seen (cursor).
+        since: Only points with timestamp >= since (ISO-8601 string).
+        until: Only points with timestamp < until (ISO-8601 string).
+        page_size: Documents fetched per Firestore round trip.
+    Yields:
+        Movement dicts, each with a resumable cursor under "id".
+    Raises:
+        The underlying Firestore error if a page cannot be read, so a caller
+        streaming the points can tell a failure from the end of the history.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return
+
+    try:
+        doc_cursor, chunk_cursor = _split_movement_cursor(start_after)
+        since_ms = movement_codec.point_ms(since) if since is not None else None
+        until_ms = movement_codec.point_ms(until) if until is not None else None
+    except ValueError:
+        logger.warning("Invalid movement cursor or time filter for %s: %s", user_id, start_after)
+        return
+
+    try:
+        user_ref = db.collection(USERS_COLLECTION).document(user_id)
+        point_docs = _iter_point_docs(
+            user_ref.collection("movements"), doc_cursor, since_ms, until_ms, limit, page_size
+        )
+        chunk_points = _iter_chunk_points(
+            user_ref.collection(MOVEMENT_CHUNKS_COLLECTION), chunk_cursor, since_ms, until_ms, limit,
+            MOVEMENT_CHUNKS_PAGE_SIZE,
+        )
+        merged = heapq.merge(
+            ((point.pop(MOVEMENT_TIME_FIELD), False, point) for point in point_docs),
+            ((point.pop("t_ms"), True, point) for point in chunk_points),
+            key=lambda keyed: keyed[0],
+        )
+        for n, (ms, chunked, point) in enumerate(merged):
+            if limit is not None and n >= limit:
+                return
+            if chunked:
+                chunk_cursor = ms
+            else:
+                doc_cursor = point["id"]
+            point["id"] = _movement_cursor(doc_cursor, chunk_cursor)
+            yield point
+    except LookupError:
+        logger.warning("Unknown movement cursor %s for %s", start_after, user_id)
+    except Exception as e:
+        logger.error("Error fetching movements for %s: %s", user_id, e)
+        raise
+
+@user_crud_call
+def get_user_movements(user_id: str, **filters):
     """
-    Fetch all movement points for a user from Firebase.
+    Fetch movement points for a user from Firebase.
+    Accepts the same filters as iter_user_movements.
     Returns a list of dicts.
     """
+    return list(iter_user_movements(user_id, **filters))
+
+@user_crud_call
+def get_user_movement_columns(user_id: str, since: str | None = None, until: str | None = None):
+    """
+    Fetch a user's movement points as NumPy columns, ordered by time.
+    Chunks are decoded straight into arrays without building per-point dicts;
+    per-point documents are converted once.
+    Args:
+        user_id: The ID of the user whose movements to read.
+        since, until: Same ISO-8601 filters as iter_user_movements.
+    Returns:
+        A movement_engine.MovementColumns with seconds set (timestamps left empty),
+        ready for movement_engine.summarize / process_movements.
+    """
+    empty = movement_engine.MovementColumns(np.empty(0), np.empty(0), np.empty(0), [], np.empty(0))
+    if not db:
+        logger.error("Database connection not established.")
+        return empty
     try:
-        movements_ref = db.collection("users").document(user_id).collection("movements")
-        docs = movements_ref.stream()
-        movements = [doc.to_dict() for doc in docs]
-        return movements
+        user_ref = db.collection(USERS_COLLECTION).document(user_id)
+        since_ms = movement_codec.point_ms(since) if since is not None else None
+        until_ms = movement_codec.point_ms(until) if until is not None else None
+        chunks = list(_iter_chunks(
+            user_ref.collection(MOVEMENT_CHUNKS_COLLECTION), None, since_ms, until_ms, MOVEMENT_CHUNKS_PAGE_SIZE
+        ))
+        docs = list(_iter_point_docs(
+            user_ref.collection("movements"), None, since_ms, until_ms, None, MOVEMENTS_PAGE_SIZE
+        ))
     except Exception as e:
-        print(f"Error fetching movements for {user_id}: {e}")
-        return []
-    
+        logger.error("Error fetching movements for %s: %s", user_id, e)
+        return empty
+
+    doc_cols = movement_engine.to_columns(docs)
+    doc_seconds = np.array([d[MOVEMENT_TIME_FIELD] for d in docs], dtype=np.float64) / 1000.0
+    seconds = np.concatenate([doc_seconds, *(c.seconds for c in chunks)])
+    order = np.argsort(seconds, kind="stable")
+    return movement_engine.MovementColumns(
+        np.concatenate([doc_cols.latitude, *(c.latitude for c in chunks)])[order],
+        np.concatenate([doc_cols.longitude, *(c.longitude for c in chunks)])[order],
+        np.concatenate([doc_cols.speed_kmh, *(c.speed_mps * 3.6 for c in chunks)])[order],
+        [],
+        seconds[order],
+    )
+
+MOVEMENT_FIELDS = ("latitude", "longitude", "speed_mps", "speed_kmh", "timestamp")
+MOVEMENT_BATCH_MAX_POINTS = 10_000
+# Fastest plausible GPS speed (airliner), in m/s.
+MOVEMENT_MAX_SPEED_MPS = 350.0
+# UTC offsets in use run from UTC-12:00 to UTC+14:00.
+MOVEMENT_UTC_OFFSET_RANGE_MINUTES = (-12 * 60, 14 * 60)
+
+def _movement_column(points: list, field: str, default: float) -> np.ndarray:
+    def value(point):
+        v = point.get(field, default)
+        try:
+            return float(default if v is None else v)
+        except (TypeError, ValueError):
+            return np.nan
+    return np.fromiter((value(p) for p in points), dtype=np.float64, count=len(points))
+
+def validate_movement_points(points: list, utc_offset_minutes: int | None = None) -> tuple[list, list]:
+    """
+    Validates a buffered array of GPS fixes in one pass.
+    Coordinates and speeds are range-checked as NumPy columns; timestamps
+    must be ISO-8601 with a UTC offset ("Z", "+02:00"), unless the batch's
+    utc_offset_minutes says which local time naive ones are in.
+    speed_kmh and speed_mps are derived from each other when one is missing
+    (movement chunks store only speed_mps).
+    Args:
+        points: Movement dicts as sent by the app
+            ({latitude, longitude, speed_mps, speed_kmh, timestamp}).
+        utc_offset_minutes: The client's offset from UTC for naive timestamps.
+    Returns:
+        (valid, rejected): the normalized points (only MOVEMENT_FIELDS kept)
+        and [{"index": i, "error": reason}] for the others.
+    """
+    if not points:
+        return [], []
+    is_dict = np.fromiter((isinstance(p, dict) for p in points), dtype=bool, count=len(points))
+    rows = [p if ok else {} for p, ok in zip(points, is_dict)]
+    lat = _movement_column(rows, "latitude", np.nan)
+    lon = _movement_column(rows, "longitude", np.nan)
+    # Either speed may be omitted; the other one fills it in (0 when both are).
+    mps_missing = np.fromiter((p.get("speed_mps") is None for p in rows), dtype=bool, count=len(rows))
+    kmh_missing = np.fromiter((p.get("speed_kmh") is None for p in rows), dtype=bool, count=len(rows))
+    mps = _movement_column(rows, "speed_mps", 0.0)
+    kmh = _movement_column(rows, "speed_kmh", 0.0)
+    mps = np.where(mps_missing, kmh / 3.6, mps)
+    kmh = np.where(kmh_missing, mps * 3.6, kmh)
+
+    checks = (
+        (~is_dict, "not an object"),
+        (~(np.abs(lat) <= 90), "latitude must be a number in [-90, 90]"),
+        (~(np.abs(lon) <= 180), "longitude must be a number in [-180, 180]"),
+        (~((mps >= 0) & (mps <= MOVEMENT_MAX_SPEED_MPS)), f"speed_mps must be in [0, {MOVEMENT_MAX_SPEED_MPS}]"),
+        (~((kmh >= 0) & (kmh <= MOVEMENT_MAX_SPEED_MPS * 3.6)), "speed_kmh out of range"),
+    )
+    errors = {}
+    for failed, reason in checks:
+        for i in np.flatnonzero(failed).tolist():
+            errors.setdefault(i, reason)
+
+    valid = []
+    for i, point in enumerate(rows):
+        if i in errors:
+            continue
+        timestamp = point.get("timestamp")
+        try:
+            naive = datetime.fromisoformat(timestamp).tzinfo is None
+        except (TypeError, ValueError):
+            errors[i] = "timestamp must be an ISO-8601 string"
+            continue
+        if naive and utc_offset_minutes is None:
+            errors[i] = "timestamp needs a UTC offset (or send utc_offset_minutes with the batch)"
+            continue
+        valid.append({
+            "latitude": lat[i].item(),
+            "longitude": lon[i].item(),
+            "speed_mps": mps[i].item(),
+            "speed_kmh": kmh[i].item(),
+            "timestamp": timestamp,
+        })
+    rejected = [{"index": i, "error": errors[i]} for i in sorted(errors)]
+    return valid, rejected
+
+def _merge_movement_window(chunks_ref, start_ms: int, points, max_retries: int) -> str or None:
+    """
+    Merges one window's new points into its chunk document in a transaction
+    (read, decode, merge, re-encode, write), so concurrent uploads for the
+    same window do not overwrite each other.
+    Retries transient failures with exponential backoff.
+    Returns None on success, otherwise the error message.
+    Raises:
+        ValueError: If max_retries is below 1.
+    """
+    if max_retries < 1:
+        raise ValueError("max_retries must be at least 1 (the first attempt counts)")
+    chunk_ref = chunks_ref.document(movement_codec.chunk_id(start_ms))
+
+    @firestore.transactional
+    def merge_in(transaction):
+        snapshot = chunk_ref.get(transaction=transaction)
+        chunk = points
+        if snapshot.exists:
+            chunk = movement_codec.merge(movement_codec.decode_chunk(snapshot.to_dict()), points)
+        transaction.set(chunk_ref, movement_codec.encode_chunk(chunk, start_ms))
+
+    for attempt in range(1, max_retries + 1):
+        try:
+            merge_in(db.transaction())
+            return None
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                return str(e)
+            time.sleep(0.2 * 2 ** (attempt - 1))
+        except Exception as e:
+            return str(e)
+
+@user_crud_call
+def add_user_movements(
+    user_id: str,
+    points: list,
+    tolerance_m: float = trajectory.MOVEMENT_SIMPLIFY_TOLERANCE_M,
+    utc_offset_minutes: int | None = None,
+    max_retries: int = BATCH_MAX_RETRIES,
+    max_workers: int = BATCH_MAX_WORKERS,
+) -> dict:
+    """
+    Validates a buffered array of movement points and stores the valid ones
+    in the compact chunk format (see database.movement_codec): one document
+    per MOVEMENT_CHUNK_SECONDS window under users/{user_id}/movement_chunks,
+    windows merged concurrently. Re-sent points (same millisecond) replace
+    the stored ones instead of being duplicated.
+    Fixes that carry no information are dropped first (services.trajectory),
+    within tolerance_m of the original distance per stored segment and
+    without changing the max speed.
+    Args:
+        user_id: The ID of the user the points belong to.
+        points: Movement dicts as sent by the app.
+        tolerance_m: Simplification tolerance in metres (0 stores every fix).
+        utc_offset_minutes: The client's offset from UTC, applied to naive
+            timestamps (the app's local time); without it they are rejected.
+        max_retries: Attempts per window, the first one included.
+    Returns:
+        {"written": n, "stored": n, "failed": n, "rejected": [{"index", "error"}]};
+        written counts accepted points, stored those kept after simplification,
+        failed the accepted points whose window could not be written.
+    Raises:
+        ValueError: If max_retries is below 1 or utc_offset_minutes is out of range.
+    """
+    if max_retries < 1:
+        raise ValueError("max_retries must be at least 1 (the first attempt counts)")
+    low, high = MOVEMENT_UTC_OFFSET_RANGE_MINUTES
+    if utc_offset_minutes is not None and not low <= utc_offset_minutes <= high:
+        raise ValueError(f"utc_offset_minutes must be in [{low}, {high}]")
+    valid, rejected = validate_movement_points(points, utc_offset_minutes)
+    if not db:
+        logger.error("Database connection not established.")
+        return {"written": 0, "stored": 0, "failed": len(valid), "rejected": rejected}
+
+    chunks_ref = db.collection(USERS_COLLECTION).document(user_id).collection(MOVEMENT_CHUNKS_COLLECTION)
+    windows, received = {}, {}
+    if valid:
+        points = movement_codec.quantize(valid, utc_offset_minutes)
+        received = {start_ms: len(chunk) for start_ms, chunk in movement_codec.split_windows(points).items()}
+        points = points.select(trajectory.simplify(points.columns(), tolerance_m).keep)
+        windows = movement_codec.split_windows(points)
+    stored = failed = 0
+    if windows:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(windows)))) as pool:
+            merge = lambda item: _merge_movement_window(chunks_ref, item[0], item[1], max_retries)
+            for (start_ms, chunk), error in zip(windows.items(), pool.map(merge, windows.items())):
+                if error:
+                    logger.error("Error writing %s movements for %s: %s", len(chunk), user_id, error)
+                    failed += received[start_ms]
+                else:
+                    stored += len(chunk)
+    written = sum(received.values()) - failed
+    logger.info(
+        "Stored %s of %s movements for %s in %s chunks (%s failed, %s rejected)",
+        stored, written, user_id, len(windows), failed, len(rejected),
+        extra={"user_id": user_id, "written": written, "stored": stored, "failed": failed, "rejected": len(rejected)},
+    )
+    return {"written": written, "stored": stored, "failed": failed, "rejected": rejected}
+
+@user_crud_call
+def backfill_movement_times(user_id: str, page_size: int = BATCH_MAX_WRITES) -> int:
+    """
+    Sets MOVEMENT_TIME_FIELD on a user's per-point movement documents written
+    without it (by older app versions), so time-ordered reads include them.
+    Args:
+        user_id: The ID of the user whose movements to backfill.
+        page_size: Documents read, and at most written, per round trip.
+    Returns:
+        The number of documents updated; points whose timestamp cannot be
+        parsed are logged and left as they are.
+    Raises:
+        The underlying Firestore error if a page cannot be read or written.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return 0
+
+    movements_ref = db.collection(USERS_COLLECTION).document(user_id).collection("movements")
+    query = movements_ref.order_by(FieldPath.document_id())
+    updated = unparseable = 0
+    cursor = None
+    while True:
+        page = query.start_after(cursor) if cursor is not None else query
+        docs = list(page.limit(page_size).stream())
+        batch = db.batch()
+        writes = 0
+        for doc in docs:
+            data = doc.to_dict()
+            if MOVEMENT_TIME_FIELD in data:
+                continue
+            ms = movement_codec.point_ms(data.get("timestamp"))
+            if ms is None:
+                unparseable += 1
+                continue
+            batch.update(doc.reference, {MOVEMENT_TIME_FIELD: ms})
+            writes += 1
+        if writes:
+            batch.commit()
+            updated += writes
+        if len(docs) < page_size:
+            break
+        cursor = docs[-1]
+    if unparseable:
+        logger.warning("%d movements of %s have an unparseable timestamp", unparseable, user_id)
+    return updated
+
+@user_crud_call
+def get_trip_checkpoint(user_id: str) -> dict or None:
+    """
+    Retrieves the incremental trip aggregation checkpoint for a user.
+    Stored at users/{user_id}/aggregates/trip.
+    Returns the checkpoint dict, or None if the user has never been aggregated.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return None
+    try:
+        doc = (
+            db.collection(USERS_COLLECTION)
+              .document(user_id)
+              .collection("aggregates")
+              .document("trip")
+              .get()
+        )
+        return doc.to_dict() if doc.exists else None
+    except Exception as e:
+        logger.error("Error reading trip checkpoint for %s: %s", user_id, e)
+        return None
+
+@user_crud_call
+def save_trip_checkpoint(user_id: str, checkpoint: dict) -> bool:
+    """
+    Overwrites the incremental trip aggregation checkpoint for a user.
+    Returns True if the operation was successful, False otherwise.
+    """
+    if not db:
+        logger.error("Database connection not established.")
+        return False
+    try:
+        (
+            db.collection(USERS_COLLECTION)
+              .document(user_id)
+              .collection("aggregates")
+              .document("trip")
+              .set(checkpoint)
+        )
+        return True
+    except Exception as e:
+        logger.error("Error saving trip checkpoint for %s: %s", user_id, e)
+        return False
+
+@user_crud_call
 def does_user_drive_gas(user_id: str) -> bool:
     """
     Fetch whether a user drives a gas car from Firebase.
@@ -128,5 +926,5 @@ def does_user_drive_gas(user_id: str) -> bool:
             return False
 
     except Exception as e:
-        print(f"Error fetching car for {user_id}: {e}")
+        logger.error("Error fetching car for %s: %s", user_id, e)
         return False
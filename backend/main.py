@@ -170,22 +170,59 @@ async def recalculate_all_emissions():
 # fetched_after_delete = user_crud.get_user(testUser.user_id)
 # print("Fetched after delete:", fetched_after_delete)
 import os
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel, Field
 from uuid import uuid4
 
 load_dotenv()
 
-from database import user_crud
+from services.structured_logging import configure_logging
+
+configure_logging()
+
+from database import user_crud, async_user_crud, job_crud
 
 from services.emission_service import EmissionService
+from services import leaderboard, metrics, recalculation_jobs, trajectory, trip_aggregator, trip_segmenter
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Load the leaderboard index before serving, not inside the first request.
+    await async_user_crud.run_sync(leaderboard.warm_up)
+    yield
 
 app = FastAPI(
     title="CarbonFootPrinters Backend",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Observe each request's latency under its route template (e.g. /users/{user_id})."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.API_REQUEST_SECONDS.labels(
+            request.method, route.path if route else "unmatched", str(status)
+        ).observe(time.perf_counter() - start)
+
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    """Prometheus scrape endpoint (this worker's metrics only)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 @app.get("/")
 def read_root():
     """Simple health check endpoint."""
@@ -203,11 +240,22 @@ class User(BaseModel):
     user_id: str = Field(default_factory = lambda: uuid4().hex)
     notiFlag:bool = False
 
+class MovementBatch(BaseModel):
+    points: list[dict] = Field(..., max_length=user_crud.MOVEMENT_BATCH_MAX_POINTS)
+    # Offset of the phone's clock from UTC, for timestamps sent without one.
+    utc_offset_minutes: Optional[int] = Field(
+        None, ge=user_crud.MOVEMENT_UTC_OFFSET_RANGE_MINUTES[0], le=user_crud.MOVEMENT_UTC_OFFSET_RANGE_MINUTES[1]
+    )
+
+class EmissionEstimateRequest(BaseModel):
+    records: list[dict]
+    drives_gas: bool = True
+
 #endpoints
 @app.post("/users/")
 async def create_user(user: User):
     try:
-        success = user_crud.create_user(user.user_id, user.dict())
+        success = await async_user_crud.create_user(user.user_id, user.dict())
         if success:
             return {"message": "User created successfully", "user": user.dict()}
         raise HTTPException(status_code=500, detail="Failed to create user")
@@ -217,20 +265,114 @@ async def create_user(user: User):
 @app.get("/users/{user_id}")
 async def get_user_info(user_id: str):
     try:
-        user = user_crud.get_user(user_id)
+        user = await async_user_crud.get_user(user_id)
         if user:
             return user
         raise HTTPException(status_code=404, detail="User not found")
     except Exception as e:
         return {"error": f"An error occurred: {e}"}
     
+def _ndjson_error(error: Exception) -> str:
+    # The 200 status is already sent once streaming starts, so a failure is
+    # reported in-band as a final line clients can tell apart from a short history.
+    return json.dumps({"error": f"An error occurred: {error}"}) + "\n"
+
 @app.get("/users/{user_id}/movements")
-async def get_user_movements(user_id: str):
+async def get_user_movements(
+    user_id: str,
+    limit: Optional[int] = Query(None, ge=1),
+    start_after: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """
+    Stream movement points as NDJSON (one JSON object per line), ordered by timestamp.
+    Pass the "id" of the last line as start_after to continue from there.
+    since/until filter on the ISO-8601 timestamp (since inclusive, until exclusive).
+    If reading fails part way, the last line is {"error": ...} instead of a point.
+    """
+    movements = async_user_crud.iter_user_movements(
+        user_id, limit=limit, start_after=start_after, since=since, until=until
+    )
+
+    async def ndjson():
+        try:
+            async for movement in movements:
+                yield json.dumps(movement, default=str) + "\n"
+        except Exception as e:
+            yield _ndjson_error(e)
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.get("/users/{user_id}/trips/segments")
+async def get_user_trip_segments(
+    user_id: str,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+):
+    """
+    Stream the user's trips and stops as NDJSON, each line sent as soon as
+    it is complete (see services.trip_segmenter). Trips carry their own
+    transportation mode; since/until filter the points like /movements.
+    If reading fails part way, the last line is {"error": ...}.
+    """
+    movements = async_user_crud.iter_user_movements(user_id, since=since, until=until)
+    segmenter = trip_segmenter.TripSegmenter()
+
+    async def ndjson():
+        try:
+            async for movement in movements:
+                for segment in segmenter.push(movement):
+                    yield json.dumps(segment, default=str) + "\n"
+        except Exception as e:
+            yield _ndjson_error(e)
+            return
+        for segment in segmenter.flush():
+            yield json.dumps(segment, default=str) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/users/{user_id}/movements/batch")
+async def add_user_movements(
+    user_id: str,
+    batch: MovementBatch,
+    tolerance_m: float = Query(trajectory.MOVEMENT_SIMPLIFY_TOLERANCE_M, ge=0),
+):
+    """
+    Store a buffered array of movement points with a few batched writes.
+    Example body:
+    {
+      "points": [
+        {"latitude": 25.75, "longitude": -80.37, "speed_mps": 1.2, "timestamp": "2025-09-27T22:41:42"}
+      ],
+      "utc_offset_minutes": -240
+    }
+    Timestamps need a UTC offset; naive ones (DateTime.toIso8601String() of a
+    local time) are read in the batch's utc_offset_minutes and rejected without it.
+    Points are packed into one compact chunk document per time window.
+    Invalid points are skipped and listed under "rejected" with their index.
+    Re-sending the same points is safe: a point replaces any stored at the same millisecond.
+    Redundant fixes are simplified away within tolerance_m metres of distance per
+    stored segment (0 keeps every fix); "stored" counts the points kept.
+    """
+    result = await async_user_crud.add_user_movements(
+        user_id, batch.points, tolerance_m=tolerance_m, utc_offset_minutes=batch.utc_offset_minutes
+    )
+    if result["failed"] and not result["written"]:
+        raise HTTPException(status_code=500, detail=f"Failed to store {result['failed']} movements")
+    return result
+
+@app.post("/users/{user_id}/trips/refresh")
+async def refresh_user_trip(user_id: str, reset: bool = False):
+    """
+    Fold movement points recorded since the last refresh into the user's
+    trip checkpoint and return the running summary.
+    Pass reset=true to rebuild the checkpoint from the first point.
+    """
     try:
-        movements = user_crud.get_user_movements(user_id)
-        if not movements:
-            return {"message": "No movement points found", "movements": []}
-        return {"movements": movements}
+        if reset:
+            await async_user_crud.run_sync(trip_aggregator.reset_user_trip, user_id)
+        return await async_user_crud.run_sync(trip_aggregator.refresh_user_trip, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {e}")
 
@@ -245,7 +387,7 @@ async def update_user_info(user_id: str, update_data: dict):
     }
     """
     try:
-        success = user_crud.update_user(user_id, update_data)
+        success = await async_user_crud.update_user(user_id, update_data)
         if success:
             return {"message": "User updated successfully"}
         raise HTTPException(status_code=404, detail="User not found")
@@ -255,7 +397,7 @@ async def update_user_info(user_id: str, update_data: dict):
 @app.delete("/users/{user_id}")
 async def delete_user_info(user_id: str):
     try:
-        success = user_crud.delete_user(user_id)
+        success = await async_user_crud.delete_user(user_id)
         if success:
             return {"message": "User deleted successfully"}
         raise HTTPException(status_code=404, detail="User not found")
@@ -264,19 +406,17 @@ async def delete_user_info(user_id: str):
 
 @app.post("/users/{user_id}/emissions/add")
 async def add_user_emissions(user_id: str, emission: float):
+    """
+    Atomically add emission kg CO₂ to the user's total (single server-side increment,
+    safe against concurrent adds).
+    """
     try:
-        # Fetch current user
-        user = user_crud.get_user(user_id)
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-
-        current_emission = user.get("carbonEmission", 0.0)
-        new_emission = current_emission + emission
-
-        success = user_crud.update_user(user_id, {"carbonEmission": new_emission})
+        success = await async_user_crud.increment_user_field(user_id, "carbonEmission", emission)
         if success:
-            return {"message": f"Added {emission} kg CO₂. Total is now {new_emission} kg."}
-        raise HTTPException(status_code=500, detail="Failed to update emissions")
+            return {"message": f"Added {emission} kg CO₂."}
+        raise HTTPException(status_code=404, detail="User not found")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
     
@@ -288,7 +428,9 @@ async def calculate_user_emission(user_id: str, input_data: dict):
     input_data should contain whatever the agent expects (e.g. activity_id, amount).
     """
     try:
-        updated_user = EmissionService.calculate_and_store_emission(user_id, input_data)
+        updated_user = await async_user_crud.run_sync(
+            EmissionService.calculate_and_store_emission, user_id, input_data
+        )
         return {
             "message": "Carbon emission calculated and stored successfully",
             "user": updated_user
@@ -296,17 +438,105 @@ async def calculate_user_emission(user_id: str, input_data: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {e}")
     
-@app.post("/admin/recalculate_all_emissions")
-async def recalculate_all_emissions():
+@app.post("/emissions/estimate")
+async def estimate_emissions(request: EmissionEstimateRequest):
+    """
+    carbon_emission_kg for a batch of Movement ({"transportation", "distance_km"})
+    and Transaction ({"amount", "category"}) records from the local factor table.
+    Nothing is stored; records no factor matches come back with carbon_emission_kg null.
+    """
+    results = EmissionService.estimate_emissions(request.records, request.drives_gas)
+    return {
+        "results": results,
+        "unclassified": sum(1 for r in results if r["carbon_emission_kg"] is None),
+    }
+
+@app.get("/leaderboard")
+async def get_leaderboard(k: int = Query(10, ge=1, le=500), country: Optional[str] = None):
+    """
+    The k users with the lowest carbonEmission, optionally within one country.
+    Ties share a rank.
+    """
+    board = await async_user_crud.run_sync(leaderboard.get_leaderboard)
+    return {"country": country, "entries": board.top(k, country)}
+
+@app.get("/leaderboard/users/{user_id}")
+async def get_leaderboard_rank(user_id: str, country: Optional[str] = None):
+    """A user's rank on the global (or their country's) leaderboard and the board size."""
+    board = await async_user_crud.run_sync(leaderboard.get_leaderboard)
+    entry = board.rank(user_id, country)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="User not on this leaderboard")
+    return entry
+
+@app.post("/admin/users/{user_id}/movements/backfill_times")
+async def backfill_movement_times(user_id: str):
+    """
+    Add the numeric time field to the user's movement documents written by
+    older app versions, which time-ordered reads skip until then.
+    """
     try:
-        updated_users = EmissionService.recalculate_all_users()
-        return {
-            "message": f"Recalculated emissions for {len(updated_users)} users.",
-            "users": updated_users
-        }
+        updated = await async_user_crud.run_sync(user_crud.backfill_movement_times, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error: {e}")
+    return {"user_id": user_id, "updated": updated}
+
+@app.post("/admin/leaderboard/rebuild")
+async def rebuild_leaderboard():
+    """Reload the leaderboard from Firestore, e.g. after writes made outside the API."""
+    board = await async_user_crud.run_sync(leaderboard.get_leaderboard)
+    await async_user_crud.run_sync(board.rebuild)
+    return {"message": "Leaderboard rebuilt", "users": len(board), "countries": board.countries()}
+
+@app.get("/admin/user_cache/stats")
+async def user_cache_stats():
+    """Hit/miss/eviction counters of the in-process get_user cache."""
+    return async_user_crud.get_user_cache_stats()
+
+@app.post("/admin/recalculate_all_emissions", status_code=202)
+async def recalculate_all_emissions(max_workers: Optional[int] = Query(None, ge=1, le=256)):
+    """
+    Start a background job that recalculates every user's emissions.
+    Returns the job id immediately; poll GET /admin/jobs/{job_id} for progress.
+    """
+    try:
+        job_id = await async_user_crud.run_sync(recalculation_jobs.start_job, max_workers=max_workers)
+        return {"message": "Recalculation job started", "job_id": job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Batch error: {e}")
 
+@app.get("/admin/jobs/{job_id}")
+async def get_job_progress(job_id: str):
+    """Status, checkpoint cursor and processed/succeeded/failed counters of a job."""
+    job = await async_user_crud.run_sync(recalculation_jobs.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/admin/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    """Stream the per-user results of a job as NDJSON."""
+    def ndjson():
+        for user_id, result in job_crud.iter_job_results(job_id):
+            yield json.dumps({"user_id": user_id, **result}, default=str) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@app.post("/admin/jobs/{job_id}/resume")
+async def resume_job(job_id: str):
+    """Resume a stopped or failed job from its last checkpoint."""
+    job = await async_user_crud.run_sync(recalculation_jobs.resume_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.post("/admin/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """Stop a job running in this process after its current page."""
+    if not recalculation_jobs.cancel_job(job_id):
+        raise HTTPException(status_code=404, detail="Job is not running in this process")
+    return {"message": "Cancellation requested", "job_id": job_id}
+
 
 
 
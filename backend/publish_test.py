@@ -1,11 +1,14 @@
 # backend/publish_test.py
-import json
 from google.cloud import pubsub_v1
 
+from services.event_publisher import EventPublisher
+
 PROJECT = "carbonfootprinters"
 TOPIC = "pinger"       # not subscription; publish to topic
-publisher = pubsub_v1.PublisherClient()
-topic_path = publisher.topic_path(PROJECT, TOPIC)
+topic_path = pubsub_v1.PublisherClient.topic_path(PROJECT, TOPIC)
+publisher = EventPublisher(topic_path, ordering=True)
+
+USER_ID = "<firebase-uid>"  # ordering key: unique and stable, unlike the display name
 
 payload = {
   "fcm_token": "<device-fcm-token>",
@@ -14,5 +17,7 @@ payload = {
   "user_name": "Alex"
 }
 
-future = publisher.publish(topic_path, json.dumps(payload).encode("utf-8"))
-print("Published message id:", future.result())
\ No newline at end of file
+# Events for the same user keep their order; results are collected on flush.
+publisher.publish(payload, ordering_key=USER_ID)
+print("Publish results:", publisher.flush())
+publisher.close()
@@ -1,7 +1,26 @@
-"""Minimal Pub/Sub -> ADK -> FCM listener.
+"""
+Pub/Sub subscriber loop that receives JSON messages, uses an ADK agent
+to generate a short notification text, and sends the text to a Flutter app
+via Firebase Cloud Messaging (FCM).
+
+Messages go through two stages with their own worker pools and bounded
+queues: agent text generation, then FCM delivery. The FCM stage collects
+notifications into micro-batches sent with messaging.send_each, and maps
+each per-token result back to its Pub/Sub message. Pub/Sub flow control
+caps how many messages (and bytes) are outstanding at once, so a burst of
+slow agent calls or FCM retries fills the queues and pauses the stream
+instead of piling up leases.
+
+Ack/nack outcomes, agent latency, FCM results and queue depths are
+exported as Prometheus metrics on --metrics-port (LISTENER_METRICS_PORT).
+
+Usage:
+  python backend/pubsub_listener.py [projects/PROJECT/subscriptions/SUB] [--dry-run]
+      [--max-messages N] [--max-bytes N] [--callback-workers N]
+      [--agent-workers N] [--fcm-workers N] [--fcm-batch-size N] [--fcm-batch-wait-ms MS]
+      [--metrics-port PORT]
 
-This is a compact, single-file subscriber you can run locally. Use --dry-run
-to test without installing or configuring firebase_admin.
+The script supports a --dry-run flag so you can test without firebase_admin.
 """
 from __future__ import annotations
 
@@ -9,830 +28,463 @@ import argparse
 import json
 import logging
 import os
+import threading
 import time
-from typing import Any, Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from google.cloud import pubsub_v1
+from google.cloud.pubsub_v1.subscriber.scheduler import ThreadScheduler
 from dotenv import load_dotenv
 
+from services.agent_invoker import AgentInvoker, resolve_agent_invoker
+from services import metrics
+from services.event_publisher import decode_payload
+from services.notification_cache import NotificationTextCache
+from services.pipeline import MicroBatcher, Stage
+from services.retry_scheduler import RETRY_MAX_ATTEMPTS, JsonlDeadLetterSink, RetryScheduler, backoff_delay
+from services.structured_logging import configure_logging, mask_token
+
 load_dotenv()
 
 logger = logging.getLogger("pubsub_listener")
-logging.basicConfig(level=logging.INFO)
-
-
-def _local_format(payload: Dict[str, Any]) -> str:
-    ev = payload.get("event", {}) if isinstance(payload.get("event"), dict) else payload
+# Per-message INFO events, sampled via LOG_SAMPLE_RATES (see structured_logging).
+message_logger = logging.getLogger("pubsub_listener.messages")
+configure_logging()
+
+# Outstanding (leased, not yet acked) messages and bytes across both stages.
+MAX_MESSAGES = int(os.getenv("LISTENER_MAX_MESSAGES", "1000"))
+MAX_BYTES = int(os.getenv("LISTENER_MAX_BYTES", str(100 * 1024 * 1024)))
+# Threads running the subscriber callback (decode + enqueue only).
+CALLBACK_WORKERS = int(os.getenv("LISTENER_CALLBACK_WORKERS", "4"))
+# Agent calls are slow and mostly waiting on the model; FCM workers each
+# send one batch at a time.
+AGENT_WORKERS = int(os.getenv("LISTENER_AGENT_WORKERS", "32"))
+FCM_WORKERS = int(os.getenv("LISTENER_FCM_WORKERS", "4"))
+# Notifications are sent with messaging.send_each in micro-batches: a batch
+# goes out once it holds FCM_BATCH_SIZE messages or FCM_BATCH_WAIT_MS after
+# its first message, whichever comes first. send_each takes at most 500.
+FCM_MAX_BATCH = 500
+FCM_BATCH_SIZE = min(int(os.getenv("LISTENER_FCM_BATCH_SIZE", "500")), FCM_MAX_BATCH)
+FCM_BATCH_WAIT_MS = float(os.getenv("LISTENER_FCM_BATCH_WAIT_MS", "50"))
+# Notifications that failed permanently or ran out of retries are appended here.
+DEAD_LETTER_PATH = os.getenv("LISTENER_DEAD_LETTER_PATH", "dead_letter.jsonl")
+# Side port serving Prometheus /metrics; 0 disables it.
+METRICS_PORT = int(os.getenv("LISTENER_METRICS_PORT", "8001"))
+# How often pipeline stats (queues, agent latency, text cache hit ratio) are logged; 0 disables.
+STATS_INTERVAL = float(os.getenv("LISTENER_STATS_INTERVAL", "60"))
+
+FALLBACK_TEXT = "You have a new carbon report — open the app to view details."
+
+# Agent modules tried in order; the first one that imports is used for the
+# lifetime of the process.
+AGENT_MODULES = ("backend.agents.notification_agent.agent", "backend.agents.coach_agent.agent")
+AGENT_TIMEOUT = float(os.getenv("LISTENER_AGENT_TIMEOUT", "30"))
+WARM_UP_PAYLOAD = {"event": {"saved_kg": 1.0, "summary": "Warm-up"}, "user_name": "You"}
+
+_firebase_lock = threading.Lock()
+_agent_lock = threading.Lock()
+_agent_invoker: Optional[AgentInvoker] = None
+_agent_resolved = False
+# Agent text per normalized event (see services.notification_cache).
+text_cache = NotificationTextCache()
+metrics.TEXT_CACHE_HIT_RATIO.set_function(lambda: text_cache.stats()["hit_ratio"])
+
+
+def _local_format(p: Dict[str, Any]) -> str:
+    ev = p.get("event", {}) if isinstance(p.get("event"), dict) else p
     saved = ev.get("saved_kg") or ev.get("emission_saved") or ev.get("saved")
-    user = payload.get("user_name") or ev.get("user_name") or "You"
+    user = p.get("user_name") or ev.get("user_name") or "You"
     if saved is not None:
         return f"{user}: You saved {saved} kg CO2 today — great job!"
     summary = ev.get("summary") or ev.get("message")
-    return (str(summary)[:200]) if summary else "New carbon report available — check the app."
-
-
-def try_run_adk_agent(payload: Dict[str, Any]) -> str:
-    try:
-        try:
-            from backend.agents.notification_agent.agent import root_agent as notification_agent
-        except Exception:
-            try:
-                from backend.agents.coach_agent.agent import root_agent as notification_agent
-            except Exception:
-                notification_agent = None
-
-        if notification_agent is None:
-            return _local_format(payload)
-
-        for method_name in ("run", "respond", "call", "execute", "generate"):
-            method = getattr(notification_agent, method_name, None)
-            if callable(method):
-                result = method(payload)
-                if hasattr(result, "__await__"):
-                    import asyncio
-
-                    result = asyncio.get_event_loop().run_until_complete(result)
-                if isinstance(result, dict):
-                    for k in ("text", "message", "result", "output"):
-                        if k in result:
-                            return str(result[k])[:200]
-                    return str(result)[:200]
-                return str(result)[:200]
-        return _local_format(payload)
-    except Exception:
-        logger.exception("ADK invocation failed; falling back to local formatter")
-        return _local_format(payload)
-
-
-def send_fcm(token: str, title: str, body: str, dry_run: bool = False) -> str:
-    if dry_run:
-        logger.info("DRY RUN FCM -> token=%s title=%s body=%s", token, title, body)
-        print(f"DRY RUN FCM -> token={token} title={title} body={body}")
-        return "DRY_RUN"
-
-    try:
-        import firebase_admin
-        from firebase_admin import credentials, messaging
-    except Exception:
-        raise RuntimeError("firebase_admin is required to send FCM messages")
-
-    if not firebase_admin._apps:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-        if not cred_path:
-            raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-
-    message = messaging.Message(token=token, notification=messaging.Notification(title=title, body=body))
-    return messaging.send(message)
-
-
-def handle_message(dry_run: bool):
-    def _cb(message: pubsub_v1.subscriber.message.Message) -> None:
-        try:
-            payload = json.loads(message.data.decode("utf-8"))
-        except Exception:
-            logger.exception("Invalid message payload; acking")
-            message.ack()
-            return
-
-        fcm_token = payload.get("fcm_token") or (payload.get("notification") or {}).get("fcm_token")
-        if not fcm_token:
-            logger.warning("Missing fcm_token; acking message")
-            message.ack()
-            return
-
-        text = try_run_adk_agent(payload)
-        title = payload.get("title") or "Carbon Footprinter"
-
-        try:
-            send_fcm(fcm_token, title, text, dry_run=dry_run)
-        except Exception:
-            logger.exception("Failed to send FCM")
-        finally:
-            message.ack()
-
-    return _cb
-
-
-def run(subscription: str, dry_run: bool = False) -> None:
-    client = pubsub_v1.SubscriberClient()
-    callback = handle_message(dry_run)
-    future = client.subscribe(subscription, callback=callback)
-    logger.info("Subscribed to %s", subscription)
-    try:
-        future.result()
-    except KeyboardInterrupt:
-        logger.info("Stopping subscriber")
-        future.cancel()
-    except Exception:
-        logger.exception("Subscriber error")
-        future.cancel()
+    if summary:
+        return str(summary)[:200]
+    return "New carbon report available — check the app for details."
 
 
-def main() -> None:
-    p = argparse.ArgumentParser()
-    p.add_argument("subscription", nargs="?", help="projects/PROJECT/subscriptions/SUB")
-    p.add_argument("--dry-run", action="store_true")
-    args = p.parse_args()
-
-    subscription = args.subscription or os.environ.get("PUBSUB_SUBSCRIPTION")
-    if not subscription:
-        raise SystemExit("PUBSUB_SUBSCRIPTION not set and no arg provided")
-
-    run(subscription, dry_run=args.dry_run)
-
-
-if __name__ == "__main__":
-    main()
-"""
-Clean Pub/Sub -> ADK -> FCM listener implementation.
+def init_agent(warm_up: bool = True) -> Optional[AgentInvoker]:
+    """Resolve the ADK agent once per process and optionally warm it up.
 
-This file intentionally minimal: dry-run supported, firebase_admin lazy-imported.
-"""
-from __future__ import annotations
-
-import argparse
-import json
-import logging
-import os
-import time
-from typing import Any, Dict
-
-from google.cloud import pubsub_v1
-from dotenv import load_dotenv
-
-load_dotenv()
-
-logger = logging.getLogger("pubsub_listener")
-logging.basicConfig(level=logging.INFO)
+    Returns None (and the local formatter is used) when no agent is available.
+    """
+    global _agent_invoker, _agent_resolved
+    # Every message calls this; once resolved, skip the lock (_agent_invoker is set before the flag).
+    if _agent_resolved and not warm_up:
+        return _agent_invoker
+    with _agent_lock:
+        if not _agent_resolved:
+            _agent_invoker = resolve_agent_invoker(AGENT_MODULES, timeout=AGENT_TIMEOUT)
+            _agent_resolved = True
+            if _agent_invoker is None:
+                logger.info("No ADK agent available; using local formatter")
+            elif warm_up:
+                _agent_invoker.warm_up(WARM_UP_PAYLOAD)
+        return _agent_invoker
+
+
+def set_agent_invoker(invoker: Optional[AgentInvoker]) -> None:
+    """Use this invoker instead of resolving AGENT_MODULES (benchmarks, local runs)."""
+    global _agent_invoker, _agent_resolved
+    with _agent_lock:
+        _agent_invoker = invoker
+        _agent_resolved = True
 
 
 def try_run_adk_agent(payload: Dict[str, Any]) -> str:
-    """Call in-repo ADK agent or fall back to a local formatter."""
-    def local_format(p: Dict[str, Any]) -> str:
-        ev = p.get("event", {}) if isinstance(p.get("event"), dict) else p
-        saved = ev.get("saved_kg") or ev.get("emission_saved") or ev.get("saved")
-        user = p.get("user_name") or ev.get("user_name") or "You"
-        if saved is not None:
-            return f"{user}: You saved {saved} kg CO2 today — great job!"
-        summary = ev.get("summary") or ev.get("message")
-        return (str(summary)[:200]) if summary else "New carbon report available — check the app."
+    """Run the ADK agent resolved at startup to generate a short notification.
 
+    Identical events share one agent call through text_cache.
+    Falls back to a local formatter if agent is not available or fails.
+    """
+    invoker = init_agent(warm_up=False)
+    if invoker is None:
+        return _local_format(payload)
     try:
-        try:
-            from backend.agents.notification_agent.agent import root_agent as notification_agent
-        except Exception:
-            try:
-                from backend.agents.coach_agent.agent import root_agent as notification_agent
-            except Exception:
-                notification_agent = None
-
-        if notification_agent is None:
-            return local_format(payload)
-
-        for method_name in ("run", "respond", "call", "execute", "generate"):
-            method = getattr(notification_agent, method_name, None)
-            if callable(method):
-                try:
-                    result = method(payload)
-                    if hasattr(result, "__await__"):
-                        import asyncio
-
-                        result = asyncio.get_event_loop().run_until_complete(result)
-                    if isinstance(result, dict):
-                        for k in ("text", "message", "result", "output"):
-                            if k in result:
-                                return str(result[k])[:200]
-                        return str(result)[:200]
-                    return str(result)[:200]
-                except Exception:
-                    logger.exception("ADK agent method %s failed", method_name)
-
-        return local_format(payload)
+        return text_cache.get_or_generate(payload, invoker)
     except Exception:
-        logger.exception("ADK invocation failed; using local formatter")
-        return local_format(payload)
-
+        logger.exception("ADK agent %s.%s failed, using local formatter", invoker.module, invoker.method_name)
+        return _local_format(payload)
 
-def send_fcm(token: str, title: str, body: str, dry_run: bool = False, max_retries: int = 3) -> str:
-    if dry_run:
-        logger.info("DRY RUN: FCM -> token=%s title=%s body=%s", token, title, body)
-        print(f"DRY RUN FCM -> token={token} title={title} body={body}")
-        return "DRY_RUN"
 
+def _messaging():
+    """Import firebase_admin.messaging and initialize the default app on first use."""
+    # Lazy import firebase_admin to avoid hard dependency in dry-run tests
     try:
         import firebase_admin
         from firebase_admin import credentials, messaging
-    except Exception:
-        raise RuntimeError("firebase_admin is required to send FCM messages")
-
-    if not firebase_admin._apps:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-        if not cred_path:
-            raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-
-    message = messaging.Message(token=token, notification=messaging.Notification(title=title, body=body))
-
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            msg_id = messaging.send(message)
-            logger.info("FCM sent, id=%s", msg_id)
-            return msg_id
-        except Exception:
-            logger.exception("FCM send failed (attempt %d)", attempt)
-            last_exc = Exception("fcm-failed")
-            time.sleep(attempt)
-    raise last_exc
-
-
-def handle_message(dry_run: bool):
-    def _cb(message: pubsub_v1.subscriber.message.Message) -> None:
-        try:
-            payload = json.loads(message.data.decode("utf-8"))
-        except Exception:
-            logger.exception("Invalid message payload")
-            message.ack()
-            return
-
-        fcm_token = payload.get("fcm_token") or (payload.get("notification") or {}).get("fcm_token")
-        if not fcm_token:
-            logger.warning("Missing fcm_token; acking message")
-            message.ack()
-            return
-
-        text = try_run_adk_agent(payload)
-        title = payload.get("title") or "Carbon Footprinter"
-
-        try:
-            send_fcm(fcm_token, title, text, dry_run=dry_run)
-        except Exception:
-            logger.exception("Failed to send FCM")
-        finally:
-            message.ack()
-
-    return _cb
-
-
-def run(subscription: str, dry_run: bool = False) -> None:
-    client = pubsub_v1.SubscriberClient()
-    callback = handle_message(dry_run)
-    future = client.subscribe(subscription, callback=callback)
-    logger.info("Subscribed to %s", subscription)
-    try:
-        future.result()
-    except KeyboardInterrupt:
-        logger.info("Stopping subscriber")
-        future.cancel()
-    except Exception:
-        logger.exception("Subscriber error")
-        future.cancel()
-
-
-def main() -> None:
-    p = argparse.ArgumentParser()
-    p.add_argument("subscription", nargs="?", help="projects/PROJECT/subscriptions/SUB")
-    p.add_argument("--dry-run", action="store_true")
-    args = p.parse_args()
-
-    subscription = args.subscription or os.environ.get("PUBSUB_SUBSCRIPTION")
-    if not subscription:
-        raise SystemExit("PUBSUB_SUBSCRIPTION not set and no arg provided")
-
-    run(subscription, dry_run=args.dry_run)
-
-
-if __name__ == "__main__":
-    main()
-"""
-Pub/Sub -> ADK -> FCM listener (clean single-file implementation).
-
-Run with --dry-run to avoid requiring firebase_admin during testing.
-"""
-from __future__ import annotations
-
-import argparse
-import json
-import logging
-import os
-import time
-from typing import Any, Dict
-
-from google.cloud import pubsub_v1
-from dotenv import load_dotenv
-
-load_dotenv()
+    except Exception as e:
+        raise RuntimeError("firebase_admin is required to send FCM messages") from e
 
-logger = logging.getLogger("pubsub_listener")
-logging.basicConfig(level=logging.INFO)
+    # FCM workers race to initialize the default app on the first messages.
+    with _firebase_lock:
+        if not firebase_admin._apps:
+            cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
+            if not cred_path:
+                raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
+            cred = credentials.Certificate(cred_path)
+            firebase_admin.initialize_app(cred)
+            logger.info("Initialized Firebase Admin SDK using %s", cred_path)
+    return messaging
 
 
-def try_run_adk_agent(payload: Dict[str, Any]) -> str:
-    """Attempt to call an ADK agent in the repo to generate a short message.
+def send_fcm(token: str, title: str, body: str, dry_run: bool = False) -> str:
+    """Send a notification via FCM. If dry_run is True, only log the message.
 
-    If the ADK agent isn't available or fails, return a local formatted message.
+    Makes a single attempt; failed sends are retried by the pipeline's
+    RetryScheduler rather than by sleeping here.
     """
-    def local_format(p: Dict[str, Any]) -> str:
-        ev = p.get("event", {}) if isinstance(p.get("event"), dict) else p
-        saved = ev.get("saved_kg") or ev.get("emission_saved") or ev.get("saved")
-        user = p.get("user_name") or ev.get("user_name") or "You"
-        if saved is not None:
-            return f"{user}: You saved {saved} kg CO2 today — great job!"
-        summary = ev.get("summary") or ev.get("message")
-        return (str(summary)[:200]) if summary else "New carbon report available — check the app."
-
-    try:
-        try:
-            from backend.agents.notification_agent.agent import root_agent as notification_agent
-        except Exception:
-            try:
-                from backend.agents.coach_agent.agent import root_agent as notification_agent
-            except Exception:
-                notification_agent = None
-
-        if notification_agent is None:
-            return local_format(payload)
-
-        for method_name in ("run", "respond", "call", "execute", "generate"):
-            method = getattr(notification_agent, method_name, None)
-            if callable(method):
-                try:
-                    result = method(payload)
-                    if hasattr(result, "__await__"):
-                        import asyncio
-
-                        result = asyncio.get_event_loop().run_until_complete(result)
-                    if isinstance(result, dict):
-                        for k in ("text", "message", "result", "output"):
-                            if k in result:
-                                return str(result[k])[:200]
-                        return str(result)[:200]
-                    return str(result)[:200]
-                except Exception:
-                    logger.exception("ADK agent method %s failed", method_name)
-
-        return local_format(payload)
-    except Exception:
-        logger.exception("Error invoking ADK agent; using fallback")
-        return local_format(payload)
-
-
-def send_fcm(token: str, title: str, body: str, dry_run: bool = False, max_retries: int = 3) -> str:
     if dry_run:
-        logger.info("DRY RUN: FCM -> token=%s title=%s body=%s", token, title, body)
-        print(f"DRY RUN FCM -> token={token} title={title} body={body}")
+        message_logger.info("DRY RUN: FCM -> title=%s body=%s", title, body)
         return "DRY_RUN"
 
-    try:
-        import firebase_admin
-        from firebase_admin import credentials, messaging
-    except Exception:
-        raise RuntimeError("firebase_admin is required to send FCM messages")
-
-    if not firebase_admin._apps:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-        if not cred_path:
-            raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-
-    message = messaging.Message(token=token, notification=messaging.Notification(title=title, body=body))
-
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            msg_id = messaging.send(message)
-            logger.info("FCM sent, id=%s", msg_id)
-            return msg_id
-        except Exception:
-            logger.exception("FCM send failed (attempt %d)", attempt)
-            last_exc = Exception("fcm-failed")
-            time.sleep(attempt)
-    raise last_exc
-
-
-def handle_message(dry_run: bool):
-    def _cb(message: pubsub_v1.subscriber.message.Message) -> None:
-        try:
-            payload = json.loads(message.data.decode("utf-8"))
-        except Exception:
-            logger.exception("Invalid message payload")
-            message.ack()
-            return
-
-        fcm_token = payload.get("fcm_token") or (payload.get("notification") or {}).get("fcm_token")
-        if not fcm_token:
-            logger.warning("Missing fcm_token; acking message")
-            message.ack()
-            return
-
-        text = try_run_adk_agent(payload)
-        title = payload.get("title") or "Carbon Footprinter"
-
-        try:
-            send_fcm(fcm_token, title, text, dry_run=dry_run)
-        except Exception:
-            logger.exception("Failed to send FCM")
-        finally:
-            message.ack()
-
-    return _cb
-
-
-def run(subscription: str, dry_run: bool = False) -> None:
-    client = pubsub_v1.SubscriberClient()
-    callback = handle_message(dry_run)
-    future = client.subscribe(subscription, callback=callback)
-    logger.info("Subscribed to %s", subscription)
-    try:
-        future.result()
-    except KeyboardInterrupt:
-        logger.info("Stopping subscriber")
-        future.cancel()
-    except Exception:
-        logger.exception("Subscriber error")
-        future.cancel()
-
+    messaging = _messaging()
+    message = messaging.Message(
+        token=token,
+        notification=messaging.Notification(title=title, body=body),
+    )
+    msg_id = messaging.send(message)
+    logger.info("FCM message sent: %s", msg_id)
+    return msg_id
 
-def main() -> None:
-    p = argparse.ArgumentParser()
-    p.add_argument("subscription", nargs="?", help="projects/PROJECT/subscriptions/SUB")
-    p.add_argument("--dry-run", action="store_true")
-    args = p.parse_args()
 
-    subscription = args.subscription or os.environ.get("PUBSUB_SUBSCRIPTION")
-    if not subscription:
-        raise SystemExit("PUBSUB_SUBSCRIPTION not set and no arg provided")
+def send_fcm_batch(notifications: List[Tuple[str, str, str]]) -> list:
+    """
+    Send up to FCM_MAX_BATCH (token, title, body) notifications in one
+    messaging.send_each call. Returns one SendResponse per notification,
+    in order; check .success and .exception on each.
+    """
+    messaging = _messaging()
+    messages = [
+        messaging.Message(token=token, notification=messaging.Notification(title=title, body=body))
+        for token, title, body in notifications
+    ]
+    response = messaging.send_each(messages)
+    logger.info("FCM batch sent: %d ok, %d failed", response.success_count, response.failure_count)
+    return response.responses
 
-    run(subscription, dry_run=args.dry_run)
 
+def is_retryable_fcm_error(exc: Optional[BaseException]) -> bool:
+    """True for transient failures (throttling, server errors, timeouts, network errors).
 
-if __name__ == "__main__":
-    main()
+    Any other Firebase error (unregistered or invalid token, bad message,
+    auth) fails the same way on every attempt.
+    """
+    from firebase_admin import exceptions, messaging
 
-"""
-Pub/Sub subscriber loop that receives JSON messages, uses an ADK agent
-to generate a short notification text, and sends the text to a Flutter app
-via Firebase Cloud Messaging (FCM).
+    if isinstance(exc, (messaging.QuotaExceededError, exceptions.ResourceExhaustedError,
+                        exceptions.UnavailableError, exceptions.InternalError,
+                        exceptions.DeadlineExceededError, exceptions.UnknownError)):
+        return True
+    return not isinstance(exc, exceptions.FirebaseError)
 
-Usage:
-  python backend/pubsub_listener.py [projects/PROJECT/subscriptions/SUB] [--dry-run]
 
-The script supports a --dry-run flag so you can test without firebase_admin.
-"""
-from __future__ import annotations
+def _ack(message: pubsub_v1.subscriber.message.Message, reason: str) -> None:
+    message.ack()
+    metrics.LISTENER_MESSAGES.labels("ack", reason).inc()
 
-import argparse
-import json
-import logging
-import os
-import time
-from typing import Any, Dict
 
-from google.cloud import pubsub_v1
-from dotenv import load_dotenv
+def _nack(message: pubsub_v1.subscriber.message.Message, reason: str) -> None:
+    message.nack()
+    metrics.LISTENER_MESSAGES.labels("nack", reason).inc()
 
-load_dotenv()
 
-logger = logging.getLogger("pubsub_listener")
-logging.basicConfig(level=logging.INFO)
+@dataclass
+class Notification:
+    """A Pub/Sub message on its way through the pipeline."""
 
+    message: pubsub_v1.subscriber.message.Message
+    payload: Dict[str, Any]
+    fcm_token: str
+    title: str
+    text: Optional[str] = None
+    attempts: int = 0
 
-def try_run_adk_agent(payload: Dict[str, Any]) -> str:
-    """Try to run the ADK agent in the repo to generate a short notification.
 
-    Falls back to a local formatter if agent is not available or fails.
+class NotificationPipeline:
+    """
+    Subscriber callback that hands each message to the agent stage, which
+    hands the generated text to the FCM batcher. The callback itself only
+    parses the message, so the subscriber's threads never block on the
+    agent or on FCM.
     """
-    def local_format(p: Dict[str, Any]) -> str:
-        ev = p.get("event", {}) if isinstance(p.get("event"), dict) else p
-        saved = ev.get("saved_kg") or ev.get("emission_saved") or ev.get("saved")
-        user = p.get("user_name") or ev.get("user_name") or "You"
-        if saved is not None:
-            return f"{user}: You saved {saved} kg CO2 today — great job!"
-        summary = ev.get("summary") or ev.get("message")
-        if summary:
-            return str(summary)[:200]
-        return "New carbon report available — check the app for details."
-
-    try:
-        try:
-            from backend.agents.notification_agent.agent import root_agent as notification_agent
-        except Exception:
-            try:
-                from backend.agents.coach_agent.agent import root_agent as notification_agent
-            except Exception:
-                notification_agent = None
-
-        if notification_agent is None:
-            logger.debug("No ADK agent imported; using local formatter")
-            return local_format(payload)
-
-        for method_name in ("run", "respond", "call", "execute", "generate"):
-            method = getattr(notification_agent, method_name, None)
-            if callable(method):
-                logger.info("Calling ADK agent method: %s", method_name)
-                try:
-                    result = method(payload)
-                    if hasattr(result, "__await__"):
-                        import asyncio
-
-                        result = asyncio.get_event_loop().run_until_complete(result)
-                    if isinstance(result, dict):
-                        for k in ("text", "message", "result", "output"):
-                            if k in result:
-                                return str(result[k])[:200]
-                        return str(result)[:200]
-                    return str(result)[:200]
-                except Exception:
-                    logger.exception("ADK agent method %s failed", method_name)
-
-        logger.debug("Agent present but no supported method succeeded; using local formatter")
-        return local_format(payload)
-    except Exception:
-        logger.exception("ADK check failed, using local formatter")
-        return local_format(payload)
-
-
-def send_fcm(token: str, title: str, body: str, dry_run: bool = False, max_retries: int = 3) -> str:
-    """Send a notification via FCM. If dry_run is True, only print the message."""
-    if dry_run:
-        logger.info("DRY RUN: FCM -> token=%s title=%s body=%s", token, title, body)
-        print(f"DRY RUN FCM -> token={token} title={title} body={body}")
-        return "DRY_RUN"
-
-    # Lazy import firebase_admin to avoid hard dependency in dry-run tests
-    try:
-        import firebase_admin
-        from firebase_admin import credentials, messaging
-    except Exception as e:
-        raise RuntimeError("firebase_admin is required to send FCM messages") from e
-
-    if not firebase_admin._apps:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-        if not cred_path:
-            raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        logger.info("Initialized Firebase Admin SDK using %s", cred_path)
-
-    message = messaging.Message(
-        token=token,
-        notification=messaging.Notification(title=title, body=body),
-    )
-
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            msg_id = messaging.send(message)
-            logger.info("FCM message sent: %s", msg_id)
-            return msg_id
-        except Exception:
-            logger.exception("FCM send attempt %d failed", attempt)
-            last_exc = Exception("fcm-send-failed")
-            time.sleep(attempt)
-    raise last_exc
-
-
-def handle_message(dry_run: bool):
-    """Return a callback capturing dry_run flag for Pub/Sub subscriber."""
 
-    def _callback(message: pubsub_v1.subscriber.message.Message) -> None:
+    def __init__(
+        self,
+        dry_run: bool,
+        agent_workers: int,
+        fcm_workers: int,
+        queue_size: int,
+        fcm_batch_size: int = FCM_BATCH_SIZE,
+        fcm_batch_wait_ms: float = FCM_BATCH_WAIT_MS,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        dead_letter: Optional[Callable[[dict], None]] = None,
+    ):
+        self.dry_run = dry_run
+        self.max_attempts = max_attempts
+        self.dead_letter = dead_letter or JsonlDeadLetterSink(DEAD_LETTER_PATH)
+        self.dead_lettered = 0
+        # Failed sends wait here, holding no thread, until their backoff is over.
+        self.retries = RetryScheduler(self._resubmit, name="fcm-retry")
+        self.fcm_stage = MicroBatcher(
+            "fcm", self._deliver, min(fcm_batch_size, FCM_MAX_BATCH), fcm_batch_wait_ms / 1000,
+            fcm_workers, queue_size, on_error=self._failed_batch,
+        )
+        self.agent_stage = Stage("agent", self._generate, agent_workers, queue_size, on_error=self._failed)
+
+    def start(self) -> "NotificationPipeline":
+        self.retries.start()
+        self.fcm_stage.start()
+        self.agent_stage.start()
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Drain the agent stage first so everything it produces still gets delivered.
+
+        Notifications still waiting for a retry are nacked for Pub/Sub to redeliver.
+        """
+        self.agent_stage.stop(timeout)
+        for notification in self.retries.stop():
+            _nack(notification.message, "shutdown")
+        self.fcm_stage.stop(timeout)
+
+    def stats(self) -> dict:
+        invoker = init_agent(warm_up=False)
+        return {
+            "agent": self.agent_stage.stats(),
+            "agent_latency": invoker.stats() if invoker else None,
+            "text_cache": text_cache.stats(),
+            "fcm": self.fcm_stage.stats(),
+            "fcm_retries": {**self.retries.stats(), "dead_lettered": self.dead_lettered},
+        }
+
+    def __call__(self, message: pubsub_v1.subscriber.message.Message) -> None:
         try:
-            data = message.data.decode("utf-8")
-            logger.info("Received message: %s", data)
+            data = decode_payload(message.data, message.attributes)
+            # Redacted and truncated by the log handler; the raw payload is only logged at DEBUG.
+            message_logger.info("Received message %s (%d bytes)", message.message_id, len(data))
+            message_logger.debug("Message payload: %s", data)
             payload = json.loads(data)
         except Exception:
             logger.exception("Failed to decode/parse Pub/Sub message")
-            message.ack()
+            _ack(message, "invalid_payload")
             return
 
         fcm_token = payload.get("fcm_token") or (payload.get("notification") or {}).get("fcm_token")
         if not fcm_token:
             logger.warning("Message missing fcm_token; dropping: %s", payload)
-            message.ack()
+            _ack(message, "missing_token")
             return
 
+        title = payload.get("title") or "Carbon Footprinter"
+        self.agent_stage.put(Notification(message, payload, fcm_token, title))
+
+    def _generate(self, notification: Notification) -> None:
         try:
-            notif_text = try_run_adk_agent(payload)
+            notification.text = try_run_adk_agent(notification.payload)
         except Exception:
             logger.exception("ADK agent failed, using fallback text")
-            notif_text = "You have a new carbon report — open the app to view details."
-
-        title = payload.get("title") or "Carbon Footprinter"
+            notification.text = FALLBACK_TEXT
+        self.fcm_stage.put(notification)
+
+    def _deliver(self, batch: List[Notification]) -> None:
+        if self.dry_run:
+            for notification in batch:
+                send_fcm(notification.fcm_token, notification.title, notification.text, dry_run=True)
+                _ack(notification.message, "dry_run")
+            return
 
+        start = time.perf_counter()
+        responses = send_fcm_batch([(n.fcm_token, n.title, n.text) for n in batch])
+        metrics.FCM_BATCH_SECONDS.observe(time.perf_counter() - start)
+        for notification, response in zip(batch, responses):
+            notification.attempts += 1
+            if response.success:
+                metrics.FCM_SENDS.labels("success").inc()
+                _ack(notification.message, "sent")
+            elif is_retryable_fcm_error(response.exception):
+                metrics.FCM_SENDS.labels("retryable_error").inc()
+                self._retry(notification, response.exception)
+            else:
+                # Retrying cannot fix a stale or invalid token.
+                metrics.FCM_SENDS.labels("permanent_error").inc()
+                self._dead_letter(notification, response.exception)
+
+    def _retry(self, notification: Notification, exc: Optional[BaseException]) -> None:
+        if notification.attempts >= self.max_attempts:
+            self._dead_letter(notification, exc)
+            return
+        delay = backoff_delay(notification.attempts)
+        logger.warning("FCM send to %s failed (attempt %d/%d), retrying in %.2fs: %s",
+                       mask_token(notification.fcm_token), notification.attempts, self.max_attempts, delay, exc)
+        if not self.retries.schedule(notification, delay):
+            # Shutting down: let Pub/Sub redeliver it instead.
+            _nack(notification.message, "shutdown")
+
+    def _resubmit(self, notification: Notification) -> None:
+        self.fcm_stage.put(notification)
+
+    def _dead_letter(self, notification: Notification, exc: Optional[BaseException]) -> None:
+        logger.warning("Dead-lettering notification for %s after %d attempt(s): %s",
+                       mask_token(notification.fcm_token), notification.attempts, exc)
         try:
-            send_fcm(fcm_token, title, notif_text, dry_run=dry_run)
+            self.dead_letter({
+                "message_id": notification.message.message_id,
+                "fcm_token": notification.fcm_token,
+                "title": notification.title,
+                "text": notification.text,
+                "payload": notification.payload,
+                "attempts": notification.attempts,
+                "error": f"{type(exc).__name__}: {exc}",
+            })
         except Exception:
-            logger.exception("Failed to send FCM notification")
-        finally:
-            # Ack message to avoid redelivery loops; change if you want retry behavior
-            message.ack()
-
-    return _callback
-
-
-def run(subscription: str, dry_run: bool = False) -> None:
-    logger.info("Starting Pub/Sub subscriber for: %s", subscription)
-    subscriber = pubsub_v1.SubscriberClient()
-    callback = handle_message(dry_run)
-    streaming_pull_future = subscriber.subscribe(subscription, callback=callback)
-    logger.info("Listening for messages on %s...", subscription)
-
-    try:
-        streaming_pull_future.result()
-    except KeyboardInterrupt:
-        logger.info("KeyboardInterrupt received; closing subscriber")
-        streaming_pull_future.cancel()
-    except Exception:
-        logger.exception("Subscriber encountered an error; shutting down")
-        streaming_pull_future.cancel()
-
-
-def main() -> None:
-    parser = argparse.ArgumentParser(description="Pub/Sub listener for sending FCM notifications")
-    parser.add_argument("subscription", nargs="?", help="Full subscription name: projects/PROJECT/subscriptions/SUB")
-    parser.add_argument("--dry-run", action="store_true", help="Do not send FCM, just print what would be sent")
-    args = parser.parse_args()
-
-    subscription = args.subscription or os.environ.get("PUBSUB_SUBSCRIPTION")
-    if not subscription:
-        raise SystemExit("PUBSUB_SUBSCRIPTION not provided as env var or CLI arg")
-
-    run(subscription, dry_run=args.dry_run)
-
-
-if __name__ == "__main__":
-    main()
-"""
-Pub/Sub subscriber loop that receives JSON messages, uses an ADK agent
-to generate a short notification text, and sends the text to a Flutter app
-via Firebase Cloud Messaging (FCM).
+            logger.exception("Dead-letter sink failed; nacking message instead")
+            _nack(notification.message, "dead_letter_failed")
+            return
+        self.dead_lettered += 1
+        _ack(notification.message, "dead_letter")
 
-Usage:
-  python backend/pubsub_listener.py [projects/PROJECT/subscriptions/SUB] [--dry-run]
+    def _failed(self, notification: Notification, exc: Exception) -> None:
+        # Unexpected pipeline error: let Pub/Sub redeliver the message.
+        _nack(notification.message, "pipeline_error")
 
-The script supports a --dry-run flag so you can test without firebase_admin.
-"""
-from __future__ import annotations
+    def _failed_batch(self, batch: List[Notification], exc: Exception) -> None:
+        # The whole send_each call failed. Network and server errors are
+        # retried; anything else (auth, config) is left to Pub/Sub redelivery.
+        metrics.FCM_SENDS.labels("batch_error").inc(len(batch))
+        for notification in batch:
+            if is_retryable_fcm_error(exc):
+                notification.attempts += 1
+                self._retry(notification, exc)
+            else:
+                _nack(notification.message, "fcm_batch_error")
 
-import argparse
-import json
-import logging
-import os
-import time
-from typing import Any, Dict
 
-from google.cloud import pubsub_v1
-from dotenv import load_dotenv
+_pipeline: Optional[NotificationPipeline] = None
+_pipeline_lock = threading.Lock()
 
-load_dotenv()
 
-logger = logging.getLogger("pubsub_listener")
-logging.basicConfig(level=logging.INFO)
+def set_pipeline(pipeline: Optional[NotificationPipeline]) -> None:
+    """Route handle_message to this (started) pipeline, e.g. one sized by run() or a benchmark."""
+    global _pipeline
+    with _pipeline_lock:
+        _pipeline = pipeline
 
 
-def try_run_adk_agent(payload: Dict[str, Any]) -> str:
-    """Try to run the ADK agent in the repo to generate a short notification.
+def handle_message(message: pubsub_v1.subscriber.message.Message) -> None:
+    """Subscriber callback: hand the message to the process-wide pipeline.
 
-    Falls back to a local formatter if agent is not available or fails.
+    Without set_pipeline() a pipeline with the LISTENER_* defaults is started on first use.
     """
-    def local_format(p: Dict[str, Any]) -> str:
-        ev = p.get("event", {}) if isinstance(p.get("event"), dict) else p
-        saved = ev.get("saved_kg") or ev.get("emission_saved") or ev.get("saved")
-        user = p.get("user_name") or ev.get("user_name") or "You"
-        if saved is not None:
-            return f"{user}: You saved {saved} kg CO2 today — great job!"
-        summary = ev.get("summary") or ev.get("message")
-        if summary:
-            return str(summary)[:200]
-        return "New carbon report available — check the app for details."
-
-    try:
-        try:
-            from backend.agents.notification_agent.agent import root_agent as notification_agent
-        except Exception:
-            try:
-                from backend.agents.coach_agent.agent import root_agent as notification_agent
-            except Exception:
-                notification_agent = None
-
-        if notification_agent is None:
-            logger.debug("No ADK agent imported; using local formatter")
-            return local_format(payload)
-
-        for method_name in ("run", "respond", "call", "execute", "generate"):
-            method = getattr(notification_agent, method_name, None)
-            if callable(method):
-                logger.info("Calling ADK agent method: %s", method_name)
-                try:
-                    result = method(payload)
-                    if hasattr(result, "__await__"):
-                        import asyncio
-
-                        result = asyncio.get_event_loop().run_until_complete(result)
-                    if isinstance(result, dict):
-                        for k in ("text", "message", "result", "output"):
-                            if k in result:
-                                return str(result[k])[:200]
-                        return str(result)[:200]
-                    return str(result)[:200]
-                except Exception:
-                    logger.exception("ADK agent method %s failed", method_name)
-
-        logger.debug("Agent present but no supported method succeeded; using local formatter")
-        return local_format(payload)
-    except Exception:
-        logger.exception("ADK check failed, using local formatter")
-        return local_format(payload)
-
-
-def send_fcm(token: str, title: str, body: str, dry_run: bool = False, max_retries: int = 3) -> str:
-    """Send a notification via FCM. If dry_run is True, only print the message."""
-    if dry_run:
-        logger.info("DRY RUN: FCM -> token=%s title=%s body=%s", token, title, body)
-        print(f"DRY RUN FCM -> token={token} title={title} body={body}")
-        return "DRY_RUN"
-
-    # Lazy import firebase_admin to avoid hard dependency in dry-run tests
-    try:
-        import firebase_admin
-        from firebase_admin import credentials, messaging
-    except Exception as e:
-        raise RuntimeError("firebase_admin is required to send FCM messages") from e
-
-    if not firebase_admin._apps:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-        if not cred_path:
-            raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        logger.info("Initialized Firebase Admin SDK using %s", cred_path)
-
-    message = messaging.Message(
-        token=token,
-        notification=messaging.Notification(title=title, body=body),
+    global _pipeline
+    pipeline = _pipeline
+    if pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = NotificationPipeline(False, AGENT_WORKERS, FCM_WORKERS, queue_size=MAX_MESSAGES).start()
+            pipeline = _pipeline
+    pipeline(message)
+
+
+def _log_stats(pipeline: NotificationPipeline, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        logger.info("Pipeline stats: %s", pipeline.stats())
+
+
+def subscribe(
+    subscriber: pubsub_v1.SubscriberClient,
+    subscription: str,
+    callback: Callable[[pubsub_v1.subscriber.message.Message], None],
+    max_messages: int = MAX_MESSAGES,
+    max_bytes: int = MAX_BYTES,
+    callback_workers: int = CALLBACK_WORKERS,
+):
+    """Open a flow-controlled streaming pull running callback on its own thread pool."""
+    flow_control = pubsub_v1.types.FlowControl(max_messages=max_messages, max_bytes=max_bytes)
+    scheduler = ThreadScheduler(
+        executor=ThreadPoolExecutor(max_workers=callback_workers, thread_name_prefix="pubsub-callback")
     )
-
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            msg_id = messaging.send(message)
-            logger.info("FCM message sent: %s", msg_id)
-            return msg_id
-        except Exception:
-            logger.exception("FCM send attempt %d failed", attempt)
-            last_exc = Exception("fcm-send-failed")
-            time.sleep(attempt)
-    raise last_exc
-
-
-def handle_message(dry_run: bool):
-    """Return a callback capturing dry_run flag for Pub/Sub subscriber."""
-
-    def _callback(message: pubsub_v1.subscriber.message.Message) -> None:
-        try:
-            data = message.data.decode("utf-8")
-            logger.info("Received message: %s", data)
-            payload = json.loads(data)
-        except Exception:
-            logger.exception("Failed to decode/parse Pub/Sub message")
-            message.ack()
-            return
-
-        fcm_token = payload.get("fcm_token") or (payload.get("notification") or {}).get("fcm_token")
-        if not fcm_token:
-            logger.warning("Message missing fcm_token; dropping: %s", payload)
-            message.ack()
-            return
-
-        try:
-            notif_text = try_run_adk_agent(payload)
-        except Exception:
-            logger.exception("ADK agent failed, using fallback text")
-            notif_text = "You have a new carbon report — open the app to view details."
-
-        title = payload.get("title") or "Carbon Footprinter"
-
-        try:
-            send_fcm(fcm_token, title, notif_text, dry_run=dry_run)
-        except Exception:
-            logger.exception("Failed to send FCM notification")
-        finally:
-            # Ack message to avoid redelivery loops; change if you want retry behavior
-            message.ack()
-
-    return _callback
-
-
-def run(subscription: str, dry_run: bool = False) -> None:
+    return subscriber.subscribe(subscription, callback=callback, flow_control=flow_control, scheduler=scheduler)
+
+
+def run(
+    subscription: str,
+    dry_run: bool = False,
+    max_messages: int = MAX_MESSAGES,
+    max_bytes: int = MAX_BYTES,
+    callback_workers: int = CALLBACK_WORKERS,
+    agent_workers: int = AGENT_WORKERS,
+    fcm_workers: int = FCM_WORKERS,
+    fcm_batch_size: int = FCM_BATCH_SIZE,
+    fcm_batch_wait_ms: float = FCM_BATCH_WAIT_MS,
+    metrics_port: int = METRICS_PORT,
+) -> None:
     logger.info("Starting Pub/Sub subscriber for: %s", subscription)
+    if metrics_port:
+        metrics.serve(metrics_port)
+        logger.info("Serving Prometheus metrics on :%d/metrics", metrics_port)
+    init_agent()
     subscriber = pubsub_v1.SubscriberClient()
-    callback = handle_message(dry_run)
-    streaming_pull_future = subscriber.subscribe(subscription, callback=callback)
-    logger.info("Listening for messages on %s...", subscription)
+    # The stage queues never hold more than the flow-controlled messages,
+    # so sizing them to max_messages means put() only blocks on a real backlog.
+    pipeline = NotificationPipeline(
+        dry_run, agent_workers, fcm_workers, queue_size=max_messages,
+        fcm_batch_size=fcm_batch_size, fcm_batch_wait_ms=fcm_batch_wait_ms,
+    ).start()
+    set_pipeline(pipeline)
+    metrics.LISTENER_QUEUE_DEPTH.labels("agent").set_function(lambda: pipeline.agent_stage.stats()["queued"])
+    metrics.LISTENER_QUEUE_DEPTH.labels("fcm").set_function(lambda: pipeline.fcm_stage.stats()["queued"])
+    metrics.LISTENER_QUEUE_DEPTH.labels("fcm_retry").set_function(lambda: pipeline.retries.stats()["pending"])
+    streaming_pull_future = subscribe(subscriber, subscription, handle_message, max_messages, max_bytes, callback_workers)
+    if STATS_INTERVAL > 0:
+        threading.Thread(target=_log_stats, args=(pipeline, STATS_INTERVAL), name="listener-stats", daemon=True).start()
+    logger.info(
+        "Listening for messages on %s (max %d messages / %d bytes outstanding, %d agent and %d FCM workers, "
+        "FCM batches of %d / %.0f ms)...",
+        subscription, max_messages, max_bytes, agent_workers, fcm_workers, fcm_batch_size, fcm_batch_wait_ms,
+    )
 
     try:
         streaming_pull_future.result()
@@ -842,235 +494,45 @@ def run(subscription: str, dry_run: bool = False) -> None:
     except Exception:
         logger.exception("Subscriber encountered an error; shutting down")
         streaming_pull_future.cancel()
+    finally:
+        pipeline.stop()
+        set_pipeline(None)
+        subscriber.close()
+        logger.info("Pipeline stopped: %s", pipeline.stats())
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="Pub/Sub listener for sending FCM notifications")
     parser.add_argument("subscription", nargs="?", help="Full subscription name: projects/PROJECT/subscriptions/SUB")
     parser.add_argument("--dry-run", action="store_true", help="Do not send FCM, just print what would be sent")
+    parser.add_argument("--max-messages", type=int, default=MAX_MESSAGES, help="Max outstanding messages")
+    parser.add_argument("--max-bytes", type=int, default=MAX_BYTES, help="Max outstanding message bytes")
+    parser.add_argument("--callback-workers", type=int, default=CALLBACK_WORKERS, help="Subscriber callback threads")
+    parser.add_argument("--agent-workers", type=int, default=AGENT_WORKERS, help="Agent text generation threads")
+    parser.add_argument("--fcm-workers", type=int, default=FCM_WORKERS, help="Concurrent FCM batch sends")
+    parser.add_argument("--fcm-batch-size", type=int, default=FCM_BATCH_SIZE, help="Max notifications per send_each")
+    parser.add_argument("--fcm-batch-wait-ms", type=float, default=FCM_BATCH_WAIT_MS,
+                        help="Max time a notification waits for its batch to fill")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="Prometheus side port (0 disables)")
     args = parser.parse_args()
 
     subscription = args.subscription or os.environ.get("PUBSUB_SUBSCRIPTION")
     if not subscription:
         raise SystemExit("PUBSUB_SUBSCRIPTION not provided as env var or CLI arg")
 
-    run(subscription, dry_run=args.dry_run)
-
-
-if __name__ == "__main__":
-    main()
-"""
-Pub/Sub subscriber loop that receives JSON messages, uses an ADK agent
-to generate a short notification text, and sends the text to a Flutter app
-via Firebase Cloud Messaging (FCM).
-
-Requirements satisfied:
-- No web server used (direct Pub/Sub subscriber loop)
-- Uses firebase_admin for FCM
-- Attempts to use google.adk Agent objects (if available in runtime)
-
-Environment variables expected in backend/.env or environment:
-- PUBSUB_SUBSCRIPTION : full subscription name, e.g. projects/PROJECT/subscriptions/SUB
-- FIREBASE_CREDENTIALS_PATH : path to service account JSON (already used elsewhere)
-"""
-from __future__ import annotations
-
-import os
-import json
-import logging
-import time
-from typing import Any, Dict
-
-from google.cloud import pubsub_v1
-import argparse
-from dotenv import load_dotenv
-
-# Load .env variables if present
-load_dotenv()
-
-# firebase_admin is in requirements.txt; initialize lazily
-DRY_RUN = False
-import firebase_admin
-from firebase_admin import credentials, messaging
-
-logger = logging.getLogger("pubsub_listener")
-logging.basicConfig(level=logging.INFO)
-
-
-def init_firebase():
-    """Initialize firebase_admin app using FIREBASE_CREDENTIALS_PATH if not already initialized."""
-    if not firebase_admin._apps:
-        cred_path = os.environ.get("FIREBASE_CREDENTIALS_PATH")
-        if not cred_path:
-            raise RuntimeError("FIREBASE_CREDENTIALS_PATH is not set in environment")
-        cred = credentials.Certificate(cred_path)
-        firebase_admin.initialize_app(cred)
-        logger.info("Initialized Firebase Admin SDK using %s", cred_path)
-    else:
-        logger.info("Firebase Admin SDK already initialized")
-
-
-def try_run_adk_agent(payload: Dict[str, Any]) -> str:
-    """
-    Attempt to run the ADK agent defined in the repo to generate a short
-    notification text from the given payload.
-
-    This function tries a few common runtime method names on the Agent
-    instance so it works even if the ADK API surface differs slightly.
-    If ADK isn't available or the call fails, it falls back to a safe
-    local formatting.
-    """
-    # Local fallback formatter
-    def local_format(p: Dict[str, Any]) -> str:
-        # Example: event contains 'saved_kg' or 'emission_saved' and 'user_name'
-        ev = p.get("event", {}) if isinstance(p.get("event"), dict) else p
-        saved = ev.get("saved_kg") or ev.get("emission_saved") or ev.get("saved")
-        user = p.get("user_name") or ev.get("user_name") or "You"
-        if saved is not None:
-            return f"{user}: You saved {saved} kg CO2 today — great job!"
-        # generic summary
-        summary = ev.get("summary") or ev.get("message")
-        if summary:
-            return str(summary)[:200]
-        return "New carbon report available — check the app for details."
-
-    try:
-        # Try importing the agent defined in the project
-        # common locations in this project: backend.agents.notification_agent.agent
-        try:
-            from backend.agents.notification_agent.agent import root_agent as notification_agent
-        except Exception:
-            try:
-                from backend.agents.coach_agent.agent import root_agent as notification_agent
-            except Exception:
-                notification_agent = None
-
-        if notification_agent is None:
-            logger.info("No ADK agent found in repository; using local formatter")
-            return local_format(payload)
-
-        # Try common method names
-        for method_name in ("run", "respond", "call", "execute", "generate"):
-            method = getattr(notification_agent, method_name, None)
-            if callable(method):
-                logger.info("Calling ADK agent method: %s", method_name)
-                try:
-                    result = method(payload)
-                    # If coroutine, run it
-                    if hasattr(result, "__await__"):
-                        import asyncio
-
-                        result = asyncio.get_event_loop().run_until_complete(result)
-                    # If agent returns dict-like or object with text field
-                    if isinstance(result, dict):
-                        # try common keys
-                        for k in ("text", "message", "result", "output"):
-                            if k in result:
-                                return str(result[k])[:200]
-                        # fallthrough to string conversion
-                        return str(result)[:200]
-                    return str(result)[:200]
-                except Exception as e:
-                    logger.exception("ADK agent method %s failed: %s", method_name, e)
-
-        logger.info("ADK agent found but no supported call method succeeded; using local formatter")
-        return local_format(payload)
-    except Exception as e:
-        logger.exception("Error while running ADK agent: %s", e)
-        return local_format(payload)
-
-
-def send_fcm(token: str, title: str, body: str, max_retries: int = 3) -> str:
-    """Send a notification via Firebase Cloud Messaging. Returns the message id on success."""
-    init_firebase()
-    message = messaging.Message(
-        token=token,
-        notification=messaging.Notification(title=title, body=body),
+    run(
+        subscription,
+        dry_run=args.dry_run,
+        max_messages=args.max_messages,
+        max_bytes=args.max_bytes,
+        callback_workers=args.callback_workers,
+        agent_workers=args.agent_workers,
+        fcm_workers=args.fcm_workers,
+        fcm_batch_size=args.fcm_batch_size,
+        fcm_batch_wait_ms=args.fcm_batch_wait_ms,
+        metrics_port=args.metrics_port,
     )
 
-    last_exc = None
-    for attempt in range(1, max_retries + 1):
-        try:
-            msg_id = messaging.send(message)
-            logger.info("FCM message sent: %s", msg_id)
-            return msg_id
-        except Exception as e:
-            logger.exception("FCM send attempt %d failed", attempt)
-            last_exc = e
-            time.sleep(1 * attempt)
-    raise last_exc
-
-
-def handle_message(message: pubsub_v1.subscriber.message.Message) -> None:
-    """Callback to handle incoming Pub/Sub messages."""
-    try:
-        data = message.data.decode("utf-8")
-        logger.info("Received message: %s", data)
-        payload = json.loads(data)
-    except Exception as e:
-        logger.exception("Failed to decode/parse Pub/Sub message: %s", e)
-        message.ack()
-        return
-
-    # Expect an fcm_token at top-level or inside payload['notification']
-    fcm_token = payload.get("fcm_token") or (payload.get("notification") or {}).get("fcm_token")
-    if not fcm_token:
-        logger.warning("Message missing fcm_token; dropping: %s", payload)
-        message.ack()
-        return
-
-    # Generate notification text via ADK agent (with fallback)
-    try:
-        notif_text = try_run_adk_agent(payload)
-    except Exception as e:
-        logger.exception("Failed to generate notification text: %s", e)
-        # If running in dry-run mode, just log/print what would be sent
-        if DRY_RUN:
-            logger.info("DRY RUN: would send FCM to %s -> %s: %s", fcm_token, payload.get('title', 'Carbon Footprinter'), "N/A")
-            print(f"DRY RUN FCM -> token={fcm_token} title={payload.get('title', 'Carbon Footprinter')} body=N/A")
-            return "DRY_RUN"
-
-        notif_text = "You have a new carbon report — open the app to view details."
-
-    title = payload.get("title") or "Carbon Footprinter"
-
-    try:
-        send_fcm(fcm_token, title, notif_text)
-    except Exception as e:
-        logger.exception("Failed to send FCM notification: %s", e)
-        # decide whether to ack or not. We ack to avoid redelivery loops in this example.
-    finally:
-        message.ack()
-
-
-def run(subscription: str) -> None:
-    """Start a Pub/Sub subscriber and run forever.
-
-    subscription must be the full subscription name: projects/<proj>/subscriptions/<sub>
-    """
-    logger.info("Starting Pub/Sub subscriber for: %s", subscription)
-    subscriber = pubsub_v1.SubscriberClient()
-    parser = argparse.ArgumentParser(description="Pub/Sub listener for sending FCM notifications")
-    parser.add_argument("subscription", nargs="?", help="Full subscription name: projects/PROJECT/subscriptions/SUB")
-    parser.add_argument("--dry-run", action="store_true", help="Do not send FCM, just print what would be sent")
-    args = parser.parse_args()
-    if args.dry_run:
-        DRY_RUN = True
-
-    subscription = args.subscription or os.environ.get("PUBSUB_SUBSCRIPTION")
-    if not subscription:
-        raise SystemExit("PUBSUB_SUBSCRIPTION not provided as env var or CLI arg")
-
 
 if __name__ == "__main__":
-    # Allow subscription to be passed by environment or CLI
-    subscription = os.environ.get("PUBSUB_SUBSCRIPTION")
-    if not subscription:
-        import sys
-
-        if len(sys.argv) > 1:
-            subscription = sys.argv[1]
-        else:
-            raise SystemExit("PUBSUB_SUBSCRIPTION not provided as env var or CLI arg")
-
-    run(subscription)
+    main()
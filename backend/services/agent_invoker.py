@@ -0,0 +1,183 @@
+"""
+Resolve an ADK agent once and call it cheaply many times.
+
+resolve_agent_invoker() imports the first available agent module, probes
+it for a callable entry point and returns an AgentInvoker bound to that
+method. Coroutine results run on one long-lived event loop in a dedicated
+thread (AsyncLoopThread), so worker threads never create or drive loops
+of their own. Each invocation's latency is recorded in LatencyStats and
+the agent_invocation_duration_seconds histogram.
+"""
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import importlib
+import inspect
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+AGENT_METHOD_NAMES = ("run", "respond", "call", "execute", "generate")
+RESULT_TEXT_KEYS = ("text", "message", "result", "output")
+MAX_TEXT_LENGTH = 200
+
+
+class AsyncLoopThread:
+    """An asyncio event loop running forever in its own daemon thread."""
+
+    def __init__(self, name: str = "agent-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run(self, awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Run an awaitable on the loop from any other thread and wait for its
+        result. On timeout the task is cancelled before TimeoutError is raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(_as_coroutine(awaitable), self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+async def _as_coroutine(awaitable) -> Any:
+    return await awaitable
+
+
+class LatencyStats:
+    """Invocation count, errors and latency percentiles over the last `window` calls."""
+
+    def __init__(self, window: int = 1024):
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+
+    def record(self, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self.count += 1
+            self.total_seconds += seconds
+            if not ok:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._samples)
+            count, errors, total = self.count, self.errors, self.total_seconds
+
+        def pct(p: float) -> float:
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000 if samples else 0.0
+
+        return {
+            "count": count,
+            "errors": errors,
+            "mean_ms": total / count * 1000 if count else 0.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+        }
+
+
+def result_text(result: Any) -> str:
+    """Normalize whatever the agent returned to a notification string."""
+    if isinstance(result, dict):
+        for k in RESULT_TEXT_KEYS:
+            if k in result:
+                return str(result[k])[:MAX_TEXT_LENGTH]
+    return str(result)[:MAX_TEXT_LENGTH]
+
+
+@dataclass
+class AgentInvoker:
+    """A resolved agent entry point: call it with a payload, get the notification text."""
+
+    module: str
+    method_name: str
+    method: Callable[[Dict[str, Any]], Any]
+    loop: AsyncLoopThread
+    timeout: Optional[float] = None
+    latency: LatencyStats = field(default_factory=LatencyStats)
+    is_async: bool = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.is_async = inspect.iscoroutinefunction(self.method)
+
+    def __call__(self, payload: Dict[str, Any]) -> str:
+        start = time.perf_counter()
+        ok = False
+        try:
+            if self.timeout is not None and not self.is_async:
+                # A blocking call cannot be interrupted; running it on the loop's
+                # executor at least lets the caller stop waiting after timeout.
+                result = self.loop.run(asyncio.to_thread(self.method, payload), self.timeout)
+            else:
+                result = self.method(payload)
+            if hasattr(result, "__await__"):
+                result = self.loop.run(result, self.timeout)
+            ok = True
+            return result_text(result)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.latency.record(elapsed, ok)
+            metrics.AGENT_INVOCATION_SECONDS.labels("ok" if ok else "error").observe(elapsed)
+
+    def warm_up(self, payload: Dict[str, Any]) -> Optional[str]:
+        """One throwaway call at boot so the first real message does not pay for cold start."""
+        try:
+            text = self(payload)
+            logger.info("Agent %s.%s warmed up in %.0f ms", self.module, self.method_name,
+                        self.latency.snapshot()["mean_ms"])
+            return text
+        except Exception:
+            logger.exception("Agent warm-up failed; messages will still be tried")
+            return None
+
+    def stats(self) -> dict:
+        return {"agent": f"{self.module}.{self.method_name}", **self.latency.snapshot()}
+
+
+def resolve_agent_invoker(
+    modules: Iterable[str],
+    attribute: str = "root_agent",
+    timeout: Optional[float] = None,
+) -> Optional[AgentInvoker]:
+    """
+    Import the first of `modules` that defines `attribute` and bind its
+    first callable method from AGENT_METHOD_NAMES. Returns None when no
+    agent (or no usable method) is available.
+    """
+    for module_name in modules:
+        try:
+            agent = getattr(importlib.import_module(module_name), attribute)
+        except Exception:
+            logger.debug("Agent module %s not available", module_name, exc_info=True)
+            continue
+        for method_name in AGENT_METHOD_NAMES:
+            method = getattr(agent, method_name, None)
+            if callable(method):
+                logger.info("Resolved ADK agent %s.%s", module_name, method_name)
+                return AgentInvoker(module_name, method_name, method, AsyncLoopThread(), timeout)
+        logger.warning("Agent %s.%s has none of the methods %s", module_name, attribute, AGENT_METHOD_NAMES)
+    return None
@@ -0,0 +1,68 @@
+"""
+Regenerate countries.geojson from the Natural Earth 1:110m admin-0 shapefile.
+
+Usage:
+  pip install pyshp
+  python build_country_boundaries.py path/to/naturalearth_lowres.shp [out.geojson]
+
+Natural Earth data is public domain. Abbreviated names are expanded so they
+match what Nominatim returns for language="en".
+"""
+from __future__ import annotations
+
+import json
+import os
+import sys
+
+import shapefile
+
+NAME_FIXES = {
+    "United States of America": "United States",
+    "Dem. Rep. Congo": "Democratic Republic of the Congo",
+    "Congo": "Republic of the Congo",
+    "Central African Rep.": "Central African Republic",
+    "Dominican Rep.": "Dominican Republic",
+    "Bosnia and Herz.": "Bosnia and Herzegovina",
+    "Eq. Guinea": "Equatorial Guinea",
+    "S. Sudan": "South Sudan",
+    "Solomon Is.": "Solomon Islands",
+    "Falkland Is.": "Falkland Islands",
+    "Fr. S. Antarctic Lands": "French Southern and Antarctic Lands",
+    "W. Sahara": "Western Sahara",
+    "N. Cyprus": "Northern Cyprus",
+    "eSwatini": "Eswatini",
+}
+PRECISION = 4
+
+
+def _round(coords):
+    if isinstance(coords[0], (int, float)):
+        return [round(c, PRECISION) for c in coords]
+    return [_round(c) for c in coords]
+
+
+def build(shp_path: str) -> dict:
+    reader = shapefile.Reader(shp_path)
+    features = []
+    for shape_record in reader.iterShapeRecords():
+        name = shape_record.record["name"]
+        geometry = shape_record.shape.__geo_interface__
+        features.append({
+            "type": "Feature",
+            "properties": {"name": NAME_FIXES.get(name, name), "iso_a3": shape_record.record["iso_a3"]},
+            "geometry": {"type": geometry["type"], "coordinates": _round(geometry["coordinates"])},
+        })
+    return {"type": "FeatureCollection", "features": features}
+
+
+def main() -> None:
+    if len(sys.argv) < 2:
+        raise SystemExit(__doc__)
+    out = sys.argv[2] if len(sys.argv) > 2 else os.path.join(os.path.dirname(__file__), "countries.geojson")
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(build(sys.argv[1]), f, separators=(",", ":"), ensure_ascii=False)
+    print(f"Wrote {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Deterministic emission factors and a vectorized calculator.
+
+The factor table is the one the co2_agent prompt (agents/manager_agent)
+gives Gemini, so structured Movement and Transaction records get the same
+carbon_emission_kg the agent would compute, in microseconds and without a
+model call. Records the table cannot classify (unknown transportation
+mode or spending category, missing or invalid numbers) are handed to an
+optional fallback, e.g. the co2_agent, in one batch.
+"""
+from __future__ import annotations
+
+import math
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+# kg CO2 per passenger-km.
+TRANSPORT_FACTORS_KG_PER_KM = {
+    "walking": 0.0,
+    "running": 0.0,
+    "bicycle": 0.0,
+    "car": 0.12,       # average gasoline car
+    "bus": 0.05,
+    "train": 0.05,
+    "transit": 0.05,
+    "airplane": 0.25,  # short-haul flight
+}
+# Flights of at least this distance use the long-haul factor.
+LONG_HAUL_FLIGHT_KM = 3700.0
+LONG_HAUL_FLIGHT_FACTOR_KG_PER_KM = 0.15
+# Cars that are not gas cars are counted at the public-transit factor.
+NON_GAS_CAR_FACTOR_KG_PER_KM = 0.05
+
+TRANSPORT_ALIASES = {
+    "walk": "walking",
+    "run": "running",
+    "bike": "bicycle",
+    "cycling": "bicycle",
+    "driving": "car",
+    "drive": "car",
+    "public transit": "transit",
+    "public_transit": "transit",
+    "subway": "train",
+    "metro": "train",
+    "rail": "train",
+    "flight": "airplane",
+    "plane": "airplane",
+}
+
+# kg CO2 per $ spent, by the categories bank_transaction_agent assigns.
+MONEY_FACTOR_KG_PER_USD = 0.5
+SPENDING_FACTORS_KG_PER_USD = {
+    category: MONEY_FACTOR_KG_PER_USD
+    for category in (
+        "groceries", "dining", "transportation", "entertainment",
+        "shopping", "healthcare", "bills & utilities", "other",
+    )
+}
+
+EMISSION_KEY = "carbon_emission_kg"
+
+
+def normalize_mode(transportation: Any) -> Optional[str]:
+    """The TRANSPORT_FACTORS_KG_PER_KM key for a mode name, or None if unknown."""
+    if not isinstance(transportation, str):
+        return None
+    mode = transportation.strip().lower()
+    mode = TRANSPORT_ALIASES.get(mode, mode)
+    return mode if mode in TRANSPORT_FACTORS_KG_PER_KM else None
+
+
+def spending_factor(category: Any) -> Optional[float]:
+    """kg CO2 per $ for the first known category of a transaction, or None."""
+    if isinstance(category, str):
+        category = [category]
+    for name in category or ():
+        if isinstance(name, str):
+            factor = SPENDING_FACTORS_KG_PER_USD.get(name.strip().lower())
+            if factor is not None:
+                return factor
+    return None
+
+
+def _nan_if_none(value: Optional[float]) -> float:
+    return math.nan if value is None else value
+
+
+def _as_float_array(values: Iterable[Any]) -> np.ndarray:
+    return np.fromiter((_to_float(v) for v in values), dtype=np.float64)
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def movement_emissions(
+    transportation: Sequence[Any],
+    distance_km: Iterable[Any],
+    drives_gas: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    kg CO2 for each (transportation, distance_km) pair.
+
+    Returns (emission_kg, classified): unclassified entries (unknown mode,
+    missing or negative distance) are NaN in emission_kg.
+    """
+    distance = _as_float_array(distance_km)
+    # One dictionary lookup per distinct mode name, then a gather.
+    names, inverse = np.unique(np.asarray([str(t) if t is not None else "" for t in transportation]),
+                               return_inverse=True)
+    modes = [normalize_mode(name) for name in names]
+    car_factor = TRANSPORT_FACTORS_KG_PER_KM["car"] if drives_gas else NON_GAS_CAR_FACTOR_KG_PER_KM
+    inverse = inverse.reshape(-1)
+    factors = np.array(
+        [math.nan if m is None else car_factor if m == "car" else TRANSPORT_FACTORS_KG_PER_KM[m] for m in modes],
+        dtype=np.float64,
+    )[inverse]
+    is_flight = np.array([m == "airplane" for m in modes], dtype=bool)[inverse]
+    factors = np.where(is_flight & (distance >= LONG_HAUL_FLIGHT_KM), LONG_HAUL_FLIGHT_FACTOR_KG_PER_KM, factors)
+
+    classified = ~np.isnan(factors) & ~np.isnan(distance) & (distance >= 0)
+    emission = np.where(classified, np.round(distance * factors, 3), np.nan)
+    return emission, classified
+
+
+def distance_by_mode_emissions(distance_by_mode: Mapping[str, float], drives_gas: bool = True) -> float:
+    """
+    kg CO2 for kilometres already summed per mode over many trips. The
+    long-haul rule is per flight, so summed airplane km use the short-haul factor.
+    Raises ValueError for an unknown mode.
+    """
+    car_factor = TRANSPORT_FACTORS_KG_PER_KM["car"] if drives_gas else NON_GAS_CAR_FACTOR_KG_PER_KM
+    total = 0.0
+    for name, km in distance_by_mode.items():
+        mode = normalize_mode(name)
+        if mode is None:
+            raise ValueError(f"Unknown transportation mode: {name}")
+        total += km * (car_factor if mode == "car" else TRANSPORT_FACTORS_KG_PER_KM[mode])
+    return round(total, 3)
+
+
+def transaction_emissions(amount: Iterable[Any], category: Sequence[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    kg CO2 for each (amount, category) purchase; refunds (negative amounts)
+    emit nothing. Returns (emission_kg, classified) like movement_emissions.
+    """
+    amounts = _as_float_array(amount)
+    factors = np.array([_nan_if_none(spending_factor(c)) for c in category], dtype=np.float64)
+    classified = ~np.isnan(factors) & ~np.isnan(amounts)
+    emission = np.where(classified, np.round(np.maximum(amounts, 0.0) * factors, 3), np.nan)
+    return emission, classified
+
+
+def is_movement(record: Mapping[str, Any]) -> bool:
+    """Movement records carry transportation/distance_km; everything else is a transaction."""
+    return "distance_km" in record or "transportation" in record
+
+
+def calculate_emissions(
+    records: Sequence[Mapping[str, Any]],
+    drives_gas: bool = True,
+    fallback: Optional[Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Copy each Movement or Transaction record with carbon_emission_kg added.
+
+    Movements and transactions are computed in one vectorized pass each.
+    Unclassified records are passed to fallback(records) in one call, which
+    must return the same records annotated (the co2_agent contract); without
+    a fallback they keep carbon_emission_kg None and an "assumptions" note.
+    """
+    results: List[Dict[str, Any]] = [dict(r) for r in records]
+    movement_idx = [i for i, r in enumerate(results) if is_movement(r)]
+    transaction_idx = [i for i, r in enumerate(results) if not is_movement(r)]
+    unclassified: List[int] = []
+
+    if movement_idx:
+        emission, ok = movement_emissions(
+            [results[i].get("transportation") for i in movement_idx],
+            (results[i].get("distance_km") for i in movement_idx),
+            drives_gas,
+        )
+        unclassified += _assign(results, movement_idx, emission, ok)
+    if transaction_idx:
+        emission, ok = transaction_emissions(
+            (results[i].get("amount") for i in transaction_idx),
+            [results[i].get("category") for i in transaction_idx],
+        )
+        unclassified += _assign(results, transaction_idx, emission, ok)
+
+    if unclassified and fallback is not None:
+        unclassified.sort()
+        estimated = fallback([results[i] for i in unclassified])
+        for i, record in zip(unclassified, estimated):
+            results[i] = record
+    else:
+        for i in unclassified:
+            results[i][EMISSION_KEY] = None
+            results[i]["assumptions"] = "No emission factor matches this record."
+    return results
+
+
+def _assign(results: List[Dict[str, Any]], indices: List[int], emission: np.ndarray, ok: np.ndarray) -> List[int]:
+    unclassified = []
+    for i, kg, classified in zip(indices, emission.tolist(), ok.tolist()):
+        if classified:
+            results[i][EMISSION_KEY] = kg
+        else:
+            unclassified.append(i)
+    return unclassified
@@ -0,0 +1,87 @@
+"""
+Emission calculation and storage for users.
+
+Movement emissions are derived from the incremental trip aggregate
+(services.trip_aggregator) and the factor table in
+services.emission_factors, which also prices transactions.
+
+carbonEmission is the user's running total of every kind of emission;
+recalculations keep the movement part in movementEmission and only add
+the change to carbonEmission, so transaction and manual emissions survive.
+"""
+from __future__ import annotations
+
+from typing import Optional
+
+from firebase_admin import firestore
+
+from database import user_crud
+
+from services import emission_factors, trip_aggregator
+
+MOVEMENT_EMISSION_FIELD = "movementEmission"
+
+
+class EmissionService:
+
+    @staticmethod
+    def movement_emission_kg(transportation: str, distance_km: float, drives_gas: bool = True) -> float:
+        """kg CO2 for a trip of distance_km using the given transportation mode."""
+        emission, classified = emission_factors.movement_emissions([transportation], [distance_km], drives_gas)
+        if not classified[0]:
+            raise ValueError(f"Unknown transportation mode: {transportation}")
+        return float(emission[0])
+
+    @staticmethod
+    def estimate_emissions(records: list[dict], drives_gas: bool = True, fallback=None) -> list[dict]:
+        """
+        carbon_emission_kg for a batch of Movement/Transaction records from the
+        local factor table; only unclassified records go to fallback (e.g. the co2_agent).
+        """
+        return emission_factors.calculate_emissions(records, drives_gas, fallback)
+
+    @staticmethod
+    def calculate_and_store_emission(user_id: str, input_data: dict) -> dict:
+        """
+        Calculate the emission of one Movement ({"transportation", "distance_km"})
+        or Transaction ({"amount", "category"}) record, add it to the user's
+        carbonEmission and return the updated user.
+        """
+        drives_gas = user_crud.does_user_drive_gas(user_id) if emission_factors.is_movement(input_data) else True
+        emission = EmissionService.estimate_emissions([input_data], drives_gas)[0][emission_factors.EMISSION_KEY]
+        if emission is None:
+            raise ValueError(f"No emission factor matches {input_data}")
+        if not user_crud.increment_user_field(user_id, "carbonEmission", emission):
+            raise ValueError(f"Could not store emission for user {user_id}")
+        return {**user_crud.get_user(user_id), "carbon_emission_kg": emission}
+
+    @staticmethod
+    def recalculate_user(user_id: str) -> dict:
+        """
+        Recompute a user's movement emission from their trip aggregate, each
+        mode's distance priced with its own factor.
+        Does not write the user document; returns {"movementEmission",
+        "transportation", "distance_km", "distance_by_mode_km"} for the caller to store.
+        """
+        trip = trip_aggregator.refresh_user_trip(user_id)
+        emission = emission_factors.distance_by_mode_emissions(
+            trip["distance_by_mode_km"], user_crud.does_user_drive_gas(user_id)
+        )
+        return {
+            MOVEMENT_EMISSION_FIELD: emission,
+            "transportation": trip["transportation"],
+            "distance_km": trip["distance_km"],
+            "distance_by_mode_km": trip["distance_by_mode_km"],
+        }
+
+    @staticmethod
+    def movement_emission_update(previous: Optional[float], recalculated: float) -> dict:
+        """
+        User fields that store a recalculated movement emission: the new
+        movementEmission, and carbonEmission moved by the difference only.
+        """
+        update = {MOVEMENT_EMISSION_FIELD: recalculated}
+        delta = round(recalculated - float(previous or 0.0), 3)
+        if delta:
+            update["carbonEmission"] = firestore.Increment(delta)
+        return update
@@ -0,0 +1,184 @@
+"""
+Batched Pub/Sub publisher for notification events.
+
+EventPublisher wraps a PublisherClient with batch settings sized for bulk
+fan-out (up to 1000 messages / 1 MB per request, 50 ms linger), publisher
+flow control that blocks instead of buffering without bound, and done
+callbacks that tally results instead of a blocking future.result() per
+event. Call flush() once at the end to wait for everything still in flight.
+
+Events can carry an ordering key (for example the user id), so one user's
+events are delivered in publish order. Payloads of at least
+compress_threshold bytes are zlib-compressed and tagged with a
+content_encoding attribute; decode_payload() reverses that on the
+subscriber side.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from google.cloud import pubsub_v1
+
+logger = logging.getLogger(__name__)
+
+PUBLISH_MAX_MESSAGES = int(os.getenv("PUBLISH_MAX_MESSAGES", "1000"))
+PUBLISH_MAX_BYTES = int(os.getenv("PUBLISH_MAX_BYTES", str(1024 * 1024)))
+PUBLISH_MAX_LATENCY = float(os.getenv("PUBLISH_MAX_LATENCY", "0.05"))
+# Messages/bytes allowed in flight before publish() blocks.
+PUBLISH_MAX_OUTSTANDING = int(os.getenv("PUBLISH_MAX_OUTSTANDING", "20000"))
+PUBLISH_MAX_OUTSTANDING_BYTES = int(os.getenv("PUBLISH_MAX_OUTSTANDING_BYTES", str(64 * 1024 * 1024)))
+COMPRESS_THRESHOLD = int(os.getenv("PUBLISH_COMPRESS_THRESHOLD", "2048"))
+
+CONTENT_ENCODING_ATTR = "content_encoding"
+ZLIB_ENCODING = "zlib"
+
+
+def encode_event(event: Dict[str, Any], compress_threshold: int = COMPRESS_THRESHOLD) -> tuple[bytes, Dict[str, str]]:
+    """Compact JSON, zlib-compressed when it is at least compress_threshold bytes."""
+    data = json.dumps(event, separators=(",", ":"), default=str).encode("utf-8")
+    if 0 < compress_threshold <= len(data):
+        return zlib.compress(data, 6), {CONTENT_ENCODING_ATTR: ZLIB_ENCODING}
+    return data, {}
+
+
+def decode_payload(data: bytes, attributes: Optional[Dict[str, str]] = None) -> str:
+    """Message data as text, decompressing it if the publisher compressed it."""
+    if attributes and attributes.get(CONTENT_ENCODING_ATTR) == ZLIB_ENCODING:
+        data = zlib.decompress(data)
+    return data.decode("utf-8")
+
+
+class EventPublisher:
+    """Publishes JSON events to one topic in large batches without blocking per event."""
+
+    def __init__(
+        self,
+        topic: str,
+        ordering: bool = False,
+        max_messages: int = PUBLISH_MAX_MESSAGES,
+        max_bytes: int = PUBLISH_MAX_BYTES,
+        max_latency: float = PUBLISH_MAX_LATENCY,
+        max_outstanding: int = PUBLISH_MAX_OUTSTANDING,
+        max_outstanding_bytes: int = PUBLISH_MAX_OUTSTANDING_BYTES,
+        compress_threshold: int = COMPRESS_THRESHOLD,
+        client: Optional[pubsub_v1.PublisherClient] = None,
+    ):
+        """
+        Args:
+            topic: Full topic path, projects/PROJECT/topics/TOPIC.
+            ordering: Enable ordering keys (publish(..., ordering_key=user_id)).
+            max_messages, max_bytes, max_latency: Batch limits; a batch is sent
+                as soon as any of them is reached.
+            max_outstanding, max_outstanding_bytes: Publisher flow control;
+                publish() blocks while this much is in flight.
+            compress_threshold: Compress payloads of at least this many bytes (0 disables).
+        """
+        self.topic = topic
+        self.ordering = ordering
+        self.compress_threshold = compress_threshold
+        self.client = client or pubsub_v1.PublisherClient(
+            pubsub_v1.types.BatchSettings(max_messages=max_messages, max_bytes=max_bytes, max_latency=max_latency),
+            pubsub_v1.types.PublisherOptions(
+                enable_message_ordering=ordering,
+                flow_control=pubsub_v1.types.PublishFlowControl(
+                    message_limit=max_outstanding,
+                    byte_limit=max_outstanding_bytes,
+                    limit_exceeded_behavior=pubsub_v1.types.LimitExceededBehavior.BLOCK,
+                ),
+            ),
+        )
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self.pending = 0
+        self.published = 0
+        self.failed = 0
+        self.compressed = 0
+        self.sent_bytes = 0
+        # The most recent failures, for logging and flush() results.
+        self.errors: deque = deque(maxlen=100)
+
+    def publish(self, event: Dict[str, Any], ordering_key: Optional[str] = None, **attributes: str):
+        """
+        Queue one event and return its future without waiting on it.
+        Results are tallied in the background; call flush() to wait for them.
+        """
+        data, extra = encode_event(event, self.compress_threshold)
+        key = (ordering_key or "") if self.ordering else ""
+        with self._lock:
+            self.pending += 1
+            self.sent_bytes += len(data)
+            if extra:
+                self.compressed += 1
+        try:
+            future = self.client.publish(self.topic, data, ordering_key=key, **attributes, **extra)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+                self.sent_bytes -= len(data)
+            raise
+        future.add_done_callback(lambda f: self._done(f, key))
+        return future
+
+    def publish_many(
+        self,
+        events: Iterable[Dict[str, Any]],
+        ordering_key: Optional[Callable[[Dict[str, Any]], str]] = None,
+        timeout: Optional[float] = None,
+    ) -> dict:
+        """Publish every event (optionally keyed by ordering_key(event)) and flush."""
+        for event in events:
+            self.publish(event, ordering_key(event) if ordering_key else None)
+        return self.flush(timeout)
+
+    def _done(self, future, ordering_key: str) -> None:
+        error = future.exception()
+        if error is not None and ordering_key:
+            # A failed publish pauses its ordering key; resume so later events can go out.
+            self.client.resume_publish(self.topic, ordering_key)
+        with self._lock:
+            self.pending -= 1
+            if error is None:
+                self.published += 1
+            else:
+                self.failed += 1
+                self.errors.append(f"{type(error).__name__}: {error}")
+            if self.pending == 0:
+                self._idle.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> dict:
+        """Wait until every queued event has been published or has failed; returns stats()."""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self._idle:
+            while self.pending:
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    logger.warning("Publisher flush timed out with %d events in flight", self.pending)
+                    break
+                self._idle.wait(remaining)
+        stats = self.stats()
+        if stats["failed"]:
+            logger.warning("%d events failed to publish, e.g. %s", stats["failed"], stats["recent_errors"][:1])
+        return stats
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "published": self.published,
+                "failed": self.failed,
+                "pending": self.pending,
+                "compressed": self.compressed,
+                "sent_bytes": self.sent_bytes,
+                "recent_errors": list(self.errors),
+            }
+
+    def close(self) -> None:
+        """Flush and stop the client's background batching threads."""
+        self.flush()
+        self.client.stop()
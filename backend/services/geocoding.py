@@ -0,0 +1,285 @@
+"""
+Offline reverse geocoding: (lat, lon) -> country name.
+
+Country boundaries are bundled in data/countries.geojson (Natural Earth
+1:110m, see data/build_country_boundaries.py) and indexed once per process
+on a regular lat/lon grid:
+
+- cells that lie entirely inside one country answer directly,
+- cells crossed by a border keep the candidate countries plus, for each
+  candidate, only the border edges inside that cell's latitude band, so the
+  point-in-polygon test touches a handful of edges,
+- cells with no country (open sea) are misses.
+
+At 1:110m a border or coastline can be off by kilometres and microstates
+(Singapore, Andorra, ...) are missing or merged into a neighbour, so points
+within BORDER_MARGIN_DEG of a polygon edge and points inside
+SMALL_COUNTRY_BOXES are misses too rather than confident wrong answers.
+
+Misses fall back to a pluggable remote geocoder (Nominatim by default, set
+REVERSE_GEOCODER_FALLBACK=none to stay fully offline); a bulk lookup asks
+it once per REMOTE_DEDUP_DIGITS-rounded coordinate.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import os
+import threading
+from functools import lru_cache
+from typing import Iterable, Optional, Protocol, Sequence
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BOUNDARIES_PATH = os.path.join(os.path.dirname(__file__), "data", "countries.geojson")
+CELL_DEG = 1.0
+# ~11 km: larger than the 1:110m generalisation error along most borders and coasts.
+BORDER_MARGIN_DEG = 0.1
+# (south, north, west, east) of countries the 1:110m data lacks or merges into a neighbour.
+SMALL_COUNTRY_BOXES = {
+    "Singapore": (1.15, 1.48, 103.59, 104.10),
+    "Andorra": (42.42, 42.66, 1.40, 1.79),
+    "Monaco": (43.72, 43.76, 7.40, 7.45),
+    "Liechtenstein": (47.04, 47.28, 9.47, 9.64),
+    "San Marino": (43.89, 44.00, 12.40, 12.52),
+    "Vatican City": (41.90, 41.91, 12.44, 12.46),
+    "Bahrain": (25.78, 26.33, 50.37, 50.83),
+    "Malta": (35.78, 36.09, 14.18, 14.58),
+}
+# Misses in one bulk lookup share a remote call per coordinate rounded to this (~1 km).
+REMOTE_DEDUP_DIGITS = 2
+
+
+class RemoteGeocoder(Protocol):
+    def country(self, lat: float, lon: float) -> Optional[str]:
+        ...
+
+
+class NominatimGeocoder:
+    """Remote fallback backed by geopy's Nominatim, created once and reused."""
+
+    def __init__(self, user_agent: str = "carbon_app", timeout: float = 5):
+        from geopy.geocoders import Nominatim
+
+        self._geolocator = Nominatim(user_agent=user_agent, timeout=timeout)
+
+    def country(self, lat: float, lon: float) -> Optional[str]:
+        location = self._geolocator.reverse((lat, lon), language="en")
+        if location is None:
+            return None
+        return location.raw.get("address", {}).get("country")
+
+
+def _rings(geometry: dict) -> list:
+    if geometry["type"] == "Polygon":
+        return geometry["coordinates"]
+    return [ring for polygon in geometry["coordinates"] for ring in polygon]
+
+
+def _crosses(edges: Sequence[tuple], lat: float, lon: float) -> bool:
+    """Even-odd ray cast towards +lon over (lon1, lat1, lon2, lat2) edges."""
+    inside = False
+    for x1, y1, x2, y2 in edges:
+        if (y1 > lat) != (y2 > lat) and lon < x1 + (lat - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+    return inside
+
+
+def _near_edge(edges: Sequence[tuple], lat: float, lon: float, margin: float) -> bool:
+    """Whether any (lon1, lat1, lon2, lat2) edge passes within margin degrees of the point."""
+    for x1, y1, x2, y2 in edges:
+        dx, dy = x2 - x1, y2 - y1
+        length = dx * dx + dy * dy
+        t = 0.0 if length == 0 else min(max(((lon - x1) * dx + (lat - y1) * dy) / length, 0.0), 1.0)
+        if math.hypot(lon - x1 - t * dx, lat - y1 - t * dy) < margin:
+            return True
+    return False
+
+
+def _in_small_country(lat: float, lon: float) -> bool:
+    return any(s <= lat <= n and w <= lon <= e for s, n, w, e in SMALL_COUNTRY_BOXES.values())
+
+
+def _candidates(entry) -> tuple:
+    if entry is None:
+        return ()
+    return entry if isinstance(entry, tuple) else (entry,)
+
+
+class CountryIndex:
+    """Grid index over country polygons. Build it once with get_country_index()."""
+
+    def __init__(
+        self, features: Iterable[dict], cell_deg: float = CELL_DEG, border_margin_deg: float = BORDER_MARGIN_DEG
+    ):
+        self.cell_deg = cell_deg
+        self.border_margin_deg = border_margin_deg
+        self.rows = int(math.ceil(180 / cell_deg))
+        self.cols = int(math.ceil(360 / cell_deg))
+        self.names: list[str] = []
+        # (country, row) -> edges crossing that latitude band
+        self._band_edges: dict[tuple[int, int], list[tuple]] = {}
+        # (row, col) -> country index (whole cell inside) or tuple of candidates
+        self._cells: dict[tuple[int, int], object] = {}
+
+        for feature in features:
+            self._add_country(len(self.names), feature)
+            self.names.append(feature["properties"]["name"])
+
+        # Cells overlapping a small country always go through _resolve.
+        for south, north, west, east in SMALL_COUNTRY_BOXES.values():
+            for r in range(self._row(south), self._row(north) + 1):
+                for c in range(self._col(west), self._col(east) + 1):
+                    if (r, c) in self._cells:
+                        self._cells[(r, c)] = _candidates(self._cells[(r, c)])
+
+    @classmethod
+    def from_geojson(cls, path: str = BOUNDARIES_PATH, cell_deg: float = CELL_DEG) -> "CountryIndex":
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f)["features"], cell_deg)
+
+    def _row(self, lat: float) -> int:
+        return min(max(int((lat + 90) // self.cell_deg), 0), self.rows - 1)
+
+    def _col(self, lon: float) -> int:
+        return min(max(int((lon + 180) // self.cell_deg), 0), self.cols - 1)
+
+    def _add_country(self, idx: int, feature: dict) -> None:
+        border_cells = set()
+        min_row = min_col = math.inf
+        max_row = max_col = -math.inf
+
+        # Edges count as in every cell within the margin, so a cell left fully
+        # inside is at least the margin away from the country's outline.
+        margin = self.border_margin_deg
+        for ring in _rings(feature["geometry"]):
+            for (x1, y1), (x2, y2) in zip(ring, ring[1:]):
+                r0, r1 = self._row(min(y1, y2) - margin), self._row(max(y1, y2) + margin)
+                c0, c1 = self._col(min(x1, x2) - margin), self._col(max(x1, x2) + margin)
+                min_row, max_row = min(min_row, r0), max(max_row, r1)
+                min_col, max_col = min(min_col, c0), max(max_col, c1)
+                for r in range(r0, r1 + 1):
+                    self._band_edges.setdefault((idx, r), []).append((x1, y1, x2, y2))
+                    for c in range(c0, c1 + 1):
+                        border_cells.add((r, c))
+
+        for cell in border_cells:
+            self._cells[cell] = _candidates(self._cells.get(cell)) + (idx,)
+
+        # Cells no border passes through are either fully inside or fully outside.
+        for r in range(min_row, max_row + 1):
+            edges = self._band_edges.get((idx, r), ())
+            center_lat = -90 + (r + 0.5) * self.cell_deg
+            for c in range(min_col, max_col + 1):
+                if (r, c) in border_cells:
+                    continue
+                center_lon = -180 + (c + 0.5) * self.cell_deg
+                if _crosses(edges, center_lat, center_lon):
+                    existing = self._cells.get((r, c))
+                    self._cells[(r, c)] = idx if existing is None else _candidates(existing) + (idx,)
+
+    def _resolve(self, entry, lat: float, lon: float) -> Optional[str]:
+        if entry is None:
+            return None
+        if not isinstance(entry, tuple):
+            return self.names[entry]
+        if _in_small_country(lat, lon):
+            return None
+        row = self._row(lat)
+        for idx in entry:
+            edges = self._band_edges.get((idx, row), ())
+            if _crosses(edges, lat, lon):
+                # Too close to the outline to trust 1:110m data: leave it to the remote geocoder.
+                return None if _near_edge(edges, lat, lon, self.border_margin_deg) else self.names[idx]
+        return None
+
+    def lookup(self, lat: float, lon: float) -> Optional[str]:
+        """
+        Return the country containing (lat, lon), or None if no bundled polygon
+        does or the point is too close to a border or coast to tell.
+        """
+        return self._resolve(self._cells.get((self._row(lat), self._col(lon))), lat, lon)
+
+    def lookup_many(self, lats, lons) -> list[Optional[str]]:
+        """Bulk lookup. Points sharing a fully-inside cell are answered together."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        rows = np.clip(((lats + 90) // self.cell_deg).astype(np.int64), 0, self.rows - 1)
+        cols = np.clip(((lons + 180) // self.cell_deg).astype(np.int64), 0, self.cols - 1)
+        keys, inverse, counts = np.unique(rows * self.cols + cols, return_inverse=True, return_counts=True)
+        groups = np.split(np.argsort(inverse, kind="stable"), np.cumsum(counts)[:-1])
+
+        results: list[Optional[str]] = [None] * len(lats)
+        for key, members in zip(keys.tolist(), groups):
+            entry = self._cells.get(divmod(key, self.cols))
+            if entry is None:
+                continue
+            if not isinstance(entry, tuple):
+                name = self.names[entry]
+                for i in members.tolist():
+                    results[i] = name
+                continue
+            for i in members.tolist():
+                results[i] = self._resolve(entry, float(lats[i]), float(lons[i]))
+        return results
+
+
+@lru_cache(maxsize=1)
+def get_country_index() -> CountryIndex:
+    """Process-wide index, built on first use from the bundled boundaries."""
+    return CountryIndex.from_geojson()
+
+
+_remote_lock = threading.Lock()
+_remote_geocoder: Optional[RemoteGeocoder] = None
+_remote_configured = False
+
+
+def set_remote_geocoder(geocoder: Optional[RemoteGeocoder]) -> None:
+    """Replace the fallback used on index misses. Pass None to disable it."""
+    global _remote_geocoder, _remote_configured
+    with _remote_lock:
+        _remote_geocoder = geocoder
+        _remote_configured = True
+
+
+def get_remote_geocoder() -> Optional[RemoteGeocoder]:
+    global _remote_geocoder, _remote_configured
+    with _remote_lock:
+        if not _remote_configured:
+            if os.getenv("REVERSE_GEOCODER_FALLBACK", "nominatim").lower() != "none":
+                _remote_geocoder = NominatimGeocoder()
+            _remote_configured = True
+        return _remote_geocoder
+
+
+def _remote_country(lat: float, lon: float) -> Optional[str]:
+    remote = get_remote_geocoder()
+    if remote is None:
+        return None
+    try:
+        return remote.country(lat, lon)
+    except Exception as e:
+        logger.warning("Remote reverse geocoding failed for (%s, %s): %s", lat, lon, e)
+        return None
+
+
+def reverse_country(lat: float, lon: float) -> Optional[str]:
+    """Country for a point: local index first, remote geocoder only on a miss."""
+    return get_country_index().lookup(lat, lon) or _remote_country(lat, lon)
+
+
+def reverse_countries(lats, lons) -> list[Optional[str]]:
+    """Bulk version of reverse_country; nearby misses share one remote lookup."""
+    results = get_country_index().lookup_many(lats, lons)
+    remote: dict[tuple[float, float], Optional[str]] = {}
+    for i, (name, lat, lon) in enumerate(zip(results, lats, lons)):
+        if name is None:
+            key = (round(float(lat), REMOTE_DEDUP_DIGITS), round(float(lon), REMOTE_DEDUP_DIGITS))
+            if key not in remote:
+                remote[key] = _remote_country(float(lat), float(lon))
+            results[i] = remote[key]
+    return results
@@ -0,0 +1,215 @@
+"""
+Server-side leaderboard backed by an in-memory sorted index.
+
+The index holds (carbonEmission, user_id) pairs in a SortedList for the
+global board and one per country, so top-K is O(log N + K) and a user's
+rank is O(log N). It is built once from Firestore (projected to the
+leaderboard fields) and then kept up to date by a user_crud write listener,
+so every emission write made through the backend moves the user in O(log N).
+
+Writes that bypass this process (other workers, the Flutter app writing to
+Firestore directly) are picked up by a periodic rebuild, every
+LEADERBOARD_REFRESH_SECONDS (0 disables it) or via rebuild(). The first
+load is meant to happen at startup (warm_up()), not inside a request.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable, Optional
+
+from sortedcontainers import SortedList
+
+from database import user_crud
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_FIELDS = ["name", "country", "transportation", "pfp", "carbonEmission"]
+LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "600"))
+
+
+class Leaderboard:
+    """Lowest carbonEmission ranks first, like the app's leaderboard screen."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._reset()
+        # Writes seen while a rebuild is reading Firestore, replayed afterwards,
+        # and the last user id that rebuild has read.
+        self._pending: Optional[list] = None
+        self._loaded_through: Optional[str] = None
+
+    def _reset(self) -> None:
+        self._global = SortedList()
+        self._by_country = defaultdict(SortedList)
+        self._users: dict[str, dict] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    # -- maintenance -----------------------------------------------------
+
+    def _unlink(self, user_id: str) -> Optional[dict]:
+        user = self._users.pop(user_id, None)
+        if user is not None:
+            key = (user["carbonEmission"], user_id)
+            self._global.remove(key)
+            board = self._by_country[user.get("country")]
+            board.remove(key)
+            if not board:
+                del self._by_country[user.get("country")]
+        return user
+
+    def _link(self, user_id: str, user: dict) -> None:
+        user["carbonEmission"] = float(user.get("carbonEmission") or 0.0)
+        key = (user["carbonEmission"], user_id)
+        self._users[user_id] = user
+        self._global.add(key)
+        self._by_country[user.get("country")].add(key)
+
+    def _apply(self, user_id: str, op: str, data: Optional[dict]) -> None:
+        if op == "delete":
+            self._unlink(user_id)
+        elif op == "create":
+            self._unlink(user_id)
+            self._link(user_id, {k: data.get(k) for k in LEADERBOARD_FIELDS})
+        elif op == "update":
+            relevant = {k: v for k, v in data.items() if k in LEADERBOARD_FIELDS}
+            if relevant:
+                user = self._unlink(user_id) or {}
+                self._link(user_id, {**user, **relevant})
+        elif op == "increment" and "carbonEmission" in data:
+            user = self._unlink(user_id) or {}
+            user["carbonEmission"] = float(user.get("carbonEmission") or 0.0) + data["carbonEmission"]
+            self._link(user_id, user)
+
+    def apply_write(self, user_id: str, op: str, data: Optional[dict]) -> None:
+        """user_crud write listener: move the user to its new position."""
+        with self._lock:
+            self._apply(user_id, op, data)
+            # A rebuild reads users in id order: users it has not reached yet
+            # will be read with this write included, so replaying it (an
+            # increment above all) would count it twice.
+            if self._pending is not None and self._loaded_through is not None and user_id <= self._loaded_through:
+                self._pending.append((user_id, op, data))
+
+    def _read_users(self, page_size: int = user_crud.BATCH_MAX_WRITES) -> Iterable[tuple[str, dict]]:
+        # A page is marked as read the moment it arrives: writes to its users
+        # from then on are missing from it and have to be replayed.
+        for page in user_crud.iter_user_pages(fields=LEADERBOARD_FIELDS, page_size=page_size):
+            with self._lock:
+                self._loaded_through = page[-1][0]
+            yield from page
+
+    def load(self, users: Iterable[tuple[str, dict]]) -> None:
+        """Replace the whole index with (user_id, user data) pairs."""
+        entries = {}
+        by_country = defaultdict(list)
+        for user_id, data in users:
+            user = {k: data.get(k) for k in LEADERBOARD_FIELDS}
+            user["carbonEmission"] = float(user["carbonEmission"] or 0.0)
+            entries[user_id] = user
+        for user_id, user in entries.items():
+            by_country[user["country"]].append((user["carbonEmission"], user_id))
+        # One sort per board instead of N inserts.
+        with self._lock:
+            self._users = entries
+            self._global = SortedList(key for keys in by_country.values() for key in keys)
+            self._by_country = defaultdict(SortedList, {c: SortedList(keys) for c, keys in by_country.items()})
+
+    def rebuild(self) -> None:
+        """
+        Reload from Firestore without blocking readers. Writes made meanwhile
+        to users the reload had already read are replayed; writes to the rest
+        are in what it reads.
+        """
+        with self._lock:
+            self._pending = []
+            self._loaded_through = None
+        try:
+            fresh = Leaderboard()
+            fresh.load(self._read_users())
+            with self._lock:
+                for write in self._pending:
+                    fresh._apply(*write)
+                self._global, self._by_country, self._users = fresh._global, fresh._by_country, fresh._users
+            logger.info("Leaderboard rebuilt with %d users", len(self))
+        finally:
+            with self._lock:
+                self._pending = None
+                self._loaded_through = None
+
+    # -- queries ---------------------------------------------------------
+
+    def _board(self, country: Optional[str]) -> SortedList:
+        if country is None:
+            return self._global
+        return self._by_country.get(country) or SortedList()
+
+    def _entry(self, user_id: str, rank: int) -> dict:
+        return {"user_id": user_id, "rank": rank, **self._users[user_id]}
+
+    def top(self, k: int = 10, country: Optional[str] = None) -> list[dict]:
+        """The k users with the lowest emissions, optionally within one country."""
+        with self._lock:
+            board = self._board(country)
+            entries = []
+            for i, (emission, user_id) in enumerate(board.islice(0, k)):
+                # Ties share the rank of the first user with that emission.
+                rank = entries[-1]["rank"] if entries and entries[-1]["carbonEmission"] == emission else i + 1
+                entries.append(self._entry(user_id, rank))
+            return entries
+
+    def rank(self, user_id: str, country: Optional[str] = None) -> Optional[dict]:
+        """A user's 1-based rank (ties share a rank) and the board size, or None if unranked."""
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return None
+            if country is not None and user.get("country") != country:
+                return None
+            board = self._board(country)
+            position = board.bisect_left((user["carbonEmission"], ""))
+            return {**self._entry(user_id, position + 1), "total": len(board)}
+
+    def countries(self) -> dict:
+        with self._lock:
+            return {country: len(board) for country, board in self._by_country.items()}
+
+
+_leaderboard: Optional[Leaderboard] = None
+_leaderboard_lock = threading.Lock()
+
+
+def _refresh_loop(board: Leaderboard, interval: float) -> None:
+    while True:
+        time.sleep(interval)
+        try:
+            board.rebuild()
+        except Exception:
+            logger.exception("Leaderboard refresh failed; keeping the previous index")
+
+
+def get_leaderboard() -> Leaderboard:
+    """Process-wide leaderboard, loaded from Firestore on first use (see warm_up())."""
+    global _leaderboard
+    with _leaderboard_lock:
+        if _leaderboard is None:
+            board = Leaderboard()
+            user_crud.add_write_listener(board.apply_write)
+            board.rebuild()
+            if LEADERBOARD_REFRESH_SECONDS > 0:
+                threading.Thread(
+                    target=_refresh_loop, args=(board, LEADERBOARD_REFRESH_SECONDS),
+                    name="leaderboard-refresh", daemon=True,
+                ).start()
+            _leaderboard = board
+        return _leaderboard
+
+
+def warm_up() -> None:
+    """Load the process-wide leaderboard now, so no request waits for the first load."""
+    get_leaderboard()
@@ -0,0 +1,79 @@
+"""
+Prometheus metrics for the API, the user_crud data layer and the listener.
+
+Metrics live in the default prometheus_client registry. The API serves
+them at GET /metrics and the listener on a side port (serve()). Labelled
+children are resolved once and reused where possible, so recording an
+event costs a couple of microseconds (see benchmarks/bench_metrics.py).
+Values are per process; scrape every worker.
+"""
+from __future__ import annotations
+
+import time
+from functools import wraps
+from typing import Callable
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest, start_http_server
+
+# 1 ms .. 10 s: API routes, Firestore round trips, FCM batches.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 50 ms .. 30 s: model calls.
+AGENT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0)
+
+API_REQUEST_SECONDS = Histogram(
+    "api_request_duration_seconds", "FastAPI request latency until the response starts.",
+    ["method", "route", "status"], buckets=LATENCY_BUCKETS,
+)
+USER_CRUD_SECONDS = Histogram(
+    "user_crud_call_duration_seconds", "Latency of user_crud calls.",
+    ["function"], buckets=LATENCY_BUCKETS,
+)
+USER_CACHE_HIT_RATIO = Gauge("user_cache_hit_ratio", "Hit ratio of the in-process get_user cache.")
+
+LISTENER_MESSAGES = Counter(
+    "listener_messages_total", "Pub/Sub messages acked or nacked by the listener.",
+    ["outcome", "reason"],
+)
+AGENT_INVOCATION_SECONDS = Histogram(
+    "agent_invocation_duration_seconds", "Latency of notification agent calls.",
+    ["outcome"], buckets=AGENT_BUCKETS,
+)
+FCM_SENDS = Counter("listener_fcm_sends_total", "Per-token FCM send results.", ["result"])
+FCM_BATCH_SECONDS = Histogram(
+    "listener_fcm_batch_duration_seconds", "Latency of one messaging.send_each call.", buckets=LATENCY_BUCKETS,
+)
+LISTENER_QUEUE_DEPTH = Gauge("listener_stage_queue_depth", "Items waiting in a listener stage.", ["stage"])
+TEXT_CACHE_HIT_RATIO = Gauge("listener_text_cache_hit_ratio", "Hit ratio of the notification text cache.")
+
+
+def timed_call(histogram: Histogram, label: str) -> Callable:
+    """Decorator observing the wall time of every call under histogram{label}."""
+    child = histogram.labels(label)
+
+    def decorate(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorate
+
+
+def user_crud_call(fn: Callable) -> Callable:
+    """Time a user_crud function under its own name."""
+    return timed_call(USER_CRUD_SECONDS, fn.__name__)(fn)
+
+
+def render() -> bytes:
+    """The default registry in the Prometheus text format (CONTENT_TYPE_LATEST)."""
+    return generate_latest()
+
+
+def serve(port: int, addr: str = "0.0.0.0") -> None:
+    """Expose /metrics on a background HTTP server (for processes without an API)."""
+    start_http_server(port, addr)
+
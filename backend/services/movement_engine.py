@@ -0,0 +1,155 @@
+"""
+Columnar, NumPy-backed trip statistics for movement traces.
+
+process_movements used to walk the movement list pair by pair in Python.
+This module converts the list into arrays once and computes every segment
+distance, time delta and speed in a single batch.
+"""
+from __future__ import annotations
+
+import math
+from dataclasses import dataclass, replace
+from typing import Optional, Sequence, Union
+
+import numpy as np
+
+from services import timestamps
+
+EARTH_RADIUS_KM = 6371
+
+# Upper speed bound (km/h, exclusive) for each transportation mode.
+SPEED_THRESHOLDS = (
+    (6, "walking"),
+    (25, "bicycle"),
+    (200, "car"),
+)
+FASTEST_MODE = "airplane"
+
+
+@dataclass
+class MovementColumns:
+    """
+    Movement points split into parallel arrays.
+    Readers that already know each point's time (e.g. decoded movement
+    chunks) set seconds and may leave timestamps empty.
+    """
+    latitude: np.ndarray
+    longitude: np.ndarray
+    speed_kmh: np.ndarray
+    timestamps: list
+    seconds: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+
+Movements = Union[Sequence[dict], MovementColumns]
+
+
+def to_columns(movements: Movements) -> MovementColumns:
+    """
+    Convert a list of movement dicts into a MovementColumns (columns pass through).
+    Missing or null speeds become 0 so they fall back to the computed speed.
+    """
+    if isinstance(movements, MovementColumns):
+        return movements
+    n = len(movements)
+    lat = np.fromiter((m["latitude"] for m in movements), dtype=np.float64, count=n)
+    lon = np.fromiter((m["longitude"] for m in movements), dtype=np.float64, count=n)
+    speed = np.fromiter((m.get("speed_kmh") or 0.0 for m in movements), dtype=np.float64, count=n)
+    timestamps = [m.get("timestamp") for m in movements]
+    return MovementColumns(lat, lon, speed, timestamps)
+
+
+def with_seconds(cols: MovementColumns) -> MovementColumns:
+    """
+    cols with every timestamp parsed once into seconds (NaN where it cannot
+    be parsed), for callers that run several passes over the same trace.
+    """
+    if cols.seconds is not None:
+        return cols
+    return replace(cols, seconds=timestamps.to_epoch_seconds(cols.timestamps, errors="coerce"))
+
+
+def haversine_np(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Element-wise haversine distance in km, same formula as the per-pair loop it replaced."""
+    lat1, lon1, lat2, lon2 = (np.radians(a) for a in (lat1, lon1, lat2, lon2))
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Scalar twin of haversine_np, for per-point streaming code."""
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dlat = p2 - p1
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def segment_distances(cols: MovementColumns) -> np.ndarray:
+    """Distance in km between each pair of consecutive points (length n-1)."""
+    return haversine_np(cols.latitude[:-1], cols.longitude[:-1], cols.latitude[1:], cols.longitude[1:])
+
+
+def segment_speeds(cols: MovementColumns, distances: np.ndarray) -> np.ndarray:
+    """
+    Speed in km/h for each segment.
+    Uses the reported speed of the segment's end point when it is positive,
+    otherwise distance over elapsed time. Timestamps are only parsed for the
+    points that actually need the fallback.
+    """
+    speeds = cols.speed_kmh[1:].copy()
+    fallback = ~(speeds > 0)
+    if not fallback.any():
+        return speeds
+
+    idx = np.flatnonzero(fallback)
+    if cols.seconds is not None:
+        seconds = cols.seconds
+    else:
+        needed = np.union1d(idx, idx + 1)
+        seconds = np.full(len(cols), np.nan)
+        seconds[needed] = timestamps.to_epoch_seconds([cols.timestamps[i] for i in needed])
+
+    dt_hours = (seconds[idx + 1] - seconds[idx]) / 3600.0
+    computed = np.zeros(len(idx))
+    moving = dt_hours > 0
+    computed[moving] = distances[idx][moving] / dt_hours[moving]
+    speeds[idx] = computed
+    return speeds
+
+
+def classify_speed(max_speed: float) -> str:
+    """Map a maximum speed in km/h to a transportation mode."""
+    for upper, mode in SPEED_THRESHOLDS:
+        if max_speed < upper:
+            return mode
+    return FASTEST_MODE
+
+
+def trace_stats(movements: Movements) -> tuple[float, float]:
+    """Unrounded (total distance in km, max speed in km/h) for a trace."""
+    cols = to_columns(movements)
+    if len(cols) < 2:
+        return 0.0, 0.0
+
+    distances = segment_distances(cols)
+    speeds = segment_speeds(cols, distances)
+    return float(distances.sum()), max(float(speeds.max()), 0.0)
+
+
+def summarize(movements: Movements) -> dict:
+    """
+    Compute total distance, max speed and transportation mode for a trace.
+    Returns {"transportation", "distance_km", "max_speed_kmh"}.
+    """
+    distance, max_speed = trace_stats(movements)
+    return {
+        "transportation": classify_speed(max_speed),
+        "distance_km": round(distance, 2),
+        "max_speed_kmh": max_speed,
+    }
@@ -0,0 +1,158 @@
+"""
+Content-addressed cache for generated notification text.
+
+Payloads that differ only in their token or user name get the same text,
+so the agent is called with the token dropped and a placeholder user name,
+and its text is cached by a hash of exactly that normalized prompt payload
+(event, title and every other field it sees). The cached text is a template
+and each message gets its own name substituted back in.
+
+Entries expire after a TTL and the least recently used are evicted when
+the cache is full. Concurrent misses for the same key are coalesced
+(single-flight): one thread calls the agent, the others wait for its
+result, at most NOTIFICATION_CACHE_WAIT_TIMEOUT. Failures are not cached.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+from typing import Any, Callable, Dict, Optional
+
+from cachetools import TTLCache
+
+NOTIFICATION_CACHE_MAXSIZE = int(os.getenv("NOTIFICATION_CACHE_MAXSIZE", "10000"))
+NOTIFICATION_CACHE_TTL = float(os.getenv("NOTIFICATION_CACHE_TTL", "3600"))
+# How long a coalesced lookup waits for the thread calling the agent.
+NOTIFICATION_CACHE_WAIT_TIMEOUT = float(os.getenv("NOTIFICATION_CACHE_WAIT_TIMEOUT", "60"))
+
+USER_NAME_SLOT = "{user_name}"
+DEFAULT_USER_NAME = "You"
+# Delivery fields the agent is never shown, at the top level or under "notification".
+TOKEN_FIELDS = ("fcm_token",)
+
+
+def _normalize(value: Any) -> Any:
+    """Canonical form: drop None values, treat 2.5 and 2.50 alike, keep everything else."""
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def cache_key(payload: Dict[str, Any]) -> str:
+    """sha256 of the normalized payload the agent is called with (see templated)."""
+    canonical = json.dumps(_normalize(templated(payload)), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def templated(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of the payload without tokens and with the user name replaced by the template slot."""
+    payload = {k: v for k, v in payload.items() if k not in TOKEN_FIELDS}
+    if isinstance(payload.get("notification"), dict):
+        payload["notification"] = {k: v for k, v in payload["notification"].items() if k not in TOKEN_FIELDS}
+    payload["user_name"] = USER_NAME_SLOT
+    if isinstance(payload.get("event"), dict) and "user_name" in payload["event"]:
+        payload["event"] = {**payload["event"], "user_name": USER_NAME_SLOT}
+    return payload
+
+
+def render(template: str, payload: Dict[str, Any]) -> str:
+    event = payload.get("event") if isinstance(payload.get("event"), dict) else {}
+    name = payload.get("user_name") or event.get("user_name") or DEFAULT_USER_NAME
+    return template.replace(USER_NAME_SLOT, str(name))
+
+
+class _Flight:
+    """A computation in progress that other threads can wait on."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+
+class NotificationTextCache:
+    """TTL + LRU cache of notification templates with single-flight misses."""
+
+    def __init__(
+        self,
+        maxsize: int = NOTIFICATION_CACHE_MAXSIZE,
+        ttl: float = NOTIFICATION_CACHE_TTL,
+        wait_timeout: float = NOTIFICATION_CACHE_WAIT_TIMEOUT,
+    ):
+        self.enabled = maxsize > 0 and ttl > 0
+        self.wait_timeout = wait_timeout
+        self._cache = TTLCache(max(maxsize, 1), max(ttl, 0.001))
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get_or_generate(self, payload: Dict[str, Any], generate: Callable[[Dict[str, Any]], str]) -> str:
+        """
+        Text for this payload, calling generate(templated payload) only on a
+        miss that no other thread is already computing. Exceptions from
+        generate propagate to every waiting caller and nothing is cached;
+        a waiting caller gives up with TimeoutError after wait_timeout.
+        """
+        if not self.enabled:
+            return render(generate(templated(payload)), payload)
+
+        key = cache_key(payload)
+        with self._lock:
+            template = self._cache.get(key)
+            if template is not None:
+                self.hits += 1
+                return render(template, payload)
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            if not flight.done.wait(self.wait_timeout):
+                raise TimeoutError(f"Agent text for this event not ready after {self.wait_timeout:.0f}s")
+            if flight.error is not None:
+                raise flight.error
+            return render(flight.result, payload)
+
+        try:
+            flight.result = generate(templated(payload))
+            with self._lock:
+                self._cache[key] = flight.result
+            return render(flight.result, payload)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "size": len(self._cache),
+                "maxsize": self._cache.maxsize,
+                "ttl_seconds": self._cache.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                # Only lookups answered from the cache; coalesced ones waited for an agent call.
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,174 @@
+"""
+Minimal threaded pipeline stages.
+
+A Stage is a bounded queue drained by a fixed pool of worker threads.
+Chaining stages (one stage's handler puts into the next) keeps slow steps
+from holding up fast ones, and the bounded queues push back on the
+producer once a stage falls behind. A MicroBatcher is a stage whose
+handler receives lists of items, collected for up to max_wait seconds
+or max_batch items, whichever comes first.
+"""
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Stage:
+    """A named pool of worker threads fed by a bounded queue."""
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[Any], None],
+        workers: int,
+        maxsize: int = 0,
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+    ):
+        self.name = name
+        self.workers = workers
+        self._handler = handler
+        self._on_error = on_error
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._threads: list[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+
+    def start(self) -> "Stage":
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        """Queue an item; blocks while the stage is full."""
+        self._queue.put(item, timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Let the workers finish what is queued, then stop them."""
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            try:
+                self._handler(item)
+                with self._lock:
+                    self.processed += 1
+            except Exception as e:
+                with self._lock:
+                    self.failed += 1
+                logger.exception("Stage %s failed on an item", self.name)
+                if self._on_error is not None:
+                    try:
+                        self._on_error(item, e)
+                    except Exception:
+                        logger.exception("Stage %s error handler failed", self.name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "name": self.name,
+                "workers": self.workers,
+                "queued": self._queue.qsize(),
+                "processed": self.processed,
+                "failed": self.failed,
+            }
+
+
+class MicroBatcher:
+    """
+    Collects queued items into batches of at most max_batch, flushing a
+    partial batch max_wait seconds after its first item arrived. Batches
+    are handed to a Stage of `workers` threads running handler(batch).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        handler: Callable[[list], None],
+        max_batch: int,
+        max_wait: float,
+        workers: int,
+        maxsize: int = 0,
+        on_error: Optional[Callable[[list, Exception], None]] = None,
+    ):
+        self.name = name
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: queue.Queue = queue.Queue(maxsize)
+        self._senders = Stage(name, handler, workers, maxsize=workers * 2, on_error=on_error)
+        self._collector: Optional[threading.Thread] = None
+        self.batches = 0
+        self.items = 0
+
+    def start(self) -> "MicroBatcher":
+        self._senders.start()
+        self._collector = threading.Thread(target=self._collect, name=f"{self.name}-collector", daemon=True)
+        self._collector.start()
+        return self
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        """Queue an item; blocks while the batcher is full."""
+        self._queue.put(item, timeout=timeout)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Flush what is queued as final batches, then stop the senders."""
+        if self._collector is not None:
+            self._queue.put(_STOP)
+            self._collector.join(timeout)
+            self._collector = None
+        self._senders.stop(timeout)
+
+    def _collect(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stopping = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.batches += 1
+            self.items += len(batch)
+            self._senders.put(batch)
+            if stopping:
+                return
+
+    def stats(self) -> dict:
+        senders = self._senders.stats()
+        return {
+            "name": self.name,
+            "workers": senders["workers"],
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "batches_failed": senders["failed"],
+        }
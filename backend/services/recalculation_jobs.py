@@ -0,0 +1,172 @@
+"""
+Background, resumable recalculation of every user's emissions.
+
+A job walks the users collection in document-id order, one page at a time.
+Each page is recalculated on a worker pool, the new movement emissions are
+written with batched writes (movementEmission, plus the change added to
+carbonEmission) and the per-user results plus the page's checkpoint cursor
+are stored under jobs/{job_id} in a single batch. Nothing is accumulated in
+memory, and a job that stopped (crash, deploy, cancel) can be resumed from
+its last checkpoint. Run one job at a time: the change is taken against the
+movementEmission read with the page.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Optional
+from uuid import uuid4
+
+from firebase_admin import firestore
+
+from database import job_crud, user_crud
+
+from services.emission_service import MOVEMENT_EMISSION_FIELD, EmissionService
+
+logger = logging.getLogger(__name__)
+
+JOB_KIND = "recalculate_emissions"
+DEFAULT_MAX_WORKERS = int(os.getenv("RECALC_MAX_WORKERS", "16"))
+# Results and the job checkpoint share one batched write (500 ops max).
+PAGE_SIZE = 400
+
+# job_id -> cancel event, for jobs running in this process
+_running: dict[str, threading.Event] = {}
+_running_lock = threading.Lock()
+
+
+def _pages(items: Iterable, size: int):
+    page = []
+    for item in items:
+        page.append(item)
+        if len(page) >= size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _recalculate_one(user_id: str) -> tuple[str, Optional[dict], Optional[str]]:
+    try:
+        return user_id, EmissionService.recalculate_user(user_id), None
+    except Exception as e:
+        return user_id, None, str(e)
+
+
+def _process_page(job_id: str, pool: ThreadPoolExecutor, page: list[tuple[str, dict]]) -> None:
+    previous = {user_id: (data or {}).get(MOVEMENT_EMISSION_FIELD) for user_id, data in page}
+    outcomes = list(pool.map(_recalculate_one, previous))
+
+    updates = {
+        uid: EmissionService.movement_emission_update(previous[uid], r[MOVEMENT_EMISSION_FIELD])
+        for uid, r, _ in outcomes if r is not None
+    }
+    written = user_crud.bulk_update_users(updates) if updates else {}
+
+    results = {}
+    for user_id, result, error in outcomes:
+        if result is not None and not written.get(user_id):
+            error = f"failed to write {MOVEMENT_EMISSION_FIELD}"
+        results[user_id] = {**(result or {}), "status": "error" if error else "ok", "error": error}
+    succeeded = sum(r["status"] == "ok" for r in results.values())
+
+    checkpoint = {
+        "cursor": page[-1][0],
+        "processed": firestore.Increment(len(page)),
+        "succeeded": firestore.Increment(succeeded),
+        "failed": firestore.Increment(len(page) - succeeded),
+    }
+    if not job_crud.update_job(job_id, checkpoint, results):
+        raise RuntimeError(f"Could not checkpoint job {job_id} after user {page[-1][0]}")
+
+
+def _run(job_id: str, max_workers: int, page_size: int, cursor: Optional[str], cancel: threading.Event) -> None:
+    logger.info("Recalculation job %s started after cursor %s", job_id, cursor)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"recalc-{job_id[:8]}") as pool:
+            users = user_crud.iter_users(fields=[MOVEMENT_EMISSION_FIELD], start_after=cursor, page_size=page_size)
+            for page in _pages(users, page_size):
+                if cancel.is_set():
+                    job_crud.update_job(job_id, {"status": "cancelled"})
+                    logger.info("Recalculation job %s cancelled", job_id)
+                    return
+                _process_page(job_id, pool, page)
+        job_crud.update_job(job_id, {"status": "completed"})
+        logger.info("Recalculation job %s completed", job_id)
+    except Exception as e:
+        logger.exception("Recalculation job %s failed", job_id)
+        job_crud.update_job(job_id, {"status": "failed", "error": str(e)})
+    finally:
+        with _running_lock:
+            _running.pop(job_id, None)
+
+
+def _launch(job_id: str, max_workers: int, page_size: int, cursor: Optional[str]) -> None:
+    cancel = threading.Event()
+    with _running_lock:
+        _running[job_id] = cancel
+    threading.Thread(
+        target=_run, args=(job_id, max_workers, page_size, cursor, cancel), name=f"job-{job_id}", daemon=True
+    ).start()
+
+
+def start_job(max_workers: Optional[int] = None, page_size: int = PAGE_SIZE) -> str:
+    """Create a recalculation job, start it in the background and return its id."""
+    job_id = uuid4().hex
+    max_workers = max_workers or DEFAULT_MAX_WORKERS
+    page_size = min(page_size, PAGE_SIZE)
+    created = job_crud.create_job(job_id, {
+        "kind": JOB_KIND,
+        "status": "running",
+        "cursor": None,
+        "processed": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "max_workers": max_workers,
+        "page_size": page_size,
+        "error": None,
+    })
+    if not created:
+        raise RuntimeError("Could not create recalculation job")
+    _launch(job_id, max_workers, page_size, None)
+    return job_id
+
+
+def resume_job(job_id: str) -> Optional[dict]:
+    """
+    Restart a job that is not running in this process from its last checkpoint.
+    Returns the job, or None if it does not exist.
+    """
+    job = job_crud.get_job(job_id)
+    if job is None or job.get("kind") != JOB_KIND:
+        return None
+    with _running_lock:
+        already_running = job_id in _running
+    if already_running or job["status"] == "completed":
+        return get_job(job_id)
+
+    job_crud.update_job(job_id, {"status": "running", "error": None})
+    _launch(job_id, job["max_workers"], job["page_size"], job.get("cursor"))
+    return get_job(job_id)
+
+
+def cancel_job(job_id: str) -> bool:
+    """Ask a job running in this process to stop after its current page."""
+    with _running_lock:
+        cancel = _running.get(job_id)
+    if cancel is None:
+        return False
+    cancel.set()
+    return True
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Job status and progress counters, as stored in Firestore."""
+    job = job_crud.get_job(job_id)
+    if job is None or job.get("kind") != JOB_KIND:
+        return None
+    with _running_lock:
+        job["running_in_this_process"] = job_id in _running
+    return job
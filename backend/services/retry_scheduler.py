@@ -0,0 +1,111 @@
+"""
+Non-blocking retries with jittered exponential backoff.
+
+RetryScheduler is a delay queue: failed items go into a heap keyed by
+their due time and a single timer thread hands each one back to the
+resubmit callback when it is due. No worker sleeps while an item waits,
+so during an FCM brownout the workers keep serving fresh messages.
+
+Items that run out of attempts, or fail with a permanent error, go to a
+dead-letter sink instead.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "5"))
+
+
+def backoff_delay(attempt: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2**(attempt-1))]."""
+    return random.uniform(0, min(cap, base * 2 ** max(attempt - 1, 0)))
+
+
+class JsonlDeadLetterSink:
+    """Appends dead-lettered items, one JSON object per line, to a local file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def __call__(self, record: dict) -> None:
+        line = json.dumps({"dead_lettered_at": datetime.now(timezone.utc).isoformat(), **record}, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+            self.count += 1
+
+
+class RetryScheduler:
+    """
+    Delay queue driven by one timer thread.
+    resubmit(item) is called on that thread when an item is due, so it
+    should only enqueue the item somewhere, not do the work itself.
+    """
+
+    def __init__(self, resubmit: Callable[[Any], None], name: str = "retry"):
+        self._resubmit = resubmit
+        self._heap: list = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f"{name}-timer", daemon=True)
+        self.scheduled = 0
+        self.resubmitted = 0
+
+    def start(self) -> "RetryScheduler":
+        self._thread.start()
+        return self
+
+    def schedule(self, item: Any, delay: float) -> bool:
+        """Queue item to be resubmitted after delay seconds. False once stopped."""
+        with self._cond:
+            if self._stopped:
+                return False
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), item))
+            self.scheduled += 1
+            self._cond.notify()
+            return True
+
+    def stop(self) -> list:
+        """Stop the timer and return the items that were still waiting."""
+        with self._cond:
+            self._stopped = True
+            pending = [item for _, _, item in sorted(self._heap)]
+            self._heap = []
+            self._cond.notify()
+        self._thread.join()
+        return pending
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopped and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._stopped:
+                    return
+                _, _, item = heapq.heappop(self._heap)
+            try:
+                self._resubmit(item)
+                self.resubmitted += 1
+            except Exception:
+                logger.exception("Retry resubmission failed")
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending": len(self._heap), "scheduled": self.scheduled, "resubmitted": self.resubmitted}
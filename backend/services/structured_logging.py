@@ -0,0 +1,223 @@
+"""
+Structured, sampled, non-blocking logging for the API and the listener.
+
+configure_logging() replaces the root handlers with one QueueHandler: the
+calling thread only samples, redacts/truncates and enqueues the record,
+and a QueueListener thread formats it (one JSON object per line by
+default) and writes it to stdout. A full queue drops records and counts
+them instead of blocking the request or message being handled.
+
+Below WARNING, loggers listed in LOG_SAMPLE_RATES keep only that fraction
+of records (default: 1% of user_crud successes and of per-message
+listener events), e.g. LOG_SAMPLE_RATES="database.user_crud=0.1".
+Sensitive fields (tokens, emails, passwords) are masked and long values
+truncated to LOG_MAX_VALUE_CHARS, both in message arguments and in
+structured extra={...} fields.
+"""
+from __future__ import annotations
+
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text".
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "database.user_crud=0.01,pubsub_listener.messages=0.01")
+LOG_MAX_VALUE_CHARS = int(os.getenv("LOG_MAX_VALUE_CHARS", "512"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REDACTED_KEYS = frozenset({"fcm_token", "token", "email", "password", "authorization", "api_key"})
+# The same keys inside serialized JSON, e.g. a raw Pub/Sub payload; the
+# closing quote is optional so a value cut off by truncation is still masked.
+_REDACT_JSON = re.compile(r'("(?:%s)"\s*:\s*)"[^"]*"?' % "|".join(sorted(REDACTED_KEYS)), re.IGNORECASE)
+REDACTED = "[REDACTED]"
+
+# LogRecord attributes that are not structured extra={...} fields.
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "name=rate,..." into {name: rate}; malformed entries are ignored."""
+    rates = {}
+    for item in spec.split(","):
+        name, _, rate = item.partition("=")
+        try:
+            rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+def redact(value: Any, max_chars: int = LOG_MAX_VALUE_CHARS, _depth: int = 0) -> Any:
+    """Mask sensitive keys and truncate long strings in a log argument."""
+    if isinstance(value, (str, bytes)):
+        text = value if isinstance(value, str) else value.decode("utf-8", "replace")
+        if len(text) > max_chars:
+            text = f"{text[:max_chars]}...[{len(text) - max_chars} more chars]"
+        return _REDACT_JSON.sub(r'\1"%s"' % REDACTED, text) if '"' in text else text
+    if isinstance(value, dict) and _depth < 4:
+        return {
+            k: REDACTED if isinstance(k, str) and k.lower() in REDACTED_KEYS else redact(v, max_chars, _depth + 1)
+            for k, v in itertools.islice(value.items(), 50)
+        }
+    if isinstance(value, (list, tuple)) and _depth < 4:
+        return [redact(v, max_chars, _depth + 1) for v in value[:50]]
+    return value
+
+
+def mask_token(token: Optional[str], keep: int = 6) -> str:
+    """
+    A token reduced to its last `keep` characters, for log arguments that
+    are not under a REDACTED_KEYS key; enough to correlate lines, not to use it.
+    """
+    if not token:
+        return REDACTED
+    return f"...{token[-keep:]}" if len(token) > 2 * keep else REDACTED
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps 1 in round(1/rate) records below WARNING for the configured loggers (and their children)."""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self._every: Dict[str, int] = {}
+        self._counters: Dict[str, itertools.count] = {}
+
+    def _interval(self, name: str) -> int:
+        every = self._every.get(name)
+        if every is None:
+            rate, logger_name = 1.0, name
+            while logger_name:
+                if logger_name in self.rates:
+                    rate = self.rates[logger_name]
+                    break
+                logger_name = logger_name.rpartition(".")[0]
+            every = 0 if rate <= 0 else max(1, round(1 / rate))
+            self._counters[name] = itertools.count()
+            self._every[name] = every
+        return every
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        every = self._interval(record.name)
+        if every == 1:
+            return True
+        return every > 0 and next(self._counters[record.name]) % every == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, message, extra fields and exception."""
+
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that redacts and truncates before enqueueing and drops
+    records (counting them) when the queue is full.
+    """
+
+    def __init__(self, log_queue: queue.Queue, max_chars: int = LOG_MAX_VALUE_CHARS):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, dict):
+            record.args = redact(record.args, self.max_chars)
+        elif record.args:
+            record.args = tuple(redact(a, self.max_chars) for a in record.args)
+        for key, value in list(record.__dict__.items()):
+            if key not in _RECORD_ATTRS:
+                record.__dict__[key] = redact(value, self.max_chars)
+        # Merge the message now so later changes to the arguments cannot leak
+        # into it, and render the traceback so no frames outlive the call.
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    fmt: str = LOG_FORMAT,
+    sample_rates: Optional[Dict[str, float]] = None,
+    max_chars: int = LOG_MAX_VALUE_CHARS,
+    queue_size: int = LOG_QUEUE_SIZE,
+) -> AsyncQueueHandler:
+    """
+    Install the queue handler on the root logger (once per process) and
+    start the background writer. Returns the handler, e.g. for its dropped count.
+    """
+    global _listener
+    with _lock:
+        root = logging.getLogger()
+        for handler in root.handlers:
+            if isinstance(handler, AsyncQueueHandler):
+                return handler
+
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(
+            JsonFormatter() if fmt == "json" else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+        log_queue: queue.Queue = queue.Queue(queue_size)
+        handler = AsyncQueueHandler(log_queue, max_chars)
+        handler.addFilter(SamplingFilter(parse_sample_rates(LOG_SAMPLE_RATES) if sample_rates is None else sample_rates))
+
+        for old in root.handlers[:]:
+            root.removeHandler(old)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return handler
+
+
+def shutdown_logging() -> None:
+    """Flush queued records and stop the background writer."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
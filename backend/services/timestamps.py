@@ -0,0 +1,232 @@
+"""
+One place to turn movement timestamps into epoch seconds.
+
+Movement points carry their time in one of three shapes:
+
+- ISO-8601 strings, as location_service.dart writes them
+  (DateTime.toIso8601String(): naive local time, or "Z" for UTC) and as
+  movement chunks render them ("+00:00" when the upload was zone-aware);
+- the legacy Firestore-console text, "September 27, 2025 at 10:41:42 PM UTC-4";
+- native Firestore timestamps (datetime subclasses, or protobuf
+  Timestamps with seconds/nanos).
+
+to_seconds() handles one value of any of them, honouring the UTC offset
+it carries (naive times are taken as UTC, the convention the chunk codec
+stores them with). to_epoch_seconds() parses a whole column: a column of
+ISO strings sharing one offset goes through NumPy's C datetime64 parser
+in one call, a column of legacy strings is split with byte-level NumPy
+ops, anything else falls back to to_seconds() per value.
+"""
+from __future__ import annotations
+
+import math
+import warnings
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+# strptime spelling of the legacy console format; the zone may be any "UTC±H[:MM]".
+LEGACY_FORMAT = "%B %d, %Y at %I:%M:%S %p UTC%z"
+_EPOCH = datetime(1970, 1, 1)
+
+
+@lru_cache(maxsize=64)
+def _offset_seconds(offset: str) -> float:
+    """Seconds east of UTC for "", "Z", "+05:30", "-4", "-04:00"."""
+    if offset in ("", "Z"):
+        return 0.0
+    sign, (hours, _, minutes) = offset[0], offset[1:].partition(":")
+    if sign not in "+-" or not hours.isdigit() or (minutes and not minutes.isdigit()):
+        raise ValueError(f"Invalid UTC offset {offset!r}")
+    hours, minutes = int(hours), int(minutes or 0)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Invalid UTC offset {offset!r}")
+    value = hours * 3600 + minutes * 60
+    return -value if sign == "-" else value
+
+
+@lru_cache(maxsize=1024)
+def _day_seconds(date_part: str) -> float:
+    return (datetime.strptime(date_part, "%B %d, %Y") - _EPOCH).total_seconds()
+
+
+def legacy_seconds(ts: str) -> float:
+    """
+    Epoch seconds for the legacy console format, zone included.
+    A trace covers few distinct days and zones, so only those go through
+    strptime (cached) and the clock part is split by hand.
+    """
+    date_part, sep, time_part = ts.partition(" at ")
+    try:
+        clock, meridiem, zone = time_part.split(" ")
+        hours, minutes, seconds = (int(v) for v in clock.split(":"))
+    except ValueError:
+        raise ValueError(f"time data {ts!r} does not match format {LEGACY_FORMAT!r}") from None
+    if not sep or not zone.startswith("UTC") or meridiem not in ("AM", "PM") or not 1 <= hours <= 12:
+        raise ValueError(f"time data {ts!r} does not match format {LEGACY_FORMAT!r}")
+    hours = hours % 12 + (12 if meridiem == "PM" else 0)
+    local = _day_seconds(date_part) + hours * 3600 + minutes * 60 + seconds
+    return local - _offset_seconds(zone[3:])
+
+
+def iso_seconds(ts: str) -> float:
+    """Epoch seconds for an ISO-8601 string; naive times are taken as UTC."""
+    dt = datetime.fromisoformat(ts)
+    if dt.tzinfo is not None:
+        return dt.timestamp()
+    return (dt - _EPOCH).total_seconds()
+
+
+def to_seconds(value: Any) -> float:
+    """
+    Epoch seconds for one ISO-8601 or legacy string, datetime or Firestore
+    timestamp. Raises ValueError (unparseable text) or TypeError (other types).
+    """
+    if isinstance(value, str):
+        return iso_seconds(value) if value[:1].isdigit() else legacy_seconds(value)
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            return value.timestamp()
+        return (value - _EPOCH).total_seconds()
+    if hasattr(value, "seconds") and hasattr(value, "nanos"):
+        return value.seconds + value.nanos / 1e9
+    raise TypeError(f"Unsupported timestamp type: {type(value).__name__}")
+
+
+def _iso_suffix(ts: str) -> str:
+    if ts.endswith("Z"):
+        return "Z"
+    if len(ts) > 16 and ts[-6] in "+-" and ts[-3] == ":":
+        return ts[-6:]
+    return ""
+
+
+def _iso_column(values: Sequence[str]) -> Optional[np.ndarray]:
+    """
+    Parse ISO strings that share one UTC offset with datetime64, or None
+    when the column does not qualify (mixed offsets, other formats, blanks).
+    """
+    if not values[0][:1].isdigit():
+        return None
+    suffix = _iso_suffix(values[0])
+    if suffix:
+        if not all(v.endswith(suffix) for v in values):
+            return None
+        values = [v[:-len(suffix)] for v in values]
+    try:
+        with warnings.catch_warnings():
+            # numpy only warns about a zone it would silently apply.
+            warnings.simplefilter("error")
+            parsed = np.array(values, dtype="datetime64[us]")
+    except (ValueError, Warning):
+        return None
+    if np.isnat(parsed).any():
+        return None
+    return parsed.astype(np.int64) / 1e6 - _offset_seconds(suffix)
+
+
+# Bytes compared between consecutive values to find runs of one date or
+# zone (multiples of 8, compared as uint64 words).
+_DATE_WIDTH = 24
+_ZONE_WIDTH = 8
+# A legacy value from its hour's tens digit through the zone name; "0" marks digits.
+_LEGACY_CLOCK = np.frombuffer(b"00:00:00 AM UTC", dtype=np.uint8)
+_CLOCK_DIGITS = [0, 1, 3, 4, 6, 7]
+_CLOCK_FIXED = [2, 5, 8, 10, 11, 12, 13, 14]
+
+
+def _runs(buf: np.ndarray, starts: np.ndarray, lengths: np.ndarray, width: int) -> Optional[np.ndarray]:
+    """True where the text at starts[i] (lengths[i] bytes) differs from the previous value's."""
+    if (lengths > width).any():
+        return None
+    masks = np.where(np.arange(width) < np.arange(width + 1)[:, None], 0xFF, 0).astype(np.uint8)
+    words = np.lib.stride_tricks.sliding_window_view(buf, width)[starts].view(np.uint64)
+    words &= masks.view(np.uint64)[lengths]
+    changed = np.ones(len(starts), dtype=bool)
+    changed[1:] = (lengths[1:] != lengths[:-1]) | (words[1:] != words[:-1]).any(axis=1)
+    return changed
+
+
+def _legacy_column(values: Sequence[str]) -> Optional[np.ndarray]:
+    """
+    Parse a column in the legacy console format with byte-level NumPy ops,
+    or None when any value strays from "<Month> <d>, <yyyy> at <h>:<mm>:<ss>
+    <AM|PM> UTC<offset>". A trace has few runs of one date and zone, so only
+    the first value of each run goes through the cached date/zone parsers.
+    """
+    try:
+        raw = ("\n".join(values) + "\n").encode("ascii")
+    except UnicodeEncodeError:
+        return None
+    n = len(values)
+    buf = np.frombuffer(raw + bytes(_DATE_WIDTH), dtype=np.uint8)
+    ends = np.flatnonzero(buf == ord("\n"))
+    spaces = np.flatnonzero(buf == ord(" "))
+    if len(ends) != n or len(spaces) != 6 * n:
+        return None
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    spaces = spaces.reshape(n, 6)
+    # Six spaces inside every value, not just six per value overall.
+    if not ((spaces[:, 0] > starts).all() and (spaces[:, 5] < ends).all()):
+        return None
+
+    at, clock_end = spaces[:, 2], spaces[:, 4]
+    width = clock_end - spaces[:, 3] - 1
+    windows = np.lib.stride_tricks.sliding_window_view
+    clock = windows(buf, len(_LEGACY_CLOCK))[clock_end - 8]
+    clock[width == 7, 0] = ord("0")
+    # uint8 wraps anything below "0" past 9.
+    digits = (clock[:, _CLOCK_DIGITS] - np.uint8(ord("0"))).astype(np.int64)
+    hours = digits[:, 0] * 10 + digits[:, 1]
+    pm = clock[:, 9] == ord("P")
+    ok = (
+        (windows(buf, 4)[at] == np.frombuffer(b" at ", dtype=np.uint8)).all(axis=1)
+        & (clock[:, _CLOCK_FIXED] == _LEGACY_CLOCK[_CLOCK_FIXED]).all(axis=1)
+        & (digits <= 9).all(axis=1) & ((width == 7) | (width == 8)) & (hours >= 1) & (hours <= 12)
+        & (pm | (clock[:, 9] == ord("A")))
+    )
+    if not ok.all():
+        return None
+
+    zone = clock_end + 7
+    date_runs = _runs(buf, starts, at - starts, _DATE_WIDTH)
+    zone_runs = _runs(buf, zone, ends - zone, _ZONE_WIDTH)
+    if date_runs is None or zone_runs is None:
+        return None
+    new_run = date_runs | zone_runs
+    first = np.flatnonzero(new_run)
+    try:
+        day = [_day_seconds(values[i][:k]) for i, k in zip(first.tolist(), (at - starts)[first].tolist())]
+        offset = [_offset_seconds(values[i][k:]) for i, k in zip(first.tolist(), (zone - starts)[first].tolist())]
+    except ValueError:
+        return None
+    run = np.cumsum(new_run) - 1
+
+    hours = hours % 12 + 12 * pm
+    clock = hours * 3600 + digits[:, 2:] @ np.array([600, 60, 10, 1])
+    return np.asarray(day)[run] + clock - np.asarray(offset)[run]
+
+
+def to_epoch_seconds(values: Sequence[Any], errors: str = "raise") -> np.ndarray:
+    """
+    Epoch seconds for a whole column of timestamps (any mix of the supported shapes).
+    errors="coerce" turns values that cannot be parsed into NaN instead of raising.
+    """
+    n = len(values)
+    if not n:
+        return np.empty(0, dtype=np.float64)
+    if all(type(v) is str for v in values):
+        seconds = _iso_column(values) if values[0][:1].isdigit() else _legacy_column(values)
+        if seconds is not None:
+            return seconds
+    parse = to_seconds if errors == "raise" else _to_seconds_or_nan
+    return np.fromiter((parse(v) for v in values), dtype=np.float64, count=n)
+
+
+def _to_seconds_or_nan(value: Any) -> float:
+    try:
+        return to_seconds(value)
+    except (TypeError, ValueError):
+        return math.nan
@@ -0,0 +1,114 @@
+"""
+On-ingest simplification of movement traces.
+
+simplify() makes one forward pass over a time-ordered trace with O(1)
+state (the current anchor, the path length and the fastest segment
+since it) and decides for each fix whether it can be dropped, in the
+spirit of dead-reckoning / opening-window line simplification. A fix is
+only dropped when all of these hold for the stretch it belongs to:
+
+- distance: the straight line from the anchor is at most tolerance_m
+  shorter than the path it replaces. Chords never exceed the path, so
+  the simplified trace's distance D' satisfies
+  D - tolerance_m * (kept_points - 1) <= D' <= D;
+- speed: the merged segment's speed (movement_engine semantics: reported
+  speed of its end point, else chord over elapsed time) is at most the
+  fastest replaced segment, and every segment that sets a new maximum is
+  kept intact. The simplified trace therefore has exactly the same max
+  speed, hence the same transportation classification;
+- time: the stretch spans at most max_gap_s seconds, so stops still show
+  up as a fix every max_gap_s instead of one long gap.
+
+The first and last fix are always kept, so segments that bridge two
+uploads are unchanged.
+"""
+from __future__ import annotations
+
+import math
+import os
+from dataclasses import dataclass
+
+import numpy as np
+
+from services import movement_engine
+
+MOVEMENT_SIMPLIFY_TOLERANCE_M = float(os.getenv("MOVEMENT_SIMPLIFY_TOLERANCE_M", "5"))
+MOVEMENT_SIMPLIFY_MAX_GAP_S = float(os.getenv("MOVEMENT_SIMPLIFY_MAX_GAP_S", "120"))
+
+# Float slack so an unmodified segment always passes its own checks.
+_EPS = 1e-9
+
+
+@dataclass
+class SimplifyResult:
+    keep: np.ndarray           # bool mask over the input points
+    distance_km: float         # original trace distance
+    simplified_km: float       # distance of the kept points
+    max_error_km: float        # guaranteed bound on distance_km - simplified_km
+
+    @property
+    def kept(self) -> int:
+        return int(self.keep.sum())
+
+
+def simplify(
+    cols: movement_engine.MovementColumns,
+    tolerance_m: float = MOVEMENT_SIMPLIFY_TOLERANCE_M,
+    max_gap_s: float = MOVEMENT_SIMPLIFY_MAX_GAP_S,
+) -> SimplifyResult:
+    """
+    Choose which fixes of a time-ordered trace to keep.
+    cols must carry seconds (see MovementColumns). tolerance_m <= 0 keeps everything.
+    """
+    n = len(cols)
+    keep = np.ones(n, dtype=bool)
+    if n < 3 or tolerance_m <= 0:
+        distance = float(movement_engine.segment_distances(cols).sum()) if n >= 2 else 0.0
+        return SimplifyResult(keep, distance, distance, 0.0)
+
+    seg_km = movement_engine.segment_distances(cols)
+    seg_speed = movement_engine.segment_speeds(cols, seg_km)
+    lat = cols.latitude.tolist()
+    lon = cols.longitude.tolist()
+    seconds = cols.seconds.tolist()
+    reported = cols.speed_kmh.tolist()
+    seg_km_l = seg_km.tolist()
+    seg_speed_l = seg_speed.tolist()
+    tolerance_km = tolerance_m / 1000.0
+
+    keep[1:-1] = False
+    anchor = 0
+    path_km = 0.0
+    window_max = -math.inf
+    running_max = -math.inf
+    for i in range(1, n):
+        d, v = seg_km_l[i - 1], seg_speed_l[i - 1]
+        if v > running_max:
+            # A new maximum: keep this segment exactly as recorded.
+            running_max = v
+            keep[i - 1] = keep[i] = True
+            anchor, path_km, window_max = i, 0.0, -math.inf
+            continue
+        path_km += d
+        window_max = max(window_max, v)
+        if anchor == i - 1:
+            continue
+        chord = movement_engine.haversine_km(lat[anchor], lon[anchor], lat[i], lon[i])
+        dt_hours = (seconds[i] - seconds[anchor]) / 3600.0
+        if reported[i] > 0:
+            merged_speed = reported[i]
+        else:
+            merged_speed = chord / dt_hours if dt_hours > 0 else 0.0
+        if (
+            path_km - chord > tolerance_km + _EPS
+            or merged_speed > window_max + _EPS
+            or seconds[i] - seconds[anchor] > max_gap_s
+        ):
+            keep[i - 1] = True
+            anchor, path_km, window_max = i - 1, d, v
+
+    kept = np.flatnonzero(keep)
+    simplified = float(movement_engine.haversine_np(
+        cols.latitude[kept[:-1]], cols.longitude[kept[:-1]], cols.latitude[kept[1:]], cols.longitude[kept[1:]]
+    ).sum())
+    return SimplifyResult(keep, float(seg_km.sum()), simplified, tolerance_km * (len(kept) - 1))
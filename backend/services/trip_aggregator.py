@@ -0,0 +1,133 @@
+"""
+Incremental trip aggregation.
+
+Instead of recomputing distance and mode from every raw movement point, a
+per-user checkpoint keeps the running totals and the last processed point.
+Each refresh reads only the points after that checkpoint (page by page) and
+folds them in, so the cost is proportional to new data, not total history.
+
+Points are also fed through a services.trip_segmenter.TripSegmenter whose
+state lives in the checkpoint, so the user's distance is split by the mode
+of each trip instead of labelled with one mode from the max speed.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass, field
+from typing import Iterable, Optional
+
+from database import user_crud
+
+from services import geocoding, movement_engine, trip_segmenter
+
+# Fields of a movement point needed to bridge to the next batch.
+_POINT_FIELDS = ("id", "latitude", "longitude", "speed_kmh", "timestamp")
+
+
+@dataclass
+class TripCheckpoint:
+    last_point: Optional[dict] = None
+    distance_km: float = 0.0
+    max_speed_kmh: float = 0.0
+    transportation: str = movement_engine.classify_speed(0.0)
+    country: Optional[str] = None
+    points: int = 0
+    # km per mode of completed trips, and of the trip still open (provisional).
+    mode_distance_km: dict = field(default_factory=dict)
+    open_mode_distance_km: dict = field(default_factory=dict)
+    segmenter: Optional[dict] = None
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> "TripCheckpoint":
+        if not data:
+            return cls()
+        return cls(**{k: data[k] for k in cls.__dataclass_fields__ if k in data})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def distance_by_mode(self) -> dict:
+        """km per transportation mode, the open trip included."""
+        totals = dict(self.mode_distance_km)
+        for mode, km in self.open_mode_distance_km.items():
+            totals[mode] = totals.get(mode, 0.0) + km
+        return totals
+
+    def summary(self) -> dict:
+        """process_movements output plus the per-mode split."""
+        return {
+            "transportation": self.transportation,
+            "distance_km": round(self.distance_km, 2),
+            "country": self.country or "Unknown",
+            "distance_by_mode_km": {mode: round(km, 3) for mode, km in self.distance_by_mode().items()},
+        }
+
+
+def fold(checkpoint: TripCheckpoint, movements: list[dict]) -> TripCheckpoint:
+    """
+    Fold a batch of new, time-ordered points into the checkpoint.
+    The checkpoint's last point is prepended so the segment bridging the
+    previous batch and this one is counted exactly once.
+    """
+    if not movements:
+        return checkpoint
+
+    if checkpoint.country is None:
+        first = movements[0]
+        checkpoint.country = geocoding.reverse_country(first["latitude"], first["longitude"])
+
+    trace = [checkpoint.last_point, *movements] if checkpoint.last_point else movements
+    distance, max_speed = movement_engine.trace_stats(trace)
+
+    segmenter = trip_segmenter.TripSegmenter.from_dict(checkpoint.segmenter)
+    # Checkpoints from before segmentation resume from their last point.
+    fed = trace if checkpoint.segmenter is None else movements
+    for point in fed:
+        trip_segmenter.mode_distances(segmenter.push(point), checkpoint.mode_distance_km)
+    checkpoint.segmenter = segmenter.to_dict()
+    checkpoint.open_mode_distance_km = trip_segmenter.mode_distances(segmenter.pending())
+
+    checkpoint.distance_km += distance
+    checkpoint.max_speed_kmh = max(checkpoint.max_speed_kmh, max_speed)
+    by_mode = checkpoint.distance_by_mode()
+    checkpoint.transportation = (
+        max(by_mode, key=by_mode.get) if by_mode else movement_engine.classify_speed(checkpoint.max_speed_kmh)
+    )
+    checkpoint.points += len(movements)
+    last = movements[-1]
+    checkpoint.last_point = {k: last.get(k) for k in _POINT_FIELDS}
+    return checkpoint
+
+
+def _batches(points: Iterable[dict], size: int):
+    batch = []
+    for point in points:
+        batch.append(point)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def refresh_user_trip(user_id: str, batch_size: int = user_crud.MOVEMENTS_PAGE_SIZE) -> dict:
+    """
+    Fold every movement point newer than the user's checkpoint, persist the
+    new checkpoint and return the trip summary.
+    """
+    checkpoint = TripCheckpoint.from_dict(user_crud.get_trip_checkpoint(user_id))
+    cursor = (checkpoint.last_point or {}).get("id")
+
+    new_points = user_crud.iter_user_movements(user_id, start_after=cursor, page_size=batch_size)
+    folded = 0
+    for batch in _batches(new_points, batch_size):
+        fold(checkpoint, batch)
+        folded += len(batch)
+
+    if folded:
+        user_crud.save_trip_checkpoint(user_id, checkpoint.to_dict())
+    return {**checkpoint.summary(), "new_points": folded}
+
+
+def reset_user_trip(user_id: str) -> bool:
+    """Drop the checkpoint so the next refresh starts from the first point."""
+    return user_crud.save_trip_checkpoint(user_id, TripCheckpoint().to_dict())
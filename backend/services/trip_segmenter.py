@@ -0,0 +1,468 @@
+"""
+Single-pass, constant-memory trip segmentation.
+
+summarize() labels a whole trace with one mode from its max speed, so a
+single GPS glitch turns a day of walking into "airplane". TripSegmenter
+instead consumes points one at a time (e.g. straight from
+user_crud.iter_user_movements) and emits a record as soon as a segment
+is complete:
+
+- a stop ("kind": "stop") when the trace stays within TRIP_STOP_RADIUS_M
+  of one point for at least TRIP_STOP_MIN_S;
+- a trip ("kind": "trip") for the movement between stops, also cut where
+  no fix arrives for more than TRIP_GAP_S.
+
+Each trip's mode comes from a time-weighted speed quantile
+(TRIP_SPEED_QUANTILE, default the 85th percentile): a speed has to be held
+for that share of the trip's time to count, so short spikes do not. The
+quantile is read from a fixed-size speed histogram whose bin edges
+include the SPEED_THRESHOLDS, so state per segment is O(1) however long
+the trace is, and classifying the quantile is exact at the thresholds.
+
+segment_columns() produces the same records for a whole MovementColumns
+with array operations, for callers that hold the trace in memory.
+"""
+from __future__ import annotations
+
+import math
+import os
+from bisect import bisect_right
+from typing import Any, Iterable, Iterator, Optional
+
+import numpy as np
+
+from services import movement_engine, timestamps
+
+TRIP_STOP_RADIUS_M = float(os.getenv("TRIP_STOP_RADIUS_M", "50"))
+TRIP_STOP_MIN_S = float(os.getenv("TRIP_STOP_MIN_S", "300"))
+TRIP_GAP_S = float(os.getenv("TRIP_GAP_S", "600"))
+TRIP_SPEED_QUANTILE = float(os.getenv("TRIP_SPEED_QUANTILE", "0.85"))
+
+# Geometric bins (25% wide) from 0.5 km/h, plus the mode thresholds as exact edges.
+SPEED_BIN_EDGES_KMH = tuple(sorted(
+    {round(0.5 * 1.25 ** k, 3) for k in range(40)} | {upper for upper, _ in movement_engine.SPEED_THRESHOLDS}
+))
+
+
+class SpeedHistogram:
+    """Seconds spent in each speed bin; mergeable and fixed-size."""
+
+    __slots__ = ("seconds", "total")
+
+    def __init__(self):
+        self.seconds = [0.0] * (len(SPEED_BIN_EDGES_KMH) + 1)
+        self.total = 0.0
+
+    def add(self, speed_kmh: float, seconds: float) -> None:
+        self.seconds[bisect_right(SPEED_BIN_EDGES_KMH, speed_kmh)] += seconds
+        self.total += seconds
+
+    @classmethod
+    def from_list(cls, seconds: list) -> "SpeedHistogram":
+        histogram = cls()
+        # A checkpoint written with other bin edges cannot be re-binned; start over.
+        if len(seconds) == len(histogram.seconds):
+            histogram.seconds = [float(v) for v in seconds]
+            histogram.total = sum(histogram.seconds)
+        return histogram
+
+    def merge(self, other: "SpeedHistogram") -> None:
+        self.seconds = [a + b for a, b in zip(self.seconds, other.seconds)]
+        self.total += other.total
+
+    def quantile(self, q: float, max_speed: float) -> float:
+        """Time-weighted speed quantile, interpolated inside its bin."""
+        if self.total <= 0:
+            return 0.0
+        target = q * self.total
+        seen = 0.0
+        for i, weight in enumerate(self.seconds):
+            if weight and seen + weight >= target:
+                lo = SPEED_BIN_EDGES_KMH[i - 1] if i else 0.0
+                hi = SPEED_BIN_EDGES_KMH[i] if i < len(SPEED_BIN_EDGES_KMH) else math.inf
+                hi = min(hi, max(max_speed, lo))
+                # Stay below the upper edge so the quantile classifies into its own bin.
+                return min(lo + (hi - lo) * (target - seen) / weight, lo + (hi - lo) * 0.999)
+            seen += weight
+        return max_speed
+
+
+class _Segment:
+    """Running statistics of one stretch of points."""
+
+    __slots__ = ("start", "start_seconds", "latitude", "longitude", "end", "end_seconds",
+                 "points", "distance_km", "max_speed_kmh", "speeds")
+
+    def __init__(self, latitude: float, longitude: float, seconds: float, timestamp: Any):
+        self.start = self.end = timestamp
+        self.start_seconds = self.end_seconds = seconds
+        self.latitude, self.longitude = latitude, longitude
+        self.points = 1
+        self.distance_km = 0.0
+        self.max_speed_kmh = 0.0
+        self.speeds = SpeedHistogram()
+
+    @property
+    def duration_s(self) -> float:
+        return self.end_seconds - self.start_seconds
+
+    def to_dict(self) -> dict:
+        data = {k: getattr(self, k) for k in self.__slots__ if k != "speeds"}
+        return {**data, "speeds": list(self.speeds.seconds)}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "_Segment":
+        segment = cls(data["latitude"], data["longitude"], data["start_seconds"], data["start"])
+        for key in ("end", "end_seconds", "points", "distance_km", "max_speed_kmh"):
+            setattr(segment, key, data[key])
+        segment.speeds = SpeedHistogram.from_list(data["speeds"])
+        return segment
+
+    def copy(self) -> "_Segment":
+        return _Segment.from_dict(self.to_dict())
+
+    def add(self, distance_km: float, speed_kmh: float, dt: float, seconds: float, timestamp: Any) -> None:
+        self.points += 1
+        self.distance_km += distance_km
+        self.max_speed_kmh = max(self.max_speed_kmh, speed_kmh)
+        if dt > 0:
+            self.speeds.add(speed_kmh, dt)
+        self.end, self.end_seconds = timestamp, seconds
+
+    def extend(self, other: "_Segment") -> None:
+        """Append a segment that starts at this one's last point."""
+        self.points += other.points - 1
+        self.distance_km += other.distance_km
+        self.max_speed_kmh = max(self.max_speed_kmh, other.max_speed_kmh)
+        self.speeds.merge(other.speeds)
+        self.end, self.end_seconds = other.end, other.end_seconds
+
+    def trip(self, split: str, quantile: float) -> dict:
+        speed = self.speeds.quantile(quantile, self.max_speed_kmh)
+        return {
+            "kind": "trip",
+            "transportation": movement_engine.classify_speed(speed),
+            "start": self.start,
+            "end": self.end,
+            "duration_s": self.duration_s,
+            "points": self.points,
+            "distance_km": round(self.distance_km, 3),
+            "median_speed_kmh": round(self.speeds.quantile(0.5, self.max_speed_kmh), 2),
+            "quantile_speed_kmh": round(speed, 2),
+            "max_speed_kmh": round(self.max_speed_kmh, 2),
+            "split": split,
+        }
+
+    def stop(self) -> dict:
+        return {
+            "kind": "stop",
+            "start": self.start,
+            "end": self.end,
+            "duration_s": self.duration_s,
+            "points": self.points,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+        }
+
+
+class TripSegmenter:
+    """
+    Feed time-ordered points with push(); each call returns the records
+    (zero, one or two) completed by that point. flush() closes the last one.
+    """
+
+    def __init__(
+        self,
+        stop_radius_m: float = TRIP_STOP_RADIUS_M,
+        stop_min_s: float = TRIP_STOP_MIN_S,
+        gap_s: float = TRIP_GAP_S,
+        quantile: float = TRIP_SPEED_QUANTILE,
+    ):
+        self.stop_radius_km = stop_radius_m / 1000.0
+        self.stop_min_s = stop_min_s
+        self.gap_s = gap_s
+        self.quantile = quantile
+        self.skipped = 0
+        # _trip runs up to the dwell anchor, _dwell from it: the trace has
+        # stayed within stop_radius_m of the anchor ever since.
+        self._trip: Optional[_Segment] = None
+        self._dwell: Optional[_Segment] = None
+        self._last: Optional[tuple] = None
+
+    def push(self, point: dict) -> list:
+        """Add one movement dict; points that cannot be read are skipped and counted."""
+        try:
+            latitude, longitude = float(point["latitude"]), float(point["longitude"])
+            speed_kmh = float(point.get("speed_kmh") or 0.0)
+            seconds = timestamps.to_seconds(point["timestamp"])
+        except (KeyError, TypeError, ValueError):
+            self.skipped += 1
+            return []
+        return self.add(latitude, longitude, speed_kmh, seconds, point["timestamp"])
+
+    def add(self, latitude: float, longitude: float, speed_kmh: float, seconds: float, timestamp: Any = None) -> list:
+        """Add one point given as values (speed_kmh <= 0 means unknown)."""
+        if self._last is None:
+            self._start(latitude, longitude, seconds, timestamp)
+            return []
+        last_lat, last_lon, last_seconds = self._last
+        dt = seconds - last_seconds
+        if dt > self.gap_s or dt < 0:
+            records = self._close(self._trip, "gap")
+            self._start(latitude, longitude, seconds, timestamp)
+            return records
+
+        distance = movement_engine.haversine_km(last_lat, last_lon, latitude, longitude)
+        if speed_kmh <= 0:
+            speed_kmh = distance / (dt / 3600.0) if dt > 0 else 0.0
+        self._last = (latitude, longitude, seconds)
+
+        dwell = self._dwell
+        if movement_engine.haversine_km(dwell.latitude, dwell.longitude, latitude, longitude) <= self.stop_radius_km:
+            dwell.add(distance, speed_kmh, dt, seconds, timestamp)
+            return []
+
+        records = []
+        if dwell.duration_s >= self.stop_min_s:
+            if self._trip.points > 1:
+                records.append(self._trip.trip("stop", self.quantile))
+            records.append(dwell.stop())
+            self._trip = _Segment(last_lat, last_lon, last_seconds, dwell.end)
+        else:
+            self._trip.extend(dwell)
+        self._trip.add(distance, speed_kmh, dt, seconds, timestamp)
+        self._dwell = _Segment(latitude, longitude, seconds, timestamp)
+        return records
+
+    def flush(self) -> list:
+        """Close the open segment (end of the stream)."""
+        records = self._close(self._trip, "end") if self._last is not None else []
+        self._trip = self._dwell = self._last = None
+        return records
+
+    def pending(self) -> list:
+        """The records flush() would emit now, without closing anything."""
+        return self._close(self._trip.copy(), "end") if self._last is not None else []
+
+    def to_dict(self) -> dict:
+        """State to resume from later (e.g. in a trip checkpoint); plain, Firestore-friendly values."""
+        if self._last is None:
+            return {"skipped": self.skipped}
+        return {
+            "trip": self._trip.to_dict(),
+            "dwell": self._dwell.to_dict(),
+            "last": list(self._last),
+            "skipped": self.skipped,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict], **options) -> "TripSegmenter":
+        """A segmenter resumed from to_dict() output (a fresh one for None)."""
+        segmenter = cls(**options)
+        if data:
+            segmenter.skipped = data.get("skipped", 0)
+            if data.get("last") is not None:
+                segmenter._trip = _Segment.from_dict(data["trip"])
+                segmenter._dwell = _Segment.from_dict(data["dwell"])
+                segmenter._last = tuple(data["last"])
+        return segmenter
+
+    def _start(self, latitude: float, longitude: float, seconds: float, timestamp: Any) -> None:
+        self._trip = _Segment(latitude, longitude, seconds, timestamp)
+        self._dwell = _Segment(latitude, longitude, seconds, timestamp)
+        self._last = (latitude, longitude, seconds)
+
+    def _close(self, trip: _Segment, split: str) -> list:
+        """Records for the open trip and dwell; extends trip with a dwell too short to be a stop."""
+        records = []
+        if self._dwell.duration_s >= self.stop_min_s:
+            if trip.points > 1:
+                records.append(trip.trip("stop", self.quantile))
+            records.append(self._dwell.stop())
+        else:
+            trip.extend(self._dwell)
+            if trip.points > 1:
+                records.append(trip.trip(split, self.quantile))
+        return records
+
+
+def segment_trips(points: Iterable[dict], **options) -> Iterator[dict]:
+    """Lazily segment a stream of time-ordered movement dicts (see TripSegmenter)."""
+    segmenter = TripSegmenter(**options)
+    for point in points:
+        yield from segmenter.push(point)
+    yield from segmenter.flush()
+
+
+def segment_columns(cols: movement_engine.MovementColumns, **options) -> list:
+    """
+    segment_trips for a MovementColumns, computed on whole arrays instead of
+    point by point (seconds used when present). Gives the same records as
+    segment_trips up to float summation order.
+    Points whose timestamp cannot be parsed are skipped, as push() does.
+    """
+    segmenter = TripSegmenter(**options)
+    seconds = cols.seconds
+    if seconds is None:
+        seconds = timestamps.to_epoch_seconds(cols.timestamps, errors="coerce")
+    labels = cols.timestamps if len(cols.timestamps) == len(cols) else seconds.tolist()
+    valid = ~np.isnan(seconds)
+    lat, lon, speed = cols.latitude, cols.longitude, cols.speed_kmh
+    if not valid.all():
+        kept = np.flatnonzero(valid)
+        lat, lon, speed, seconds = lat[kept], lon[kept], speed[kept], seconds[kept]
+        labels = [labels[i] for i in kept.tolist()]
+    n = len(seconds)
+    if not n:
+        return []
+
+    clean = movement_engine.MovementColumns(lat, lon, speed, [], seconds)
+    distances = movement_engine.segment_distances(clean)
+    speeds = movement_engine.segment_speeds(clean, distances)
+    dt = np.diff(seconds)
+    gap = (dt > segmenter.gap_s) | (dt < 0)
+
+    # Blocks of points between gaps; the segmenter starts over at each.
+    block_start = np.concatenate(([True], gap))
+    starts = np.flatnonzero(block_start)
+    block_end = np.append(starts[1:] - 1, n - 1)[np.cumsum(block_start) - 1]
+
+    anchors = _dwell_anchors(lat, lon, distances, block_end, segmenter.stop_radius_km)
+    dwell_end = np.append(anchors[1:] - 1, n - 1)
+    is_stop = seconds[dwell_end] - seconds[anchors] >= segmenter.stop_min_s
+    # Trip number of each dwell's entering segment: a new trip after every
+    # block start and every stop.
+    trip_of_dwell = np.cumsum(block_start[anchors]) - 1 + np.cumsum(is_stop) - is_stop
+    trip_count = int(trip_of_dwell[-1] + is_stop[-1]) + 1
+
+    # Segment s ends at point s + 1, inside dwell k (or entering it when s + 1 is its anchor).
+    is_anchor = np.zeros(n, dtype=bool)
+    is_anchor[anchors] = True
+    dwell_of = np.cumsum(is_anchor)[1:] - 1
+    entering = is_anchor[1:]
+    in_trip = ~gap & (entering | ~is_stop[dwell_of])
+    segs = np.flatnonzero(in_trip)
+    trip_of = trip_of_dwell[dwell_of[segs]]
+    first = np.searchsorted(trip_of, np.arange(trip_count), side="left")
+    last = np.searchsorted(trip_of, np.arange(trip_count), side="right")
+    non_empty = last > first
+
+    distance_km = np.bincount(trip_of, weights=distances[segs], minlength=trip_count)
+    max_speed = np.zeros(trip_count)
+    if segs.size:
+        max_speed[non_empty] = np.maximum.reduceat(speeds[segs], first[non_empty])
+    bins = len(SPEED_BIN_EDGES_KMH) + 1
+    histograms = np.bincount(
+        trip_of * bins + np.searchsorted(SPEED_BIN_EDGES_KMH, speeds[segs], side="right"),
+        weights=np.maximum(dt[segs], 0.0), minlength=trip_count * bins,
+    ).reshape(trip_count, bins)
+
+    ended_by_stop = np.full(trip_count, -1)
+    ended_by_stop[trip_of_dwell[is_stop]] = np.flatnonzero(is_stop)
+
+    def span(i: int, j: int) -> _Segment:
+        segment = _Segment(float(lat[i]), float(lon[i]), float(seconds[i]), labels[i])
+        segment.end, segment.end_seconds = labels[j], float(seconds[j])
+        segment.points = j - i + 1
+        return segment
+
+    records = []
+    for t in range(trip_count):
+        if non_empty[t]:
+            trip = span(int(segs[first[t]]), int(segs[last[t] - 1]) + 1)
+            trip.points = int(last[t] - first[t]) + 1
+            trip.distance_km = float(distance_km[t])
+            trip.max_speed_kmh = max(0.0, float(max_speed[t]))
+            trip.speeds = SpeedHistogram.from_list(histograms[t].tolist())
+            split = "stop" if ended_by_stop[t] >= 0 else "end" if t == trip_count - 1 else "gap"
+            records.append(trip.trip(split, segmenter.quantile))
+        k = ended_by_stop[t]
+        if k >= 0:
+            records.append(span(int(anchors[k]), int(dwell_end[k])).stop())
+    return records
+
+
+# _dwell_anchors probes every point's exit this many times at once; dwells
+# still open after that are searched in blocks of _SEARCH_BLOCK points and up.
+_VECTOR_PROBES = 2
+_SEARCH_BLOCK = 32
+# Float slack on path lengths, so skipping by path length stays conservative.
+_PATH_SLACK_KM = 1e-9
+
+
+def _dwell_anchors(
+    latitude: np.ndarray, longitude: np.ndarray, distances: np.ndarray, block_end: np.ndarray, radius_km: float,
+) -> np.ndarray:
+    """
+    The points where TripSegmenter.add() starts a new dwell: the first point
+    of each block, then the first point farther than radius_km from the
+    current anchor.
+
+    A point is at most the path length away from the anchor, so points
+    within radius_km - d of path after a probe at distance d need no
+    check. A few vectorized probes settle the exit of most points (all
+    but slow drifts and long stops); the chain of anchors then follows
+    those exits and searches ahead only from the anchors left open.
+    """
+    n = len(latitude)
+    path = np.concatenate(([0.0], np.cumsum(distances)))
+    exit_of = np.full(n, -1, dtype=np.int64)
+    probe = np.searchsorted(path, path + (radius_km - _PATH_SLACK_KM), side="right")
+    todo = np.arange(n)
+    for _ in range(_VECTOR_PROBES):
+        at = probe[todo]
+        ended = at > block_end[todo]
+        exit_of[todo[ended]] = block_end[todo[ended]] + 1
+        todo, at = todo[~ended], at[~ended]
+        d = movement_engine.haversine_np(latitude[todo], longitude[todo], latitude[at], longitude[at])
+        out = d > radius_km
+        exit_of[todo[out]] = at[out]
+        todo, at, d = todo[~out], at[~out], d[~out]
+        if not todo.size:
+            break
+        probe[todo] = np.maximum(
+            at + 1, np.searchsorted(path, path[at] + (radius_km - d - _PATH_SLACK_KM), side="right")
+        )
+
+    exits, probes, ends = exit_of.tolist(), probe.tolist(), block_end.tolist()
+    if (exit_of < 0).any():
+        # Haversine terms for the block search: a point is out when its term exceeds limit.
+        lat_r, lon_r = np.radians(latitude), np.radians(longitude)
+        cos_lat = np.cos(lat_r)
+        limit = math.sin(radius_km / (2 * movement_engine.EARTH_RADIUS_KM)) ** 2
+    anchors = []
+    a = 0
+    while a < n:
+        anchors.append(a)
+        nxt = exits[a]
+        if nxt < 0:
+            # A long dwell: search ahead in growing blocks.
+            end, size = ends[a], _SEARCH_BLOCK
+            nxt = min(probes[a], end + 1)
+            while nxt <= end:
+                stop = min(end + 1, nxt + size)
+                term = (np.sin((lat_r[nxt:stop] - lat_r[a]) / 2) ** 2
+                        + cos_lat[a] * cos_lat[nxt:stop] * np.sin((lon_r[nxt:stop] - lon_r[a]) / 2) ** 2)
+                out = np.flatnonzero(term > limit)
+                if out.size:
+                    nxt += int(out[0])
+                    break
+                nxt, size = stop, size * 4
+        a = nxt
+    return np.array(anchors, dtype=np.int64)
+
+
+def mode_distances(records: Iterable[dict], totals: Optional[dict] = None) -> dict:
+    """{transportation: km} over the trip records, added to totals when given."""
+    totals = {} if totals is None else totals
+    for record in records:
+        if record["kind"] == "trip":
+            mode = record["transportation"]
+            totals[mode] = totals.get(mode, 0.0) + record["distance_km"]
+    return totals
+
+
+def dominant_mode(records: Iterable[dict]) -> Optional[str]:
+    """The transportation mode covering the most trip distance, or None without trips."""
+    totals = mode_distances(records)
+    return max(totals, key=totals.get) if totals else None
@@ -0,0 +1,94 @@
+import math
+
+import numpy as np
+import pytest
+
+from services import emission_factors
+
+
+@pytest.mark.parametrize("mode, km, kg", [
+    ("walking", 10, 0.0),
+    ("bicycle", 10, 0.0),
+    ("car", 10, 1.2),
+    ("bus", 10, 0.5),
+    ("train", 10, 0.5),
+    ("airplane", 1000, 250.0),
+    ("airplane", 5000, 750.0),  # long haul
+    ("Driving", 10, 1.2),
+    (" plane ", 1000, 250.0),
+    ("metro", 10, 0.5),
+])
+def test_movement_emissions_factor_table(mode, km, kg):
+    emission, classified = emission_factors.movement_emissions([mode], [km])
+
+    assert classified.tolist() == [True]
+    assert emission[0] == pytest.approx(kg)
+
+
+def test_movement_emissions_non_gas_car():
+    emission, _ = emission_factors.movement_emissions(["car", "bus"], [10, 10], drives_gas=False)
+
+    assert emission.tolist() == [0.5, 0.5]
+
+
+@pytest.mark.parametrize("mode, km", [("teleport", 10), (None, 10), ("car", None), ("car", "far"), ("car", -1)])
+def test_movement_emissions_unclassified_is_nan(mode, km):
+    emission, classified = emission_factors.movement_emissions([mode], [km])
+
+    assert classified.tolist() == [False]
+    assert math.isnan(emission[0])
+
+
+def test_distance_by_mode_emissions():
+    totals = {"walking": 3.0, "car": 10.0, "airplane": 5000.0}
+
+    assert emission_factors.distance_by_mode_emissions(totals) == pytest.approx(1251.2)
+    assert emission_factors.distance_by_mode_emissions(totals, drives_gas=False) == pytest.approx(1250.5)
+    assert emission_factors.distance_by_mode_emissions({}) == 0.0
+
+
+def test_distance_by_mode_emissions_unknown_mode():
+    with pytest.raises(ValueError, match="teleport"):
+        emission_factors.distance_by_mode_emissions({"teleport": 1.0})
+
+
+def test_transaction_emissions():
+    emission, classified = emission_factors.transaction_emissions(
+        [20, -15, 10, 10, None], ["Groceries", "dining", ["unknown", "shopping"], "crypto", "bills & utilities"]
+    )
+
+    assert classified.tolist() == [True, True, True, False, False]
+    np.testing.assert_array_equal(emission[:3], [10.0, 0.0, 5.0])  # a refund emits nothing
+    assert np.isnan(emission[3:]).all()
+
+
+def test_calculate_emissions_without_fallback():
+    records = [
+        {"transportation": "car", "distance_km": 10},
+        {"amount": 20, "category": "groceries"},
+        {"transportation": "teleport", "distance_km": 1},
+    ]
+
+    results = emission_factors.calculate_emissions(records)
+
+    assert [r[emission_factors.EMISSION_KEY] for r in results] == [1.2, 10.0, None]
+    assert "assumptions" in results[2]
+    assert emission_factors.EMISSION_KEY not in records[0]  # inputs are copied
+
+
+def test_calculate_emissions_fallback_gets_only_unclassified_records():
+    records = [
+        {"amount": 5, "category": "crypto"},
+        {"transportation": "car", "distance_km": 10},
+        {"transportation": "teleport", "distance_km": 1},
+    ]
+    calls = []
+
+    def fallback(unclassified):
+        calls.append(unclassified)
+        return [{**r, emission_factors.EMISSION_KEY: 9.9} for r in unclassified]
+
+    results = emission_factors.calculate_emissions(records, fallback=fallback)
+
+    assert calls == [[records[0], records[2]]]
+    assert [r[emission_factors.EMISSION_KEY] for r in results] == [9.9, 1.2, 9.9]
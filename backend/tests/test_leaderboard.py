@@ -0,0 +1,160 @@
+import pytest
+
+from database import user_crud
+from services import leaderboard
+
+
+class FetchedPage(list):
+    """A page as iter_user_pages hands it over; on_read runs when its users are first iterated."""
+
+    def __init__(self, users, on_read=None):
+        super().__init__(users)
+        self.on_read = on_read
+
+    def __iter__(self):
+        on_read, self.on_read = self.on_read, None
+        if on_read:
+            on_read()
+        return super().__iter__()
+
+
+class FakeUsers:
+    """Users collection read page by page the way user_crud.iter_user_pages does."""
+
+    def __init__(self, users):
+        self.users = {user_id: dict(data) for user_id, data in users.items()}
+        self.before_page = {}  # page number -> callback run before it is fetched
+        self.after_fetch = {}  # page number -> callback run once it is fetched, before its users are read
+        self.board = None
+
+    def iter_user_pages(self, fields=None, start_after=None, page_size=user_crud.BATCH_MAX_WRITES):
+        ids = sorted(self.users)
+        for number, start in enumerate(range(0, len(ids), page_size)):
+            if number in self.before_page:
+                self.before_page[number]()
+            page = [(user_id, dict(self.users[user_id])) for user_id in ids[start:start + page_size]]
+            yield FetchedPage(page, self.after_fetch.get(number))
+
+    def iter_users(self, **kwargs):
+        for page in self.iter_user_pages(**kwargs):
+            yield from page
+
+    def write(self, user_id, op, data):
+        """Apply a write to the store and notify the board, like user_crud does."""
+        if op == "increment":
+            for field, amount in data.items():
+                self.users[user_id][field] = self.users[user_id].get(field, 0.0) + amount
+        elif op == "update":
+            self.users[user_id].update(data)
+        elif op == "create":
+            self.users[user_id] = dict(data)
+        elif op == "delete":
+            del self.users[user_id]
+        self.board.apply_write(user_id, op, data)
+
+
+def user(emission, country="US"):
+    return {"name": f"n{emission}", "country": country, "transportation": "car", "pfp": None,
+            "carbonEmission": emission}
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeUsers({f"u{i}": user(float(i), "US" if i % 2 else "CA") for i in range(6)})
+    store.board = leaderboard.Leaderboard()
+    monkeypatch.setattr(user_crud, "iter_user_pages", store.iter_user_pages)
+    monkeypatch.setattr(user_crud, "iter_users", store.iter_users)
+    return store
+
+
+def emissions(board):
+    return {entry["user_id"]: entry["carbonEmission"] for entry in board.top(len(board))}
+
+
+def test_top_and_rank(store):
+    board = store.board
+    board.load(store.users.items())
+
+    assert [e["user_id"] for e in board.top(3)] == ["u0", "u1", "u2"]
+    assert [e["user_id"] for e in board.top(10, country="US")] == ["u1", "u3", "u5"]
+    assert board.top(10, country="FR") == []
+    assert board.rank("u3") == {**board.top(10)[3], "total": 6}
+    assert board.rank("u3", country="US")["rank"] == 2
+    assert board.rank("u3", country="CA") is None
+    assert board.rank("nobody") is None
+    assert board.countries() == {"US": 3, "CA": 3}
+
+
+def test_ties_share_a_rank(store):
+    board = store.board
+    board.load([("a", user(1.0)), ("b", user(2.0)), ("c", user(2.0)), ("d", user(3.0))])
+
+    assert [e["rank"] for e in board.top(4)] == [1, 2, 2, 4]
+    assert board.rank("c")["rank"] == 2
+
+
+def test_writes_move_users(store):
+    board = store.board
+    board.load(store.users.items())
+
+    store.write("u5", "increment", {"carbonEmission": -10.0})
+    store.write("u0", "update", {"carbonEmission": 9.0, "country": "US"})
+    store.write("u6", "create", user(2.5))
+    store.write("u1", "delete", None)
+    store.write("u2", "update", {"name": "renamed"})
+
+    assert emissions(board) == {user_id: data["carbonEmission"] for user_id, data in store.users.items()}
+    assert board.top(1)[0]["user_id"] == "u5"
+    assert board.rank("u2")["name"] == "renamed"
+    assert board.countries() == {"US": 4, "CA": 2}
+
+
+def test_rebuild_replays_writes_made_while_reading(store, monkeypatch):
+    board = store.board
+    board.rebuild()
+    monkeypatch.setattr(board, "_read_users", lambda: leaderboard.Leaderboard._read_users(board, page_size=2))
+
+    def concurrent_writes():
+        store.write("u1", "increment", {"carbonEmission": 10.0})  # already read: replayed
+        store.write("u5", "increment", {"carbonEmission": 10.0})  # not read yet: read with it
+        store.write("u4", "update", {"carbonEmission": 0.5})
+        store.write("u0", "delete", None)
+
+    store.before_page[1] = concurrent_writes
+    board.rebuild()
+
+    assert emissions(board) == {user_id: data["carbonEmission"] for user_id, data in store.users.items()}
+    assert board._pending is None and board._loaded_through is None
+
+
+def test_rebuild_replays_writes_made_between_fetch_and_load(store, monkeypatch):
+    board = store.board
+    board.rebuild()
+    monkeypatch.setattr(board, "_read_users", lambda: leaderboard.Leaderboard._read_users(board, page_size=2))
+
+    def writes_after_fetch():
+        # Page 1 (u2, u3) is already read, so these are missing from it.
+        store.write("u3", "increment", {"carbonEmission": 10.0})
+        store.write("u2", "update", {"carbonEmission": 0.25})
+
+    store.after_fetch[1] = writes_after_fetch
+    board.rebuild()
+
+    assert emissions(board) == {user_id: data["carbonEmission"] for user_id, data in store.users.items()}
+    assert emissions(board)["u3"] == 13.0
+
+
+def test_rebuild_failure_keeps_the_previous_index(store, monkeypatch):
+    board = store.board
+    board.rebuild()
+
+    def broken(**kwargs):
+        yield [("u0", store.users["u0"])]
+        raise RuntimeError("firestore unavailable")
+
+    monkeypatch.setattr(user_crud, "iter_user_pages", broken)
+    with pytest.raises(RuntimeError):
+        board.rebuild()
+
+    assert len(board) == 6
+    assert board._pending is None
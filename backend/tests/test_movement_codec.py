@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from database import movement_codec
+
+
+def make_points(n, start_ms=1_759_000_000_000, step_ms=1000, lon0=-80.37):
+    rng = np.random.default_rng(0)
+    return [
+        {
+            "latitude": 25.75 + i * 1e-4,
+            "longitude": lon0 + i * 1e-4,
+            "speed_mps": float(rng.uniform(0, 30)),
+            "timestamp": movement_codec.format_timestamp(start_ms + i * step_ms, True),
+        }
+        for i in range(n)
+    ]
+
+
+def assert_same(a, b):
+    assert a.utc == b.utc
+    for column in ("t_ms", "lat_e7", "lon_e7", "speed_cms"):
+        np.testing.assert_array_equal(getattr(a, column), getattr(b, column))
+
+
+@pytest.mark.parametrize("compression", ["zlib", None])
+def test_encode_decode_round_trip(compression):
+    chunk = movement_codec.quantize(make_points(500))
+    doc = movement_codec.encode_chunk(chunk, 1_759_000_000_000, compression=compression)
+
+    assert doc["count"] == 500
+    assert doc["delta_dtype"] == "<i4"
+    assert_same(movement_codec.decode_chunk(doc), chunk)
+
+
+def test_round_trip_with_wide_deltas():
+    points = make_points(3)
+    points[1]["longitude"], points[2]["longitude"] = 179.9999999, -179.9999999
+    points[0]["longitude"] = -179.9999999
+    chunk = movement_codec.quantize(points)
+    doc = movement_codec.encode_chunk(chunk, 0)
+
+    assert doc["delta_dtype"] == "<i8"
+    assert_same(movement_codec.decode_chunk(doc), chunk)
+
+
+def test_single_point_round_trip():
+    chunk = movement_codec.quantize(make_points(1))
+    assert_same(movement_codec.decode_chunk(movement_codec.encode_chunk(chunk, 0)), chunk)
+
+
+def test_quantization_error_is_bounded():
+    points = make_points(50)
+    chunk = movement_codec.decode_chunk(movement_codec.encode_chunk(movement_codec.quantize(points), 0))
+    decoded = movement_codec.to_points(chunk)
+
+    for original, point in zip(points, decoded):
+        assert abs(point["latitude"] - original["latitude"]) <= 0.5 / movement_codec.COORD_SCALE + 1e-12
+        assert abs(point["longitude"] - original["longitude"]) <= 0.5 / movement_codec.COORD_SCALE + 1e-12
+        assert abs(point["speed_mps"] - original["speed_mps"]) <= 0.5 / movement_codec.SPEED_SCALE + 1e-12
+        assert point["timestamp"] == original["timestamp"]
+
+
+def test_merge_sorts_and_keeps_last_point_per_millisecond():
+    first = movement_codec.quantize(make_points(10))
+    resent = make_points(10)[5:]
+    for point in resent:
+        point["speed_mps"] = 1.0
+    merged = movement_codec.merge(first, movement_codec.quantize(resent[::-1]))
+
+    assert len(merged) == 10
+    assert np.all(np.diff(merged.t_ms) > 0)
+    np.testing.assert_array_equal(merged.speed_cms[5:], 100)
+
+
+def test_split_windows_aligns_to_window_start():
+    hour_ms = movement_codec.MOVEMENT_CHUNK_SECONDS * 1000
+    chunk = movement_codec.quantize(make_points(4, start_ms=10 * hour_ms - 2000))
+    windows = movement_codec.split_windows(chunk)
+
+    assert sorted(windows) == [9 * hour_ms, 10 * hour_ms]
+    assert [len(c) for _, c in sorted(windows.items())] == [2, 2]
+
+
+def test_encode_rejects_oversized_chunk(monkeypatch):
+    monkeypatch.setattr(movement_codec, "MOVEMENT_CHUNK_MAX_POINTS", 5)
+    with pytest.raises(ValueError):
+        movement_codec.encode_chunk(movement_codec.quantize(make_points(6)), 0)
+
+
+def test_decode_rejects_unknown_format():
+    doc = movement_codec.encode_chunk(movement_codec.quantize(make_points(2)), 0)
+    with pytest.raises(ValueError):
+        movement_codec.decode_chunk({**doc, "format": 99})
+
+
+@pytest.mark.parametrize("timestamp, offset, expected", [
+    ("2025-09-28T02:41:42.123Z", None, (1_759_027_302_123, True)),
+    ("2025-09-27T22:41:42.123-04:00", None, (1_759_027_302_123, True)),
+    ("2025-09-27T22:41:42.123", -240, (1_759_027_302_123, True)),
+    ("2025-09-28T02:41:42.123", None, (1_759_027_302_123, False)),
+    # An explicit offset wins over the batch's.
+    ("2025-09-28T02:41:42.123Z", 120, (1_759_027_302_123, True)),
+])
+def test_timestamp_ms(timestamp, offset, expected):
+    assert movement_codec.timestamp_ms(timestamp, offset) == expected
+
+
+def test_format_timestamp_inverts_timestamp_ms():
+    for utc in (True, False):
+        text = movement_codec.format_timestamp(1_759_027_302_123, utc)
+        assert movement_codec.timestamp_ms(text) == (1_759_027_302_123, utc)
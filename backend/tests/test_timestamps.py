@@ -0,0 +1,99 @@
+import math
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from services import timestamps
+
+LEGACY = "September 27, 2025 at 10:41:42 PM UTC-4"
+EXPECTED = datetime(2025, 9, 28, 2, 41, 42, tzinfo=timezone.utc).timestamp()
+
+
+@pytest.mark.parametrize("value, expected", [
+    (LEGACY, EXPECTED),
+    ("September 27, 2025 at 10:41:42 PM UTC+5:30",
+     datetime(2025, 9, 27, 17, 11, 42, tzinfo=timezone.utc).timestamp()),
+    ("September 27, 2025 at 10:41:42 PM UTC",
+     datetime(2025, 9, 27, 22, 41, 42, tzinfo=timezone.utc).timestamp()),
+    ("September 27, 2025 at 12:05:00 AM UTC",
+     datetime(2025, 9, 27, 0, 5, tzinfo=timezone.utc).timestamp()),
+    ("2025-09-27T22:41:42-04:00", EXPECTED),
+    ("2025-09-28T02:41:42Z", EXPECTED),
+    ("2025-09-28T02:41:42", EXPECTED),
+    (datetime(2025, 9, 28, 2, 41, 42), EXPECTED),
+    (datetime(2025, 9, 27, 22, 41, 42, tzinfo=timezone(timedelta(hours=-4))), EXPECTED),
+    (SimpleNamespace(seconds=int(EXPECTED), nanos=500_000_000), EXPECTED + 0.5),
+])
+def test_to_seconds(value, expected):
+    assert timestamps.to_seconds(value) == expected
+
+
+@pytest.mark.parametrize("value", [
+    "",
+    "garbage",
+    "2025-13-01",
+    "September 27, 2025 at 10:41:42 PM EST",
+    "September 27, 2025 at 13:41:42 PM UTC-4",
+    "September 27, 2025 at 10:41:42 PM UTC-25",
+])
+def test_to_seconds_rejects_bad_text(value):
+    with pytest.raises(ValueError):
+        timestamps.to_seconds(value)
+    with pytest.raises(ValueError):
+        timestamps.to_epoch_seconds([value])
+
+
+def test_to_seconds_rejects_other_types():
+    with pytest.raises(TypeError):
+        timestamps.to_seconds(None)
+
+
+BASE = [f"2025-09-27T22:41:{i % 60:02d}.{i:06d}" for i in range(200)]
+LEGACY_COLUMN = [
+    (datetime(2025, 9, 27, 20) + timedelta(minutes=7 * i)).strftime("%B %d, %Y at %I:%M:%S %p UTC")
+    + ("-4" if i < 100 else "+5:30") for i in range(200)
+]
+
+
+@pytest.mark.parametrize("column", [
+    BASE,
+    [v + "Z" for v in BASE],
+    [v + "-04:00" for v in BASE],
+    [v + "+05:30" for v in BASE],
+    BASE[:5] + ["2025-09-27T22:41:42-04:00"],
+    [LEGACY] * 3 + BASE[:3],
+    [datetime(2025, 1, 1)] + BASE[:3],
+    LEGACY_COLUMN,
+    [v.replace(" at 0", " at ") for v in LEGACY_COLUMN],
+    LEGACY_COLUMN[:5] + ["September 27, 2025 at 10:41:42 PM UTC-04:00", "September 7, 2025 at 1:41:42 PM UTC"],
+], ids=["naive", "utc", "negative-offset", "positive-offset", "mixed-offsets", "mixed-formats", "mixed-types",
+        "legacy", "legacy-short-hours", "legacy-irregular"])
+def test_to_epoch_seconds_matches_to_seconds(column):
+    expected = np.array([timestamps.to_seconds(v) for v in column])
+
+    np.testing.assert_allclose(timestamps.to_epoch_seconds(column), expected, rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("bad", [
+    "September 27, 2025 at 13:41:42 PM UTC-4",
+    "September 27, 2025 at 10:41:42 XM UTC-4",
+    "September 31, 2025 at 10:41:42 PM UTC-4",
+    "September 27, 2025 at 10:41:42 PM UTC-25",
+    "September 27, 2025 by 10:41:42 PM UTC-4",
+])
+def test_to_epoch_seconds_legacy_column_rejects_bad_values(bad):
+    with pytest.raises(ValueError):
+        timestamps.to_epoch_seconds(LEGACY_COLUMN[:10] + [bad])
+
+
+def test_to_epoch_seconds_empty():
+    assert len(timestamps.to_epoch_seconds([])) == 0
+
+
+def test_to_epoch_seconds_coerce():
+    seconds = timestamps.to_epoch_seconds([LEGACY, "garbage", None], errors="coerce")
+
+    assert seconds[0] == EXPECTED
+    assert math.isnan(seconds[1]) and math.isnan(seconds[2])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from services import movement_engine, trajectory
+
+
+def random_trace(rng, n, stationary=False):
+    lat = 25 + np.cumsum(rng.normal(0, 1e-4, n))
+    lon = -80 + np.cumsum(rng.normal(0, 1e-4, n))
+    seconds = np.cumsum(rng.integers(0, 60, n)).astype(float)
+    speed = np.where(rng.random(n) < 0.5, 0.0, rng.random(n) * 100)
+    if stationary:
+        speed[:] = 0
+    return movement_engine.MovementColumns(lat, lon, speed, [], seconds)
+
+
+def select(cols, keep):
+    return movement_engine.MovementColumns(
+        cols.latitude[keep], cols.longitude[keep], cols.speed_kmh[keep], [], cols.seconds[keep]
+    )
+
+
+@pytest.mark.parametrize("tolerance_m", [1, 5, 50, 500])
+@pytest.mark.parametrize("seed", range(20))
+def test_simplify_keeps_summary_and_distance_bound(seed, tolerance_m):
+    rng = np.random.default_rng(seed)
+    cols = random_trace(rng, int(rng.integers(3, 400)), stationary=seed % 3 == 0)
+
+    result = trajectory.simplify(cols, tolerance_m)
+
+    assert result.keep[0] and result.keep[-1]
+    before = movement_engine.summarize(cols)
+    after = movement_engine.summarize(select(cols, result.keep))
+    assert after["max_speed_kmh"] == pytest.approx(before["max_speed_kmh"])
+    assert after["transportation"] == before["transportation"]
+    assert result.simplified_km <= result.distance_km + 1e-9
+    assert result.distance_km - result.simplified_km <= result.max_error_km + 1e-9
+    assert result.max_error_km == pytest.approx(tolerance_m / 1000 * (result.kept - 1))
+
+
+def test_simplify_drops_points_on_a_straight_walk():
+    n = 600
+    cols = movement_engine.MovementColumns(
+        np.full(n, 25.0), -80 + np.arange(n) * 1e-5, np.full(n, 4.0), [], np.arange(n, dtype=float)
+    )
+
+    result = trajectory.simplify(cols, 5, max_gap_s=120)
+
+    assert result.kept < n / 10
+    # A fix at least every max_gap_s.
+    assert np.diff(cols.seconds[result.keep]).max() <= 120
+
+
+@pytest.mark.parametrize("tolerance_m", [0, -1])
+def test_simplify_non_positive_tolerance_keeps_everything(tolerance_m):
+    cols = random_trace(np.random.default_rng(0), 50)
+
+    result = trajectory.simplify(cols, tolerance_m)
+
+    assert result.keep.all()
+    assert result.max_error_km == 0
+    assert result.simplified_km == result.distance_km
+
+
+@pytest.mark.parametrize("n", [0, 1, 2])
+def test_simplify_short_traces(n):
+    cols = random_trace(np.random.default_rng(0), n)
+
+    result = trajectory.simplify(cols, 5)
+
+    assert result.kept == n
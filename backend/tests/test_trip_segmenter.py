@@ -0,0 +1,188 @@
+import json
+import math
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+import pytest
+
+from services import movement_engine, trip_segmenter
+
+START = datetime(2025, 9, 27, 6, 0, tzinfo=timezone.utc)
+
+
+def make_day(legs, glitch_kmh=None):
+    """Points at 1 Hz heading east; legs are (minutes, km/h) and km/h None is a gap."""
+    lat, lon, t = 25.75, -80.37, START
+    moving = 0
+    points = []
+    for minutes, speed in legs:
+        for _ in range(minutes * 60):
+            t += timedelta(seconds=1)
+            if speed is None:
+                continue
+            lon += speed / 3600 / (111.32 * math.cos(math.radians(lat)))
+            moving += speed > 0
+            # One bad fix five minutes into the first movement.
+            reported = glitch_kmh if glitch_kmh and moving == 300 else speed
+            points.append({"latitude": lat, "longitude": lon, "speed_kmh": reported, "timestamp": t.isoformat()})
+    return points
+
+
+def kinds(records):
+    return [(r["kind"], r.get("transportation")) for r in records]
+
+
+def to_columns(points):
+    return movement_engine.MovementColumns(
+        np.array([p["latitude"] for p in points]),
+        np.array([p["longitude"] for p in points]),
+        np.array([p["speed_kmh"] for p in points], dtype=float),
+        [p["timestamp"] for p in points],
+    )
+
+
+def test_stops_and_trips():
+    points = make_day([(10, 0), (15, 5), (10, 0), (20, 50), (10, 0)])
+
+    records = list(trip_segmenter.segment_trips(points))
+
+    assert kinds(records) == [
+        ("stop", None), ("trip", "walking"), ("stop", None), ("trip", "car"), ("stop", None),
+    ]
+    walk, drive = records[1], records[3]
+    # Movement within the stop radius of either stop belongs to the stop.
+    radius_km = trip_segmenter.TRIP_STOP_RADIUS_M / 1000
+    assert 1.25 - 2 * radius_km <= walk["distance_km"] <= 1.25
+    assert 16.67 - 2 * radius_km <= drive["distance_km"] <= 16.67
+    assert drive["split"] == "stop"
+
+
+def test_a_speed_spike_does_not_change_the_mode():
+    points = make_day([(10, 0), (20, 5), (10, 0)], glitch_kmh=1500)
+
+    records = list(trip_segmenter.segment_trips(points))
+
+    trip = next(r for r in records if r["kind"] == "trip")
+    assert trip["transportation"] == "walking"
+    assert trip["max_speed_kmh"] == 1500
+    assert movement_engine.summarize(points)["transportation"] == "airplane"
+
+
+def test_a_gap_splits_the_trip():
+    points = make_day([(10, 5), (20, None), (10, 5)])
+
+    records = list(trip_segmenter.segment_trips(points))
+
+    assert kinds(records) == [("trip", "walking"), ("trip", "walking")]
+    assert [r["split"] for r in records] == ["gap", "end"]
+
+
+def test_unreadable_points_are_skipped():
+    points = make_day([(10, 0), (15, 5), (10, 0)])
+    bad = [{"latitude": 1.0}, {"latitude": "x", "longitude": 2.0, "timestamp": points[0]["timestamp"]},
+           {"latitude": 1.0, "longitude": 2.0, "timestamp": "garbage"}]
+    segmenter = trip_segmenter.TripSegmenter()
+
+    records = []
+    for point in points[:100] + bad + points[100:]:
+        records += segmenter.push(point)
+    records += segmenter.flush()
+
+    assert segmenter.skipped == len(bad)
+    assert records == list(trip_segmenter.segment_trips(points))
+
+
+@pytest.mark.parametrize("split_at", [1, 500, 1000, 1800, 2399])
+def test_resume_from_dict_matches_one_pass(split_at):
+    points = make_day([(10, 0), (15, 5), (5, 0), (10, 30), (10, 0)])
+    first = trip_segmenter.TripSegmenter()
+
+    records = []
+    for point in points[:split_at]:
+        records += first.push(point)
+    state = json.loads(json.dumps(first.to_dict()))
+    resumed = trip_segmenter.TripSegmenter.from_dict(state)
+    for point in points[split_at:]:
+        records += resumed.push(point)
+    records += resumed.flush()
+
+    assert records == list(trip_segmenter.segment_trips(points))
+
+
+def test_pending_does_not_close_the_segment():
+    points = make_day([(10, 0), (15, 5), (10, 0)])
+    segmenter = trip_segmenter.TripSegmenter()
+    for point in points[:1200]:
+        segmenter.push(point)
+
+    pending = segmenter.pending()
+
+    assert pending == segmenter.pending()
+    assert segmenter.flush() == pending
+
+
+def test_segment_columns_matches_segment_trips():
+    points = make_day([(10, 0), (15, 5), (10, 0), (20, 50), (10, 0)])
+    points.insert(700, {"latitude": 25.75, "longitude": -80.37, "speed_kmh": 0, "timestamp": "garbage"})
+
+    records = trip_segmenter.segment_columns(to_columns(points))
+
+    assert records == list(trip_segmenter.segment_trips(points))
+
+
+def random_trace(rng, n):
+    """Stops with jitter, walks, drives and flights, with gaps, clock jumps and unreadable times."""
+    lat, lon, seconds, step_km = [25.0], [-80.0], [0.0], 0.0
+    for _ in range(n - 1):
+        if rng.random() < 0.01:
+            step_km = rng.choice([0.0, 0.0014, 0.014, 0.3])
+        lat.append(lat[-1] + step_km / 111.32 * rng.normal() + rng.normal(0, 1e-5))
+        lon.append(lon[-1] + step_km / 111.32 * rng.normal() + rng.normal(0, 1e-5))
+        jump = rng.integers(700, 2000) if rng.random() < 0.003 else -5 if rng.random() < 0.001 else 0
+        seconds.append(seconds[-1] + rng.integers(0, 5) + jump)
+    seconds = np.array(seconds, dtype=float)
+    seconds[rng.random(n) < 0.01] = np.nan
+    speed = np.where(rng.random(n) < 0.5, 0.0, rng.random(n) * 80)
+    return movement_engine.MovementColumns(np.array(lat), np.array(lon), speed, [], seconds)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("options", [
+    {},
+    {"stop_radius_m": 20, "stop_min_s": 60, "gap_s": 30},
+    {"stop_radius_m": 200, "stop_min_s": 0},
+])
+def test_segment_columns_matches_the_streaming_segmenter(seed, options):
+    cols = random_trace(np.random.default_rng(seed), 3000)
+    segmenter = trip_segmenter.TripSegmenter(**options)
+    expected = []
+    for lat, lon, speed, t in zip(cols.latitude, cols.longitude, cols.speed_kmh, cols.seconds):
+        if not math.isnan(t):
+            expected += segmenter.add(lat, lon, speed, t, t)
+    expected += segmenter.flush()
+
+    records = trip_segmenter.segment_columns(cols, **options)
+
+    # Equal up to float summation order (values are rounded to 2-3 decimals).
+    assert [sorted(r.items()) for r in records] == [
+        sorted((k, pytest.approx(v, abs=0.011) if isinstance(v, float) else v) for k, v in r.items())
+        for r in expected
+    ]
+
+
+def test_segment_columns_edge_cases():
+    one = movement_engine.MovementColumns(np.array([25.0]), np.array([-80.0]), np.zeros(1), ["2025-09-27T06:00:00Z"])
+    empty = movement_engine.MovementColumns(np.array([]), np.array([]), np.array([]), [])
+
+    assert trip_segmenter.segment_columns(one) == []
+    assert trip_segmenter.segment_columns(empty) == []
+
+
+def test_mode_distances_and_dominant_mode():
+    records = list(trip_segmenter.segment_trips(make_day([(10, 0), (15, 5), (10, 0), (20, 50), (10, 0)])))
+
+    totals = trip_segmenter.mode_distances(records)
+
+    assert set(totals) == {"walking", "car"}
+    assert trip_segmenter.dominant_mode(records) == "car"
+    assert trip_segmenter.dominant_mode([]) is None
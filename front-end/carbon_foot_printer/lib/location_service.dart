@@ -62,7 +62,10 @@ void startTracking(String uid) async {
       'speed_kmh': speed * 3.6,
       'latitude': latitude,
       'longitude': longitude,
-      'timestamp': timestamp.toIso8601String(),
+      // UTC ("...Z"), so the time is unambiguous wherever it is read.
+      'timestamp': timestamp.toUtc().toIso8601String(),
+      // Numeric copy the backend orders and filters movements by.
+      't_ms': timestamp.millisecondsSinceEpoch,
     };
 
     // Print every update